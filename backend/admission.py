@@ -0,0 +1,213 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Dict, Any
+from .config import load_environment
+from .metrics import RAG_ADMISSION
+
+# Load environment variables
+load_environment()
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 if one was available, else the seconds until there is one"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+class ClientRateLimiter:
+    """
+    A token bucket per client key (the client address) of `rate` requests
+    per second with bursts of `burst`, for at most `max_clients` recently
+    seen clients. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: float = 10.0, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def retry_after(self, key: str) -> float:
+        """Take one of the client's tokens; returns 0, or the seconds until it has one"""
+        if not self.rate:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        wait = bucket.take()
+        if wait:
+            self.limited += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clients": len(self._buckets), "limited": self.limited}
+
+class Admission:
+    """
+    The admission decision for one chat request: "full" (the complete RAG
+    pipeline, holding a concurrency slot until released), "degraded" (a
+    retrieval-only answer) or "rejected" (503 with Retry-After).
+    """
+
+    def __init__(self, controller: "AdmissionController", mode: str, reason: str, retry_after: float = 0.0):
+        self.controller = controller
+        self.mode = mode
+        self.reason = reason
+        self.retry_after = retry_after
+        self.started = time.monotonic()
+        self._released = False
+        RAG_ADMISSION.inc(mode, reason)
+
+    def release(self):
+        """Give back the request's slot (idempotent)"""
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self)
+
+class AdmissionController:
+    """
+    Admission control for chat requests on the event loop.
+
+    - Each client (keyed by its address, never by a field of the request
+      body) may have a token bucket of `user_rate` requests per second with
+      bursts of `user_burst`; requests beyond it are degraded.
+    - At most `max_concurrent` requests run the full pipeline. Others wait
+      in a FIFO queue of at most `max_queue`, for up to `queue_timeout`
+      seconds. A request that the queue is full for, or that would not
+      start within its deadline (judged from the queue position and the
+      recent service time), is shed at once rather than after waiting.
+    - Shed requests, requests beyond the client's or the global `rate`,
+      and all requests while `unavailable` (an upstream circuit breaker is open) get a
+      degraded, retrieval-only answer instead, at most `max_degraded` at a
+      time; beyond that they are rejected with 503.
+
+    Zero disables a limit.
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 5.0,
+                 max_degraded: int = 128, rate: float = 0.0, burst: float = 0.0, user_rate: float = 0.0,
+                 user_burst: float = 10.0, max_users: int = 10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_degraded = max_degraded
+        self.global_bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.client_limiter = ClientRateLimiter(user_rate, user_burst, max_users)
+        self._waiters: deque = deque()
+        self.in_flight = 0
+        self.degraded_in_flight = 0
+        # Moving average of how long a full request holds its slot
+        self.service_seconds = 0.0
+
+    def _expected_wait(self, position: int) -> float:
+        """Rough wait for the `position`-th queued request, from the recent service time"""
+        return position * self.service_seconds / max(1, self.max_concurrent)
+
+    async def admit(self, key: str, unavailable: bool = False) -> Admission:
+        """Decide how to serve a request; the caller must release() the result when done"""
+        if unavailable:
+            return self._degrade("breaker_open")
+        if self.client_limiter.retry_after(key):
+            return self._degrade("user_rate")
+        if self.global_bucket is not None and self.global_bucket.take():
+            return self._degrade("global_rate")
+        if not self.max_concurrent or (self.in_flight < self.max_concurrent and not self._waiters):
+            self.in_flight += 1
+            return Admission(self, "full", "admitted")
+        if len(self._waiters) >= self.max_queue:
+            return self._degrade("queue_full")
+        if self._expected_wait(len(self._waiters) + 1) > self.queue_timeout:
+            return self._degrade("deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            return Admission(self, "full", "queued")
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the deadline passed
+            if waiter.done() and not waiter.cancelled():
+                return Admission(self, "full", "queued")
+            return self._degrade("deadline")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _degrade(self, reason: str) -> Admission:
+        if self.max_degraded and self.degraded_in_flight >= self.max_degraded:
+            return Admission(self, "rejected", "overloaded", max(1.0, self.service_seconds))
+        self.degraded_in_flight += 1
+        return Admission(self, "degraded", reason)
+
+    def _release(self, admission: Admission):
+        if admission.mode == "degraded":
+            self.degraded_in_flight -= 1
+        elif admission.mode == "full":
+            held = time.monotonic() - admission.started
+            self.service_seconds = held if not self.service_seconds else 0.8 * self.service_seconds + 0.2 * held
+            self._hand_over()
+
+    def _hand_over(self):
+        """Pass a finished request's slot to the first live waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "degraded_in_flight": self.degraded_in_flight,
+            "service_seconds": round(self.service_seconds, 4),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+def create_admission_controller() -> AdmissionController:
+    """Build the chat admission controller from CHAT_* environment settings"""
+    return AdmissionController(
+        max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+        max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+        queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "5")),
+        max_degraded=int(os.getenv("CHAT_MAX_DEGRADED", "128")),
+        rate=float(os.getenv("CHAT_RATE_LIMIT_QPS", "0")),
+        burst=float(os.getenv("CHAT_RATE_LIMIT_BURST", "0")),
+        user_rate=float(os.getenv("CHAT_USER_RATE_LIMIT_PER_MINUTE", "0")) / 60.0,
+        user_burst=float(os.getenv("CHAT_USER_RATE_LIMIT_BURST", "10"))
+    )
+
+def create_transform_rate_limiter() -> ClientRateLimiter:
+    """
+    Per-client-address limit on /translate and /personalize from
+    TRANSFORM_RATE_LIMIT_PER_MINUTE / TRANSFORM_RATE_LIMIT_BURST
+    """
+    return ClientRateLimiter(
+        rate=float(os.getenv("TRANSFORM_RATE_LIMIT_PER_MINUTE", "60")) / 60.0,
+        burst=float(os.getenv("TRANSFORM_RATE_LIMIT_BURST", "20"))
+    )
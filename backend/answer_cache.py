@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+class SemanticAnswerCache:
+    """
+    Cache of complete RAG answers keyed by query embedding.
+
+    A lookup hits when a cached query with the same selected text lies within
+    `threshold` cosine similarity of the new query. Answers retrieved within
+    a page scope only serve lookups from that page; unscoped answers serve
+    every page. Entries expire after
+    `ttl_seconds`, the least recently used entry is evicted past
+    `max_entries`, and everything is dropped when the ingestion manifest at
+    `stamp_path` changes (checked at most every `stamp_check_seconds`).
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 24 * 3600, max_entries: int = 1024,
+                 stamp_path: Optional[str] = None, stamp_check_seconds: float = 5.0):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stamp_path = stamp_path
+        self.stamp_check_seconds = stamp_check_seconds
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self._stamp = self._read_stamp()
+        self._stamp_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _read_stamp(self) -> Optional[float]:
+        if not self.stamp_path:
+            return None
+        try:
+            return os.path.getmtime(self.stamp_path)
+        except OSError:
+            return None
+
+    def _check_stamp(self):
+        """Drop all entries if ingestion has rewritten the manifest since the last check"""
+        now = time.monotonic()
+        if not self.stamp_path or now - self._stamp_checked_at < self.stamp_check_seconds:
+            return
+        self._stamp_checked_at = now
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer (e.g. after the collection changed)"""
+        with self._lock:
+            self._clear()
+
+    def lookup(self, query_embedding: List[float], selected_text: Optional[str] = None,
+               scope: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached result for the most similar matching query, if any"""
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector /= norm
+
+        with self._lock:
+            self._check_stamp()
+            now = time.time()
+            expired = [entry_id for entry_id, entry in self._entries.items() if entry["expires_at"] <= now]
+            for entry_id in expired:
+                del self._entries[entry_id]
+            if expired:
+                self._matrix = None
+
+            if self._entries and self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[entry_id]["vector"] for entry_id in self._matrix_ids])
+
+            if self._entries:
+                scores = self._matrix @ vector
+                for index in np.argsort(-scores):
+                    if scores[index] < self.threshold:
+                        break
+                    entry_id = self._matrix_ids[index]
+                    entry = self._entries[entry_id]
+                    if entry["selected_text"] == (selected_text or None) and entry["scope"] in (None, scope):
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return dict(entry["result"])
+
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding: List[float], selected_text: Optional[str], result: Dict[str, Any],
+              scope: Optional[Dict[str, Any]] = None):
+        """Cache a result for the query embedding, answered within the `scope` payload filter if given"""
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        with self._lock:
+            self._check_stamp()
+            self._entries[self._next_id] = {
+                "vector": vector / norm,
+                "selected_text": selected_text or None,
+                "scope": scope,
+                "result": dict(result),
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+def create_answer_cache(stamp_path: Optional[str] = None) -> Optional[SemanticAnswerCache]:
+    """Build the answer cache from environment settings (ANSWER_CACHE_ENABLED=false disables it)"""
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    return SemanticAnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600))),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+        stamp_path=stamp_path
+    )
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+/chat under overload with and without admission control, against the fake
+OpenAI and Qdrant servers.
+
+The fake OpenAI server answers at most --openai-max-in-flight calls at a
+time and rate limits the rest (429 with Retry-After), like an API quota.
+Requests arrive open-loop at --rate per second for --seconds, well above
+what that quota sustains, all from one client address as behind a single
+proxy. The first run has no admission control and no circuit breakers;
+the second admits at most
+--max-concurrency full requests with a queue of --max-queue and
+--queue-timeout seconds, and answers the rest retrieval-only:
+
+    python -m backend.benchmarks.bench_admission --rate 60 --seconds 10 --openai-max-in-flight 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from .fake_openai import start_fake_openai
+from .fake_qdrant import start_fake_qdrant
+from .load_chat import free_port
+
+def percentile(values, fraction: float) -> float:
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+async def offered_load(base_url: str, rate: float, seconds: float, tag: str):
+    import httpx
+
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0,
+                                 limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)) as client:
+        async def one(i: int):
+            body = {"message": f"How do humanoid robots keep their balance? ({tag} {i})"}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/chat", json=body)
+                kind = ("degraded" if response.json().get("degraded") else "full") \
+                    if response.status_code == 200 else str(response.status_code)
+            except httpx.HTTPError:
+                kind = "failed"
+            results.append((kind, (time.perf_counter() - started) * 1000))
+
+        tasks = []
+        started = time.perf_counter()
+        for i in range(int(rate * seconds)):
+            # Open loop: arrivals keep their schedule however slow the server gets
+            await asyncio.sleep(max(0.0, started + i / rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(i)))
+        await asyncio.gather(*tasks)
+    return results
+
+def report(name: str, results, fake_openai):
+    latencies = sorted(ms for _, ms in results)
+    kinds = {}
+    for kind, ms in results:
+        kinds.setdefault(kind, []).append(ms)
+    print(f"{name}: {len(results)} requests, p50 {statistics.median(latencies):.0f} ms, "
+          f"p99 {percentile(latencies, 0.99):.0f} ms, max {latencies[-1]:.0f} ms; "
+          f"OpenAI 429s {fake_openai.state.rate_limited}")
+    for kind, values in sorted(kinds.items()):
+        values.sort()
+        print(f"  {kind:9s} {len(values):5d}  p50 {statistics.median(values):7.0f} ms  p99 {percentile(values, 0.99):7.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat overload benchmark with and without admission control")
+    parser.add_argument("--rate", type=float, default=60.0, help="Offered requests per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=200.0)
+    parser.add_argument("--openai-max-in-flight", type=int, default=8)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=10.0)
+    parser.add_argument("--max-concurrency", type=int, default=6)
+    parser.add_argument("--max-queue", type=int, default=12)
+    parser.add_argument("--queue-timeout", type=float, default=1.0)
+    parser.add_argument("--docs", default="docs")
+    args = parser.parse_args()
+
+    fake_openai, openai_url = start_fake_openai(latency_ms=args.openai_latency_ms,
+                                                max_in_flight=args.openai_max_in_flight)
+    fake_openai = fake_openai.RequestHandlerClass
+    _, qdrant_port = start_fake_qdrant(latency_ms=args.qdrant_latency_ms)
+    work_dir = tempfile.mkdtemp()
+    os.environ.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": openai_url,
+        "QDRANT_HOST": "127.0.0.1",
+        "QDRANT_PORT": str(qdrant_port),
+        "QDRANT_API_KEY": "",
+        "QDRANT_COLLECTION": "benchmark_chunks",
+        "EMBEDDING_CACHE_PATH": "",
+        "ANSWER_CACHE_ENABLED": "false",
+        "QUESTION_INDEX_ENABLED": "false",
+        "METRICS_SLOW_REQUEST_SECONDS": "3600",
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical.json"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'chat.sqlite3')}",
+    })
+
+    import uvicorn
+    from .. import main as server_module
+    from ..admission import AdmissionController
+    from ..ingest_textbook import ingest_textbook_content
+
+    ingest_textbook_content(os.path.abspath(args.docs), full=True, manifest_path=os.path.join(work_dir, "manifest.json"),
+                            lexical_index_path=os.environ["LEXICAL_INDEX_PATH"])
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(server_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"\n{args.rate:g} requests/s for {args.seconds:g}s; fake OpenAI {args.openai_latency_ms:g} ms, "
+          f"at most {args.openai_max_in_flight} calls in flight")
+    runs = [
+        ("no admission control", AdmissionController(max_concurrent=0, max_degraded=0), 0),
+        (f"admission control (concurrency {args.max_concurrency}, queue {args.max_queue}, "
+         f"timeout {args.queue_timeout:g}s)",
+         AdmissionController(max_concurrent=args.max_concurrency, max_queue=args.max_queue,
+                             queue_timeout=args.queue_timeout), 5),
+    ]
+    for name, controller, failure_threshold in runs:
+        server_module.admission = controller
+        for breaker in (server_module.openai_breaker, server_module.qdrant_breaker):
+            # A threshold of 0 never opens the breaker
+            breaker.failure_threshold, breaker.reset_seconds = failure_threshold, 2.0
+            breaker.record_success()
+        fake_openai.state.rate_limited = 0
+        results = asyncio.run(offered_load(f"http://127.0.0.1:{port}", args.rate, args.seconds, name[:2]))
+        report(name, results, fake_openai)
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
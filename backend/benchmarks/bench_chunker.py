@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the heading-aware markdown chunker against the legacy
+character-window chunker (DocumentProcessor.chunk_text) on large synthetic
+markdown documents:
+
+    python -m backend.benchmarks.bench_chunker --sections 2000
+"""
+
+import argparse
+import io
+import os
+import random
+import re
+import time
+
+WORDS = ("robot humanoid actuator torque sensor lidar imu odometry controller planner gait balance "
+         "trajectory kinematics dynamics simulation gazebo isaac ros2 topic node service message "
+         "perception depth camera policy reinforcement learning reward").split()
+
+def synthetic_markdown(sections: int, seed: int = 0) -> str:
+    """Chapters of nested sections with paragraphs, lists and code fences"""
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+    parts = ["---\nsidebar_position: 1\n---\n", "# Synthetic Chapter\n"]
+    for s in range(sections):
+        parts.append(f"{'#' * rng.choice((2, 2, 3, 4))} Section {s}\n")
+        for _ in range(rng.randint(1, 4)):
+            kind = rng.random()
+            if kind < 0.6:
+                parts.append(" ".join(sentence() for _ in range(rng.randint(2, 8))) + "\n")
+            elif kind < 0.8:
+                parts.append("\n".join(f"- {sentence()}" for _ in range(rng.randint(2, 6))) + "\n")
+            else:
+                lines = [f"# comment {rng.choice(WORDS)}" if rng.random() < 0.2 else
+                         f"value_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})" for i in range(rng.randint(3, 40))]
+                parts.append("```python\n" + "\n".join(lines) + "\n```\n")
+    return "\n".join(parts)
+
+HEADING_BLOCK = re.compile(r"#{1,6} [^\n]+")
+
+def spans_sections(chunk: str) -> bool:
+    """True if a section heading appears after body text, i.e. the chunk mixes sections"""
+    body_seen = False
+    for block in chunk.split("\n\n"):
+        if HEADING_BLOCK.fullmatch(block.strip()):
+            if body_seen:
+                return True
+        elif block.strip():
+            body_seen = True
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark markdown chunkers")
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    from ..document_processor import document_processor
+    from ..openai_client import estimate_tokens
+
+    text = synthetic_markdown(args.sections)
+    size_mb = len(text.encode("utf-8")) / 1e6
+    print(f"Synthetic document: {args.sections} sections, {size_mb:.2f} MB")
+
+    def legacy():
+        return document_processor.chunk_text(text)
+
+    def heading_aware():
+        return [chunk["content"] for chunk in document_processor.markdown_chunker.chunk_lines(io.StringIO(text))]
+
+    for name, run in (("legacy chunk_text", legacy), ("heading-aware", heading_aware)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            chunks = run()
+            best = min(best, time.perf_counter() - started)
+        tokens = [estimate_tokens(chunk) for chunk in chunks]
+        print(f"{name:18s} {best * 1000:8.1f} ms  {size_mb / best:6.1f} MB/s  {len(chunks):6d} chunks  "
+              f"tokens avg {sum(tokens) / len(tokens):5.0f} max {max(tokens):5d}  "
+              f"mixed-section {sum(spans_sections(chunk) for chunk in chunks):5d}")
+
+if __name__ == "__main__":
+    main()
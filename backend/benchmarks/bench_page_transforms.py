@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Latency and completion calls of page translation against the fake OpenAI
+server: the first (cold) view of each page, repeated (cached) views, and a
+burst of concurrent first views, which share one generation:
+
+    python -m backend.benchmarks.bench_page_transforms --openai-latency-ms 800 --readers 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from .fake_openai import start_fake_openai
+
+async def timed(coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    return result, (time.perf_counter() - started) * 1000
+
+async def run(args, fake_openai):
+    from ..page_transforms import create_page_transformer
+
+    transformer = create_page_transformer()
+    pages = sorted(
+        os.path.splitext(os.path.relpath(os.path.join(root, name), args.docs))[0].replace(os.sep, "/")
+        for root, _, names in os.walk(args.docs) for name in names if name.endswith(".md")
+    )
+
+    cold, sections = [], 0
+    for page in pages:
+        result, ms = await timed(transformer.translate(f"/docs/{page}", args.language))
+        cold.append(ms)
+        sections += len(result["sections"])
+    calls_cold = fake_openai.state.completion_requests
+
+    warm = []
+    for _ in range(args.repeats):
+        for page in pages:
+            warm.append((await timed(transformer.translate(f"/docs/{page}", args.language)))[1])
+    calls_warm = fake_openai.state.completion_requests - calls_cold
+
+    # A fresh profile, so every reader of the burst finds the page uncached
+    burst = await asyncio.gather(*(
+        timed(transformer.personalize(f"/docs/{pages[0]}", "burst reader", None)) for _ in range(args.readers)
+    ))
+
+    print(f"{len(pages)} pages, {sections} sections, {args.openai_latency_ms:g} ms completion latency")
+    print(f"cold views:   p50 {statistics.median(cold):7.1f} ms  completion calls {calls_cold}")
+    print(f"cached views: p50 {statistics.median(warm):7.2f} ms  max {max(warm):.2f} ms  "
+          f"completion calls {calls_warm}")
+    print(f"{args.readers} concurrent first views of one page: max {max(ms for _, ms in burst):.1f} ms, "
+          f"completion calls {fake_openai.state.completion_requests - calls_cold - calls_warm}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Page translation/personalization cache benchmark")
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--language", default="ur")
+    parser.add_argument("--openai-latency-ms", type=float, default=800.0)
+    parser.add_argument("--repeats", type=int, default=20, help="Cached views of every page")
+    parser.add_argument("--readers", type=int, default=20, help="Concurrent first views in the burst")
+    args = parser.parse_args()
+
+    fake_openai, openai_url = start_fake_openai(latency_ms=args.openai_latency_ms)
+    cache_dir = tempfile.mkdtemp()
+    os.environ.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": openai_url,
+        "DOCS_DIRECTORY": os.path.abspath(args.docs),
+        "TRANSFORM_CACHE_PATH": os.path.join(cache_dir, "transforms.sqlite3"),
+    })
+    asyncio.run(run(args, fake_openai.RequestHandlerClass))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Offline comparison of prompt sizes: the previous prompt (every retrieved
+chunk in full plus the last 5 history messages verbatim) against the
+token-budgeted PromptBuilder.
+
+Chunks the docs directory, retrieves the top --k chunks per question with
+BM25, adds a synthetic conversation of --history-turns question/answer
+pairs and reports prompt tokens per request for both, plus how often the
+question's "relevant" phrase still made it into the prompt:
+
+    python -m backend.benchmarks.bench_prompt --k 8 --history-turns 6
+"""
+
+import argparse
+import os
+import statistics
+
+from .eval_retrieval import QUESTIONS_PATH, load_chunks, load_questions
+
+ANSWER = (
+    "Here is a detailed explanation drawing on the chapter. " * 12
+).strip()
+
+def legacy_messages(query, context_chunks, conversation_history):
+    """The prompt RAGChat built before PromptBuilder"""
+    context = "\n\n---\n\n".join(
+        f"Chapter: {chunk['chapter']}\nSection: {chunk['section']}\nContent: {chunk['content']}"
+        for chunk in context_chunks
+    )
+    history_context = "\n".join(f"{msg['role']}: {msg['content']}" for msg in (conversation_history or [])[-5:])
+    prompt = f"""
+You are an expert assistant for a textbook on Physical AI and Humanoid Robotics.
+Answer the user's question using the provided context from the textbook.
+
+Context information:
+{context}
+
+Conversation history:
+{history_context}
+
+User question: {query}
+
+Please provide a comprehensive answer based on the context provided.
+If the context doesn't contain enough information to answer the question,
+please state that clearly and suggest what additional information might be needed.
+"""
+    return [
+        {"role": "system", "content": "You are an expert assistant for a textbook on Physical AI and Humanoid Robotics."},
+        {"role": "user", "content": prompt}
+    ]
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean": round(statistics.mean(values), 1),
+        "p50": values[len(values) // 2],
+        "p95": values[int(0.95 * (len(values) - 1))],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and token-budgeted prompt sizes")
+    parser.add_argument("--docs", default="docs", help="Docs directory to index")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSONL question set")
+    parser.add_argument("--k", type=int, default=8, help="Chunks retrieved per question")
+    parser.add_argument("--history-turns", type=int, default=6, help="Prior question/answer pairs per request")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+    from ..lexical_index import LexicalIndex
+    from ..prompt_builder import MESSAGE_OVERHEAD_TOKENS, REPLY_PRIMING_TOKENS, create_prompt_builder
+    from ..openai_client import openai_manager
+
+    builder = create_prompt_builder(openai_manager.completion_model)
+    count = builder.count_tokens
+    questions = load_questions(args.questions)
+    chunks = load_chunks(os.path.abspath(args.docs))
+    index = LexicalIndex.build(chunks)
+
+    legacy_tokens, budgeted_tokens = [], []
+    legacy_hits = budgeted_hits = merged = duplicates = 0
+    for i, question in enumerate(questions):
+        context_chunks = [
+            {**hit.payload, "score": hit.score}
+            for hit in index.search(question["question"], args.k)
+        ]
+        history = []
+        for turn in range(args.history_turns):
+            other = questions[(i + turn + 1) % len(questions)]["question"]
+            history += [{"role": "user", "content": other}, {"role": "assistant", "content": ANSWER}]
+
+        old = legacy_messages(question["question"], context_chunks, history)
+        legacy_tokens.append(REPLY_PRIMING_TOKENS + sum(MESSAGE_OVERHEAD_TOKENS + count(m["content"]) for m in old))
+        new, stats = builder.build(question["question"], context_chunks, history)
+        budgeted_tokens.append(stats["prompt_tokens"])
+        merged += stats["chunks_merged"]
+        duplicates += stats["duplicates_dropped"]
+
+        phrases = [phrase.lower() for phrase in question["relevant"]]
+        legacy_hits += any(phrase in old[1]["content"].lower() for phrase in phrases)
+        budgeted_hits += any(phrase in new[1]["content"].lower() for phrase in phrases)
+
+    n = len(questions)
+    print(f"{n} questions, top {args.k} chunks, {args.history_turns} history turns")
+    print(f"legacy   prompt_tokens={summarize(legacy_tokens)} relevant_in_prompt={legacy_hits / n:.2f}")
+    print(f"budgeted prompt_tokens={summarize(budgeted_tokens)} relevant_in_prompt={budgeted_hits / n:.2f} "
+          f"chunks_merged={merged} duplicates_dropped={duplicates}")
+    saved = 1 - sum(budgeted_tokens) / sum(legacy_tokens)
+    print(f"prompt tokens saved: {saved:.1%}")
+
+if __name__ == "__main__":
+    main()
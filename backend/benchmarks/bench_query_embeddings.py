@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for coalescing concurrent query embeddings.
+
+Starts the fake OpenAI server and replays an open-loop stream of query
+embedding requests (Poisson arrivals at --qps) through
+OpenAIManager.generate_embedding_async once per batch window, reporting
+outbound embedding calls per second, 429 responses and caller latency.
+Window 0 is the previous behaviour, one API call per query. Use
+--max-in-flight to make the fake server rate limit concurrent calls:
+
+    python -m backend.benchmarks.bench_query_embeddings --qps 300 --windows 0 2 5 10 20
+    python -m backend.benchmarks.bench_query_embeddings --qps 300 --max-in-flight 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.request
+
+from .fake_openai import start_fake_openai
+
+def fetch_stats(base_url: str):
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read())
+
+async def replay(qps: float, duration: float, seed: int):
+    from ..openai_client import openai_manager
+
+    rng = random.Random(seed)
+    latencies, failures, tasks = [], 0, []
+
+    async def one(i: int):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            # Unique texts, so the embedding cache never answers
+            await openai_manager.generate_embedding_async(f"query {seed}-{i}: how does a humanoid keep its balance?")
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+
+    # Arrivals follow a fixed schedule, so a saturated loop falls behind instead of lowering the offered rate
+    started = time.perf_counter()
+    next_arrival = 0.0
+    while next_arrival < duration:
+        delay = started + next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(len(tasks))))
+        next_arrival += rng.expovariate(qps)
+    await asyncio.gather(*tasks)
+    return latencies, failures, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Query embedding batch window benchmark")
+    parser.add_argument("--qps", type=float, default=300.0, help="Offered query rate")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of traffic per window")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10, 20], help="Batch windows in ms")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Fake embeddings API latency per call")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Fake server answers 429 above this many concurrent calls")
+    args = parser.parse_args()
+
+    _, base_url = start_fake_openai(latency_ms=args.latency_ms, max_in_flight=args.max_in_flight)
+    os.environ.update({"OPENAI_API_KEY": "fake", "OPENAI_BASE_URL": base_url, "EMBEDDING_CACHE_PATH": ""})
+
+    # One event loop for all windows: the pooled async client is bound to it
+    asyncio.run(run_windows(args, base_url))
+
+async def run_windows(args, base_url: str):
+    from ..embedding_batcher import EmbeddingBatcher
+    from ..openai_client import openai_manager
+
+    for seed, window in enumerate(args.windows):
+        openai_manager.query_batcher = EmbeddingBatcher(openai_manager._embed_texts_async, window, args.max_batch)
+        before = fetch_stats(base_url)
+        latencies, failures, elapsed = await replay(args.qps, args.duration, seed)
+        after = fetch_stats(base_url)
+
+        latencies.sort()
+        calls = after["embedding_requests"] - before["embedding_requests"]
+        print(f"window={window:g}ms " + str({
+            "queries": len(latencies),
+            "failures": failures,
+            "achieved_qps": round(len(latencies) / elapsed, 1),
+            "api_calls_per_s": round(calls / elapsed, 1),
+            "rate_limited": after["rate_limited"] - before["rate_limited"],
+            "mean_batch": openai_manager.query_batcher.stats()["mean_batch_size"],
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 1),
+        }))
+    await openai_manager.aclose()
+
+if __name__ == "__main__":
+    main()
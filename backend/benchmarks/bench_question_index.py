@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Cost of building the question index at ingestion, and latency and
+completion calls of /chat questions answered from it, against the fake
+OpenAI and Qdrant servers:
+
+    python -m backend.benchmarks.bench_question_index --openai-latency-ms 150 --thresholds 0.8 0.9 0.92 0.95
+
+Ingests the docs with --questions (then again, to show that unchanged
+chunks generate nothing), then matches two sets of questions against the
+index: the retrieval question set, and key-term questions made from the
+docs' section headings ("What are Topics?"). A hit is correct when the
+precomputed answer holds the question's expected passage. Finally every
+question is asked through chat_with_rag_async (answer cache off) at
+--chat-threshold. The fake completion model writes its questions from
+section headings and the fake embeddings are word hashes, so these hit
+rates show the mechanism rather than how real generated questions cover
+real traffic: choose the threshold with real embeddings.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from .fake_openai import start_fake_openai
+from .fake_qdrant import start_fake_qdrant
+from .eval_retrieval import QUESTIONS_PATH, load_questions
+
+HEADING = re.compile(r"^#{2,3}\s+(.+?)\s*$")
+
+def key_term_questions(docs: str):
+    questions = []
+    for root, _, names in os.walk(docs):
+        for name in sorted(names):
+            if not name.endswith(".md"):
+                continue
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                in_fence = False
+                for line in f:
+                    in_fence ^= line.lstrip().startswith("```")
+                    heading = None if in_fence else HEADING.match(line)
+                    if heading:
+                        questions.append({"question": f"What are {heading.group(1)}?",
+                                          "relevant": [heading.group(1)]})
+    return questions
+
+async def ask(chat, sets, completion_requests):
+    for name, questions in sets.items():
+        latencies = {"precomputed": [], "generated": []}
+        for question in questions:
+            before = completion_requests()
+            started = time.perf_counter()
+            await chat.chat_with_rag_async(question["question"])
+            outcome = "generated" if completion_requests() > before else "precomputed"
+            latencies[outcome].append((time.perf_counter() - started) * 1000)
+        row = [f"{outcome} {len(ms):3d} p50 {statistics.median(ms):6.1f} ms" for outcome, ms in latencies.items() if ms]
+        print(f"{name:20s} " + "   ".join(row))
+
+def run(args, fake_openai):
+    from ..ingest_textbook import ingest_textbook_content
+    from ..openai_client import openai_manager
+    from ..rag_chat import rag_chat
+
+    work_dir = tempfile.mkdtemp()
+    options = dict(full=True, questions=True, manifest_path=os.path.join(work_dir, "manifest.json"),
+                   lexical_index_path=os.path.join(work_dir, "lexical.json"),
+                   question_index_path=os.environ["QUESTION_INDEX_PATH"])
+    calls = []
+    for _ in range(2):
+        before, started = fake_openai.state.completion_requests, time.perf_counter()
+        ingest_textbook_content(os.path.abspath(args.docs), **options)
+        calls.append((fake_openai.state.completion_requests - before, time.perf_counter() - started))
+
+    chat = rag_chat.get_instance()
+    index = chat.question_index
+    sets = {"retrieval questions": load_questions(QUESTIONS_PATH), "key-term questions": key_term_questions(args.docs)}
+
+    print(f"\nquestion index: {len(index.entries)} questions; build {calls[0][0]} completion calls "
+          f"({calls[0][1]:.1f}s), unchanged re-run {calls[1][0]} calls ({calls[1][1]:.1f}s)")
+    for name, questions in sets.items():
+        embeddings = [openai_manager.generate_embedding(question["question"]) for question in questions]
+        rates = []
+        for threshold in args.thresholds:
+            index.threshold = threshold
+            matches = [index.match(embedding) for embedding in embeddings]
+            hits = sum(match is not None for match in matches)
+            correct = sum(match is not None and any(text in match["answer"] for text in question["relevant"])
+                          for match, question in zip(matches, questions))
+            rates.append(f"{threshold:g}: {hits / len(questions):.2f} ({correct} correct)")
+        print(f"{name:20s} ({len(questions):3d}) hit rate  " + "  ".join(rates))
+
+    index.threshold = args.chat_threshold
+    print(f"chat_with_rag_async at threshold {args.chat_threshold:g}, {args.openai_latency_ms:g} ms OpenAI latency:")
+    asyncio.run(ask(chat, sets, lambda: fake_openai.state.completion_requests))
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputed answer (question index) benchmark")
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--openai-latency-ms", type=float, default=150.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=20.0)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.9, 0.92, 0.95])
+    parser.add_argument("--chat-threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    fake_openai, openai_url = start_fake_openai(latency_ms=args.openai_latency_ms)
+    _, qdrant_port = start_fake_qdrant(latency_ms=args.qdrant_latency_ms)
+    os.environ.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": openai_url,
+        "QDRANT_HOST": "127.0.0.1",
+        "QDRANT_PORT": str(qdrant_port),
+        "QDRANT_API_KEY": "",
+        "QDRANT_COLLECTION": "benchmark_chunks",
+        "EMBEDDING_CACHE_PATH": "",
+        "ANSWER_CACHE_ENABLED": "false",
+        "QUESTION_INDEX_PATH": os.path.join(tempfile.mkdtemp(), "question_index"),
+    })
+    run(args, fake_openai.RequestHandlerClass)
+
+if __name__ == "__main__":
+    main()
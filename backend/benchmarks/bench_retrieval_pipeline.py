@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Retrieval latency of the sequential and parallel (speculative) chat
+pipelines against the fake OpenAI and Qdrant servers.
+
+Ingests the docs into the fake Qdrant, then times
+RAGChat._retrieve_for_chat_async for every question of the retrieval
+question set in three situations: a plain question, a question with
+selected text, and a question with selected text asked on a page that
+does not answer it (the worst case, where the scoped search widens).
+Every query is made unique so no embedding is served from cache:
+
+    python -m backend.benchmarks.bench_retrieval_pipeline --openai-latency-ms 150 --qdrant-latency-ms 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from .load_chat import configure_stub_environment
+from .eval_retrieval import QUESTIONS_PATH, load_questions
+
+async def measure(chat, questions, selected_text, doc_path, repeats: int, tag: str):
+    latencies = []
+    for repeat in range(repeats):
+        for i, question in enumerate(questions):
+            query = f"{question['question']} ({tag} {repeat}.{i})"
+            started = time.perf_counter()
+            await chat._retrieve_for_chat_async(query, selected_text, chat.page_scope(doc_path))
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+async def run(args):
+    from ..ingest_textbook import ingest_textbook_content
+    from ..rag_chat import rag_chat
+
+    work_dir = tempfile.mkdtemp()
+    ingest_textbook_content(os.path.abspath(args.docs), full=True, manifest_path=os.path.join(work_dir, "manifest.json"),
+                            lexical_index_path=os.path.join(work_dir, "lexical.json"))
+    chat = await rag_chat.get_instance_async()
+    questions = load_questions(QUESTIONS_PATH)
+    selected = "A node publishes messages on a topic that other nodes subscribe to."
+    cases = [
+        ("plain question", None, None),
+        ("with selected text", selected, None),
+        ("selection, other page", selected, "/docs/tutorial-basics/congratulations"),
+    ]
+
+    print(f"{len(questions)} questions x {args.repeats}, OpenAI {args.openai_latency_ms:g} ms, "
+          f"Qdrant {args.qdrant_latency_ms:g} ms, scoped threshold {chat.scope_min_score:g}")
+    for name, selected_text, doc_path in cases:
+        row = []
+        for pipeline in ("sequential", "parallel"):
+            chat.retrieval_pipeline = pipeline
+            p50, p95 = await measure(chat, questions, selected_text, doc_path, args.repeats, f"{pipeline} {name}")
+            row.append(f"{pipeline} p50 {p50:6.1f} ms p95 {p95:6.1f} ms")
+        print(f"{name:22s} " + "   ".join(row))
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs parallel retrieval pipeline latency")
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--openai-latency-ms", type=float, default=150.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=20.0)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    configure_stub_environment(args.openai_latency_ms, args.qdrant_latency_ms)
+    os.environ.setdefault("SCOPED_RETRIEVAL_MIN_SCORE", "0.75")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Memory, search latency and recall of the local vector index with and
+without binary quantization.
+
+Builds a synthetic corpus of --chunks unit vectors grouped into topics and
+subtopics of about 25 chunks (embeddings of a textbook are far from
+uniform: a query's top-k are a handful of closely related passages), writes
+it with LocalVectorIndex.build and searches it with queries near random
+chunks. Recall@k is measured against exact float32 search, so 1.0 means
+quantization changed no top-k result:
+
+    python -m backend.benchmarks.bench_vector_index --chunks 100000 --dimensions 1536
+    python -m backend.benchmarks.bench_vector_index --oversampling 2 4 8
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+def synthetic_vectors(chunks: int, dimensions: int, topics: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    subtopics = max(1, chunks // 25)
+    topic_centres = rng.standard_normal((topics, dimensions), dtype=np.float32)
+    subtopic_centres = topic_centres[rng.integers(0, topics, subtopics)] + \
+        rng.standard_normal((subtopics, dimensions), dtype=np.float32)
+    vectors = np.empty((chunks, dimensions), dtype=np.float32)
+    # In blocks, to keep the peak at one copy of the corpus
+    for start in range(0, chunks, 10000):
+        rows = min(10000, chunks - start)
+        vectors[start:start + rows] = subtopic_centres[rng.integers(0, subtopics, rows)] + \
+            0.7 * rng.standard_normal((rows, dimensions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def run(index, queries, k: int):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append(time.perf_counter() - started)
+        results.append([hit.id for hit in hits])
+    latencies.sort()
+    return results, {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vector index quantization benchmark")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--topics", type=int, default=100, help="Top-level clusters in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[2.0, 4.0, 8.0])
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    from ..retrieval import LocalVectorIndex
+
+    vectors = synthetic_vectors(args.chunks, args.dimensions, args.topics)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] + 0.02 * rng.standard_normal(
+        (args.queries, args.dimensions), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as path:
+        LocalVectorIndex.build(path, [
+            {"id": i, "content": "", "embedding": vector} for i, vector in enumerate(vectors)
+        ], include_content=False)
+        del vectors
+
+        exact = LocalVectorIndex(path)
+        truth, timing = run(exact, queries, args.k)
+        print(f"{args.chunks} chunks x {args.dimensions} dimensions, top {args.k}")
+        print(f"float32            in-memory {exact.stats()['in_memory_vector_bytes'] / 1e6:8.1f} MB  {timing}")
+        del exact
+
+        for oversampling in args.oversampling:
+            index = LocalVectorIndex(path, quantization="binary", oversampling=oversampling)
+            results, timing = run(index, queries, args.k)
+            recall = statistics.mean(len(set(got) & set(want)) / len(want) for got, want in zip(results, truth))
+            print(f"binary x{oversampling:<4g}       in-memory {index.stats()['in_memory_vector_bytes'] / 1e6:8.1f} MB  "
+                  f"{timing} recall@{args.k}={recall:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Offline recall@k evaluation of dense, lexical (BM25) and hybrid retrieval.
+
+Chunks the docs directory, builds both indexes in memory and scores each
+question in a JSONL question set. A retrieved chunk counts as relevant if
+its content contains any of the question's "relevant" phrases. Embeddings
+come from the deterministic fake embedder unless --openai is given:
+
+    python -m backend.benchmarks.eval_retrieval --k 1 3 5
+    python -m backend.benchmarks.eval_retrieval --openai
+    python -m backend.benchmarks.eval_retrieval --quantization binary --oversampling 4
+
+The scoped rows search the reader's page first, as chat requests carrying a
+doc_path do: "on page" puts the reader on the page holding the answer,
+"off page" on the next page, where a good --scope-min-score makes the
+search widen to the whole book. The mmr rows rerank the top --candidates
+hits with maximal marginal relevance; "redundancy" is the mean pairwise
+cosine similarity of the top hits (lower means more diverse context).
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from typing import List, Dict, Any
+
+from .fake_openai import fake_embedding
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_questions.jsonl")
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_chunks(docs_directory: str) -> List[Dict[str, Any]]:
+    from ..document_processor import document_processor
+
+    chunks = []
+    for root, _, files in os.walk(docs_directory):
+        for file in sorted(files):
+            if file.endswith(".md"):
+                chunks.extend(document_processor.process_markdown_file(os.path.join(root, file), embed=False))
+    for i, chunk in enumerate(chunks):
+        chunk["id"] = i
+        chunk["doc_path"] = os.path.relpath(chunk["source"], docs_directory).replace(os.sep, "/")
+    return chunks
+
+def is_relevant(hit, phrases: List[str]) -> bool:
+    content = hit.payload["content"].lower()
+    return any(phrase.lower() in content for phrase in phrases)
+
+def redundancy(vectors) -> float:
+    """Mean pairwise cosine similarity of a set of unit vectors"""
+    import numpy as np
+    vectors = np.asarray(vectors)
+    if len(vectors) < 2:
+        return 0.0
+    similarity = vectors @ vectors.T
+    return float((similarity.sum() - np.trace(similarity)) / (len(vectors) * (len(vectors) - 1)))
+
+def evaluate(questions, search, ks: List[int], vectors_of=None) -> Dict[str, float]:
+    """
+    Recall@k (share of questions with a relevant chunk in the top k), MRR and,
+    given `vectors_of`, the mean redundancy of the top hits
+    """
+    depth = max(ks)
+    found_at = []
+    redundancies = []
+    for question in questions:
+        hits = search(question["question"], depth)
+        rank = next((i + 1 for i, hit in enumerate(hits) if is_relevant(hit, question["relevant"])), None)
+        found_at.append(rank)
+        if vectors_of is not None:
+            vectors = vectors_of([hit.id for hit in hits])
+            redundancies.append(redundancy([vectors[str(hit.id)] for hit in hits if str(hit.id) in vectors]))
+    metrics = {f"recall@{k}": sum(1 for rank in found_at if rank and rank <= k) / len(questions) for k in ks}
+    metrics["mrr"] = sum(1.0 / rank for rank in found_at if rank) / len(questions)
+    if redundancies:
+        metrics["redundancy"] = sum(redundancies) / len(redundancies)
+    return {name: round(value, 3) for name, value in metrics.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recall@k evaluation for retrieval modes")
+    parser.add_argument("--docs", default="docs", help="Docs directory to index")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSONL question set")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--candidates", type=int, default=20, help="Per-ranking depth fused in hybrid mode")
+    parser.add_argument("--openai", action="store_true", help="Use real OpenAI embeddings instead of the fake embedder")
+    parser.add_argument("--quantization", choices=("none", "binary"), default="none",
+                        help="Also evaluate the dense and hybrid modes on a quantized local index")
+    parser.add_argument("--oversampling", type=float, default=4.0, help="Rescored candidates per result when quantized")
+    parser.add_argument("--mmr-lambda", type=float, default=0.5,
+                        help="Relevance weight of the MMR rerank rows (1.0 is no diversification)")
+    parser.add_argument("--scope-min-score", type=float, default=0.75,
+                        help="Best in-page score below which scoped searches widen to the whole book")
+    args = parser.parse_args()
+
+    if not args.openai:
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+        os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+    from ..lexical_index import LexicalIndex
+    from ..retrieval import LocalVectorIndex, reciprocal_rank_fusion, mmr_rerank
+
+    questions = load_questions(args.questions)
+    chunks = load_chunks(os.path.abspath(args.docs))
+
+    if args.openai:
+        from ..openai_client import openai_manager
+        embed_many = openai_manager.generate_embeddings_with_retry
+    elif args.quantization != "none":
+        # Fake embeddings are sparse hashed word counts, whose sign bits say little; a fixed random
+        # rotation keeps every cosine (so float32 results are unchanged) and spreads them over all
+        # dimensions like real embeddings
+        import numpy as np
+        rotation, _ = np.linalg.qr(np.random.default_rng(0).standard_normal((1536, 1536)))
+        embed_many = lambda texts: (np.asarray([fake_embedding(text) for text in texts]) @ rotation).tolist()
+    else:
+        embed_many = lambda texts: [fake_embedding(text) for text in texts]
+
+    for chunk, embedding in zip(chunks, embed_many([chunk["content"] for chunk in chunks])):
+        chunk["embedding"] = embedding
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        LocalVectorIndex.build(index_dir, chunks)
+        vector_index = LocalVectorIndex(index_dir)
+        lexical_index = LexicalIndex.build(chunks)
+        question_vectors = dict(zip(
+            (q["question"] for q in questions),
+            embed_many([q["question"] for q in questions])
+        ))
+
+        def dense_search(index):
+            return lambda query, limit: index.search(question_vectors[query], limit)
+
+        def lexical(query, limit):
+            return lexical_index.search(query, limit)
+
+        def hybrid_search(dense):
+            def hybrid(query, limit):
+                depth = max(limit, args.candidates)
+                return reciprocal_rank_fusion([dense(query, depth), lexical(query, depth)], limit)
+            return hybrid
+
+        def mmr_search(search):
+            def reranked(query, limit):
+                hits = search(query, max(limit, args.candidates))
+                vectors = vector_index.get_vectors([hit.id for hit in hits])
+                return mmr_rerank(hits, vectors, limit, args.mmr_lambda)
+            return reranked
+
+        def scoped_search(page_for, widened):
+            def scoped(query, limit):
+                page = page_for[query]
+                if page:
+                    hits = vector_index.search(question_vectors[query], limit, {"doc_path": page})
+                    if hits and hits[0].score >= args.scope_min_score:
+                        return hits
+                widened.add(query)
+                return dense(query, limit)
+            return scoped
+
+        pages = sorted({chunk["doc_path"] for chunk in chunks})
+        home_page = {
+            q["question"]: next((chunk["doc_path"] for chunk in chunks
+                                 if any(phrase.lower() in chunk["content"].lower() for phrase in q["relevant"])), None)
+            for q in questions
+        }
+        other_page = {
+            question: pages[(pages.index(page) + 1) % len(pages)] if page else None
+            for question, page in home_page.items()
+        }
+        widened = {"dense-on-page": set(), "dense-off-page": set()}
+
+        dense = dense_search(vector_index)
+        modes = [("dense", dense), ("lexical", lexical), ("hybrid", hybrid_search(dense)),
+                 ("dense-on-page", scoped_search(home_page, widened["dense-on-page"])),
+                 ("dense-off-page", scoped_search(other_page, widened["dense-off-page"])),
+                 ("dense-mmr", mmr_search(dense)), ("hybrid-mmr", mmr_search(hybrid_search(dense)))]
+        if args.quantization != "none":
+            quantized = dense_search(LocalVectorIndex(index_dir, quantization=args.quantization,
+                                                      oversampling=args.oversampling))
+            modes += [(f"dense-{args.quantization}", quantized),
+                      (f"hybrid-{args.quantization}", hybrid_search(quantized))]
+
+        print(f"{len(questions)} questions over {len(chunks)} chunks")
+        for name, search in modes:
+            metrics = evaluate(questions, search, args.k, vector_index.get_vectors)
+            if name in widened:
+                metrics["widened"] = f"{len(widened[name])}/{len(questions)}"
+            print(f"{name:14s} {metrics}")
+
+if __name__ == "__main__":
+    main()
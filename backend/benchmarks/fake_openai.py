@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs.
+
+Embeddings are deterministic hashed bag-of-words vectors, so texts that share
+words get similar vectors and retrieval behaves plausibly. Point the backend
+at it with OPENAI_BASE_URL:
+
+    python -m backend.benchmarks.fake_openai --port 8100 --latency-ms 50
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake python -m backend.ingest_textbook
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def fake_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """Deterministic unit vector built from hashed word counts"""
+    vector = [0.0] * dimensions
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def fake_sections_reply(prompt: str) -> str:
+    """For batched page rewrites ({"sections": [...]} prompts), the sections marked as rewritten"""
+    try:
+        sections = json.loads(prompt)["sections"]
+    except (ValueError, KeyError, TypeError):
+        return ""
+    return json.dumps({"sections": [f"[rewritten] {section}" for section in sections]}, ensure_ascii=False)
+
+def fake_questions_reply(messages) -> str:
+    """For question generation ({"chapter", "section", "passage"} prompts), questions about the passage's heading"""
+    try:
+        item = json.loads(messages[-1]["content"])
+        passage = item["passage"]
+    except (ValueError, KeyError, TypeError, IndexError):
+        return ""
+    count = re.search(r"up to (\d+)", messages[0]["content"])
+    topic = item.get("section", "").split(" > ")[-1] or item.get("chapter", "")
+    if not item.get("section"):
+        questions = [f"What does {topic} cover?", f"Give me a summary of {topic}"]
+    else:
+        questions = [f"What is {topic}?", f"How does {topic} work?", f"Explain {topic} in {item.get('chapter', '')}"]
+    pairs = [{"question": question, "answer": passage[:600]} for question in questions]
+    return json.dumps({"questions": pairs[:int(count.group(1)) if count else 3]}, ensure_ascii=False)
+
+class FakeOpenAIState:
+    """Counters and knobs shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 0.0, rate_limit_prob: float = 0.0, max_in_flight: int = 0,
+                 token_latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.rate_limit_prob = rate_limit_prob
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.embedding_requests = 0
+        self.embedded_inputs = 0
+        self.completion_requests = 0
+        self.rate_limited = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "embedding_requests": self.embedding_requests,
+                "embedded_inputs": self.embedded_inputs,
+                "completion_requests": self.completion_requests,
+                "rate_limited": self.rate_limited,
+            }
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    state: FakeOpenAIState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        state = self.state
+
+        with state.lock:
+            state.requests += 1
+            state.in_flight += 1
+            limited = (state.max_in_flight and state.in_flight > state.max_in_flight) or \
+                random.random() < state.rate_limit_prob
+            if limited:
+                state.rate_limited += 1
+        try:
+            if limited:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                headers={"retry-after": "0.1"})
+                return
+
+            if state.latency_ms:
+                time.sleep(state.latency_ms / 1000.0)
+
+            if self.path.endswith("/embeddings"):
+                self._handle_embeddings(payload)
+            elif self.path.endswith("/chat/completions"):
+                self._handle_completion(payload)
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _handle_embeddings(self, payload):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(payload.get("dimensions") or 1536)
+        with self.state.lock:
+            self.state.embedding_requests += 1
+            self.state.embedded_inputs += len(inputs)
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(len(TOKEN_PATTERN.findall(text)) for text in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _handle_completion(self, payload):
+        with self.state.lock:
+            self.state.completion_requests += 1
+        messages = payload.get("messages", [])
+        question = messages[-1]["content"] if messages else ""
+        answer = fake_sections_reply(question) or fake_questions_reply(messages) or \
+            f"This is a fake answer based on {len(question)} characters of prompt."
+        if payload.get("stream"):
+            return self._stream_completion(payload, answer)
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake-chat"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(question) // 4, "completion_tokens": len(answer) // 4,
+                      "total_tokens": (len(question) + len(answer)) // 4},
+        })
+
+    def _stream_completion(self, payload, answer: str):
+        """Server-sent events in the OpenAI streaming format, one word per chunk"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake-chat"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        words = answer.split(" ")
+        events += [chunk({"content": word if i == 0 else " " + word}) for i, word in enumerate(words)]
+        events.append(chunk({}, "stop"))
+        for event in events:
+            if self.state.token_latency_ms:
+                time.sleep(self.state.token_latency_ms / 1000.0)
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def start_fake_openai(host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+    """Start the fake server in a background thread; returns (server, base_url)"""
+    handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,), {"state": FakeOpenAIState(**state_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI embeddings/chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0, help="Probability of answering 429")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Answer 429 above this many concurrent requests")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Delay between streamed completion chunks")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_openai(args.host, args.port, latency_ms=args.latency_ms,
+                                         rate_limit_prob=args.rate_limit_prob, max_in_flight=args.max_in_flight,
+                                         token_latency_ms=args.token_latency_ms)
+    print(f"Fake OpenAI server listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
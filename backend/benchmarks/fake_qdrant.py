@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the subset of the Qdrant REST API the backend uses.
+
+Points live in memory and search is brute-force cosine similarity, which is
+plenty for the textbook's few hundred chunks. Point the backend at it with
+QDRANT_HOST/QDRANT_PORT:
+
+    python -m backend.benchmarks.fake_qdrant --port 6400 --latency-ms 5
+    QDRANT_HOST=127.0.0.1 QDRANT_PORT=6400 python -m backend.ingest_textbook
+"""
+
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+COLLECTION_PATH = re.compile(r"^/collections/([^/]+)(/.*)?$")
+
+def matches_filter(payload: Dict[str, Any], query_filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate the "must" match conditions of a Qdrant filter against a payload"""
+    for condition in (query_filter or {}).get("must") or []:
+        value = (payload or {}).get(condition["key"])
+        match = condition.get("match", {})
+        if "value" in match and value != match["value"]:
+            return False
+        if "any" in match and value not in match["any"]:
+            return False
+    return True
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class FakeQdrantState:
+    """Collections, points and counters shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        self.collections: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+        self.searches = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "searches": self.searches,
+                "points": {name: len(c["points"]) for name, c in self.collections.items()},
+            }
+
+class FakeQdrantHandler(BaseHTTPRequestHandler):
+    state: FakeQdrantState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, result):
+        data = json.dumps({"result": result, "status": "ok", "time": 0.0}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_raw(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        data = json.dumps({"status": {"error": "Not found"}, "time": 0.0}).encode("utf-8")
+        self.send_response(404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_payload(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _begin(self):
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000.0)
+
+    def do_GET(self):
+        self._begin()
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "":
+            self._send_raw({"title": "qdrant - fake", "version": "1.12.0"})
+        elif path == "/stats":
+            self._send_raw(self.state.stats())
+        elif path == "/collections":
+            with self.state.lock:
+                names = list(self.state.collections)
+            self._send_json(200, {"collections": [{"name": name} for name in names]})
+        else:
+            match = COLLECTION_PATH.match(path)
+            if match and match.group(1) in self.state.collections and not match.group(2):
+                with self.state.lock:
+                    collection = self.state.collections[match.group(1)]
+                    count = len(collection["points"])
+                # Enough of CollectionInfo for the client to parse it
+                self._send_json(200, {
+                    "status": "green",
+                    "optimizer_status": "ok",
+                    "points_count": count,
+                    "indexed_vectors_count": count,
+                    "segments_count": 1,
+                    "payload_schema": collection.get("payload_schema", {}),
+                    "config": {
+                        "params": {"vectors": collection["config"].get("vectors", {})},
+                        "hnsw_config": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000},
+                        "optimizer_config": {
+                            "deleted_threshold": 0.2, "vacuum_min_vector_number": 1000,
+                            "default_segment_number": 0, "flush_interval_sec": 5,
+                        },
+                        "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+                    },
+                })
+            elif match and match.group(2) == "/exists":
+                self._send_json(200, {"exists": match.group(1) in self.state.collections})
+            else:
+                self._not_found()
+
+    def do_PUT(self):
+        self._begin()
+        payload = self._read_payload()
+        match = COLLECTION_PATH.match(self.path.split("?")[0].rstrip("/"))
+        if not match:
+            return self._not_found()
+        name, action = match.group(1), match.group(2)
+        with self.state.lock:
+            if not action:
+                self.state.collections.setdefault(name, {"config": payload, "points": {}})
+                return self._send_json(200, True)
+            collection = self.state.collections.get(name)
+            if collection is None:
+                return self._not_found()
+            if action == "/points":
+                points = payload.get("points", [])
+                if isinstance(points, dict):
+                    points = [
+                        {"id": i, "vector": v, "payload": p}
+                        for i, v, p in zip(points["ids"], points["vectors"], points.get("payloads") or [{}] * len(points["ids"]))
+                    ]
+                for point in points:
+                    collection["points"][str(point["id"])] = point
+                return self._send_json(200, {"operation_id": 0, "status": "completed"})
+            if action == "/index":
+                collection.setdefault("payload_schema", {})[payload["field_name"]] = {
+                    "data_type": payload.get("field_schema", "keyword"), "points": len(collection["points"])
+                }
+                return self._send_json(200, {"operation_id": 0, "status": "completed"})
+        self._not_found()
+
+    def do_DELETE(self):
+        self._begin()
+        match = COLLECTION_PATH.match(self.path.split("?")[0].rstrip("/"))
+        with self.state.lock:
+            if match and not match.group(2) and self.state.collections.pop(match.group(1), None) is not None:
+                return self._send_json(200, True)
+        self._not_found()
+
+    def do_POST(self):
+        self._begin()
+        payload = self._read_payload()
+        match = COLLECTION_PATH.match(self.path.split("?")[0].rstrip("/"))
+        if not match or match.group(1) not in self.state.collections:
+            return self._not_found()
+        collection = self.state.collections[match.group(1)]
+        action = match.group(2)
+
+        if action in ("/points/search", "/points/query"):
+            vector = payload.get("vector") if action == "/points/search" else payload.get("query")
+            if isinstance(vector, dict):
+                vector = vector.get("vector")
+            with self.state.lock:
+                self.state.searches += 1
+                points = list(collection["points"].values())
+            scored = sorted(
+                ({"id": p["id"], "version": 0, "score": cosine(vector, p["vector"]),
+                  "payload": p.get("payload") if payload.get("with_payload", True) else None, "vector": None}
+                 for p in points if matches_filter(p.get("payload"), payload.get("filter"))),
+                key=lambda hit: hit["score"],
+                reverse=True
+            )[:int(payload.get("limit", 10))]
+            return self._send_json(200, scored if action == "/points/search" else {"points": scored})
+
+        if action == "/points":
+            ids = [str(i) for i in payload.get("ids", [])]
+            with self.state.lock:
+                points = [collection["points"][i] for i in ids if i in collection["points"]]
+            return self._send_json(200, [
+                {"id": p["id"], "payload": p.get("payload") if payload.get("with_payload") else None,
+                 "vector": p["vector"] if payload.get("with_vector") else None}
+                for p in points
+            ])
+
+        if action == "/points/delete":
+            ids = [str(i) for i in payload.get("points", [])]
+            with self.state.lock:
+                for point_id in ids:
+                    collection["points"].pop(point_id, None)
+            return self._send_json(200, {"operation_id": 0, "status": "completed"})
+
+        if action == "/points/scroll":
+            with self.state.lock:
+                ids = sorted(collection["points"])
+            start = ids.index(str(payload["offset"])) if payload.get("offset") is not None else 0
+            limit = int(payload.get("limit", 10))
+            page = ids[start:start + limit]
+            next_offset = collection["points"][ids[start + limit]]["id"] if start + limit < len(ids) else None
+            return self._send_json(200, {
+                "points": [{"id": collection["points"][i]["id"], "payload": None, "vector": None} for i in page],
+                "next_page_offset": next_offset,
+            })
+
+        self._not_found()
+
+def start_fake_qdrant(host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+    """Start the fake server in a background thread; returns (server, port)"""
+    handler = type("BoundFakeQdrantHandler", (FakeQdrantHandler,), {"state": FakeQdrantState(**state_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, server.server_address[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Qdrant REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6400)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    args = parser.parse_args()
+
+    server, port = start_fake_qdrant(args.host, args.port, latency_ms=args.latency_ms)
+    print(f"Fake Qdrant server listening on http://{args.host}:{port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
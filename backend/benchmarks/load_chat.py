@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Concurrent load benchmark for the /chat endpoint against local stub services.
+
+Starts the fake OpenAI and fake Qdrant servers, seeds the collection from the
+docs directory, serves the FastAPI app with uvicorn and fires concurrent chat
+requests. The blocking baseline runs the synchronous RAG path inside an async
+handler, which is how /chat used to behave:
+
+    python -m backend.benchmarks.load_chat --requests 200 --concurrency 50
+    python -m backend.benchmarks.load_chat --requests 200 --concurrency 50 --blocking
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import threading
+import time
+
+from .fake_openai import start_fake_openai
+from .fake_qdrant import start_fake_qdrant
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def configure_stub_environment(openai_latency_ms: float, qdrant_latency_ms: float):
+    """Start both stub services and point the backend at them (must run before importing the backend)"""
+    _, openai_url = start_fake_openai(latency_ms=openai_latency_ms)
+    _, qdrant_port = start_fake_qdrant(latency_ms=qdrant_latency_ms)
+    os.environ.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": openai_url,
+        "QDRANT_HOST": "127.0.0.1",
+        "QDRANT_PORT": str(qdrant_port),
+        "QDRANT_API_KEY": "",
+        "QDRANT_COLLECTION": "benchmark_chunks",
+        "EMBEDDING_CACHE_PATH": "",
+    })
+
+def seed_collection(docs_directory: str) -> int:
+    from ..document_processor import document_processor
+    from ..qdrant_client import qdrant_manager
+
+    records = []
+    for root, _, files in os.walk(docs_directory):
+        for file in files:
+            if file.endswith(".md"):
+                records.extend(document_processor.process_markdown_file(os.path.join(root, file), embed=False))
+    chunks = document_processor.embed_chunk_records(records)
+    qdrant_manager.insert_chunks(chunks)
+    return len(chunks)
+
+async def run_load(base_url: str, path: str, total: int, concurrency: int):
+    import httpx
+
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def one(i: int):
+            nonlocal failures
+            body = {"messages": [{"role": "user", "content": f"Question {i}: how do humanoid robots balance?"}]}
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, json=body)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+        "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for /chat against stub services")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--openai-latency-ms", type=float, default=100.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=10.0)
+    parser.add_argument("--docs", default="docs", help="Docs directory used to seed the collection")
+    parser.add_argument("--blocking", action="store_true", help="Benchmark the old blocking handler instead")
+    args = parser.parse_args()
+
+    configure_stub_environment(args.openai_latency_ms, args.qdrant_latency_ms)
+
+    import uvicorn
+    from ..main import app, ChatRequest
+    from ..rag_chat import rag_chat
+
+    @app.post("/chat-blocking")
+    async def chat_blocking(request: ChatRequest):
+        # Reproduces the previous handler: sync RAG calls on the event loop
+        return rag_chat.chat_with_rag(query=request.messages[-1].content)
+
+    print(f"Seeded {seed_collection(os.path.abspath(args.docs))} chunks")
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    path = "/chat-blocking" if args.blocking else "/chat"
+    result = asyncio.run(run_load(f"http://127.0.0.1:{port}", path, args.requests, args.concurrency))
+    print(f"{path}: {result}")
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite against the stub OpenAI and Qdrant services.
+
+Runs every workload in one process and writes the results as JSON, so runs
+can be compared after a change:
+
+- ingest:  the full ingestion pipeline over the docs directory (chunks/s and
+           per-stage throughput); this also seeds the collection for chat
+- chunker: legacy and heading-aware chunkers on large synthetic markdown (MB/s)
+- chat:    concurrent /chat load through uvicorn (QPS, p50/p95/p99)
+
+    python -m backend.benchmarks.run_suite
+    python -m backend.benchmarks.run_suite --workloads chunker chat --compare latest
+
+Results go to backend/.benchmarks/<UTC timestamp>.json unless --output is
+given. --compare takes a previous results file, or "latest" for the newest
+one in that directory, and prints the change of every metric.
+"""
+
+import argparse
+import asyncio
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .bench_chunker import synthetic_markdown
+from .load_chat import configure_stub_environment, free_port, run_load
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".benchmarks")
+WORKLOADS = ("ingest", "chunker", "chat")
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return ""
+
+def bench_ingest(docs_directory: str, concurrency: int):
+    from ..ingest_textbook import IngestionPipeline
+
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = IngestionPipeline(docs_directory, concurrency=concurrency, full=True,
+                                     manifest_path=os.path.join(directory, "manifest.json"))
+        if not pipeline.run():
+            raise RuntimeError("ingestion failed")
+    return {
+        "files": pipeline.stats["chunk"].items,
+        "chunks": len(pipeline.current),
+        "failed_chunks": pipeline.failed_chunks,
+        "elapsed_s": round(pipeline.elapsed, 3),
+        "chunks_per_s": round(len(pipeline.current) / pipeline.elapsed, 1),
+        "stages": {
+            name: {
+                "items": stage.items,
+                "seconds": round(stage.seconds, 3),
+                "per_s": round(stage.items / stage.seconds, 1) if stage.seconds else 0.0,
+            }
+            for name, stage in pipeline.stats.items()
+        },
+    }
+
+def bench_chunker(sections: int, repeat: int):
+    from ..document_processor import document_processor
+
+    text = synthetic_markdown(sections)
+    size_mb = len(text.encode("utf-8")) / 1e6
+    chunkers = {
+        "legacy": lambda: document_processor.chunk_text(text),
+        "heading_aware": lambda: list(document_processor.markdown_chunker.chunk_lines(io.StringIO(text))),
+    }
+    results = {"sections": sections, "size_mb": round(size_mb, 3)}
+    for name, run in chunkers.items():
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            chunks = run()
+            best = min(best, time.perf_counter() - started)
+        results[name] = {"best_s": round(best, 4), "mb_per_s": round(size_mb / best, 2), "chunks": len(chunks)}
+    return results
+
+def bench_chat(requests: int, concurrency: int):
+    import uvicorn
+    from ..main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           timeout_keep_alive=60))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        # A short warm-up so connection pools and lazy clients are not billed to the first requests
+        asyncio.run(run_load(base_url, "/chat", min(concurrency, requests), concurrency))
+        result = asyncio.run(run_load(base_url, "/chat", requests, concurrency))
+    finally:
+        server.should_exit = True
+    return {"concurrency": concurrency, **result}
+
+def flatten(results, prefix: str = ""):
+    """Numeric leaves of nested dicts as {"chat.p99_ms": 120.5, ...}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def resolve_previous(compare: str, output: str):
+    if compare != "latest":
+        return compare
+    previous = sorted(path for path in glob.glob(os.path.join(RESULTS_DIRECTORY, "*.json"))
+                      if os.path.abspath(path) != os.path.abspath(output))
+    return previous[-1] if previous else None
+
+def print_comparison(previous_path: str, current):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} (commit {previous['meta'].get('commit') or 'unknown'}):")
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    for name in sorted(set(old) & set(new)):
+        change = f"{(new[name] - old[name]) / old[name]:+7.1%}" if old[name] else "    n/a"
+        print(f"  {name:40s} {old[name]:>12g} -> {new[name]:>12g}  {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark suite against stub services")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--docs", default="docs", help="Docs directory to ingest")
+    parser.add_argument("--ingest-concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--sections", type=int, default=2000, help="Sections in the synthetic chunker document")
+    parser.add_argument("--repeat", type=int, default=3, help="Chunker runs (the best one counts)")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent /chat requests")
+    parser.add_argument("--openai-latency-ms", type=float, default=100.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=10.0)
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Keep the semantic answer cache on (off by default so every request runs the full pipeline)")
+    parser.add_argument("--output", help="Results file (default: backend/.benchmarks/<timestamp>.json)")
+    parser.add_argument("--compare", help='Previous results file, or "latest"')
+    args = parser.parse_args()
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    output = args.output or os.path.join(RESULTS_DIRECTORY, started_at.strftime("%Y%m%dT%H%M%SZ") + ".json")
+
+    configure_stub_environment(args.openai_latency_ms, args.qdrant_latency_ms)
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+    results = {}
+    if "ingest" in args.workloads:
+        results["ingest"] = bench_ingest(os.path.abspath(args.docs), args.ingest_concurrency)
+        print(f"ingest:  {results['ingest']['chunks']} chunks at {results['ingest']['chunks_per_s']} chunks/s")
+    elif "chat" in args.workloads:
+        from .load_chat import seed_collection
+        seed_collection(os.path.abspath(args.docs))
+    if "chunker" in args.workloads:
+        results["chunker"] = bench_chunker(args.sections, args.repeat)
+        print(f"chunker: legacy {results['chunker']['legacy']['mb_per_s']} MB/s, "
+              f"heading-aware {results['chunker']['heading_aware']['mb_per_s']} MB/s")
+    if "chat" in args.workloads:
+        results["chat"] = bench_chat(args.requests, args.concurrency)
+        print(f"chat:    {results['chat']['throughput_rps']} req/s, p50 {results['chat']['p50_ms']} ms, "
+              f"p99 {results['chat']['p99_ms']} ms, {results['chat']['failures']} failures")
+
+    report = {
+        "meta": {
+            "started_at": started_at.isoformat(),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parameters": vars(args),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        previous_path = resolve_previous(args.compare, output)
+        if previous_path:
+            print_comparison(previous_path, report)
+        else:
+            print("No previous results to compare with")
+
+if __name__ == "__main__":
+    main()
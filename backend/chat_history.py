@@ -0,0 +1,410 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import insert, select, text, and_, or_, inspect
+from sqlalchemy.exc import IntegrityError
+from .config import load_environment
+from .lazy import Lazy
+from .models import Base, ChatHistory
+
+# Load environment variables
+load_environment()
+
+def new_conversation_id() -> str:
+    return uuid.uuid4().hex
+
+def parse_history_cursor(before: str) -> Tuple[datetime, int]:
+    """The (timestamp, id) of a `next_before` cursor; ValueError if it is malformed"""
+    timestamp, separator, row_id = before.rpartition("_")
+    if not separator or not row_id.isdigit():
+        raise ValueError(f"Invalid history cursor: {before!r}")
+    try:
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid history cursor: {before!r}") from None
+
+def migrate_chat_history(engine):
+    """
+    Bring a chat_history table created before conversations were stored up
+    to the current schema. Safe to run on every start, after create_all
+    (which never alters an existing table). Adds conversation_id, giving
+    each user's earlier messages one random conversation ID so that they
+    stay unreadable to anyone else; makes user_id nullable for anonymous
+    readers; and creates missing indexes. SQLite cannot drop NOT NULL,
+    so there the table is rebuilt.
+    """
+    columns = {column["name"]: column for column in inspect(engine).get_columns("chat_history")}
+    postgres = engine.dialect.name == "postgresql"
+    with engine.begin() as connection:
+        if "conversation_id" not in columns:
+            print("Migrating chat_history: adding conversation_id")
+            connection.execute(text(
+                f"ALTER TABLE chat_history ADD COLUMN {'IF NOT EXISTS ' if postgres else ''}conversation_id VARCHAR"
+            ))
+        user_ids = connection.execute(text(
+            "SELECT DISTINCT user_id FROM chat_history WHERE conversation_id IS NULL"
+        )).scalars().all()
+        for user_id in user_ids:
+            connection.execute(
+                text("UPDATE chat_history SET conversation_id = :conversation_id WHERE conversation_id IS NULL AND "
+                     + ("user_id IS NULL" if user_id is None else "user_id = :user_id")),
+                {"conversation_id": new_conversation_id(), "user_id": user_id}
+            )
+
+        user_id_required = not columns["user_id"]["nullable"]
+        conversation_id_optional = columns.get("conversation_id", {"nullable": True})["nullable"]
+        if postgres:
+            if user_id_required:
+                connection.execute(text("ALTER TABLE chat_history ALTER COLUMN user_id DROP NOT NULL"))
+            if conversation_id_optional:
+                connection.execute(text("ALTER TABLE chat_history ALTER COLUMN conversation_id SET NOT NULL"))
+        elif user_id_required:
+            print("Migrating chat_history: rebuilding the table to make user_id nullable")
+            for index in inspect(connection).get_indexes("chat_history"):
+                connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+            connection.execute(text("ALTER TABLE chat_history RENAME TO chat_history_old"))
+            ChatHistory.__table__.create(connection)
+            connection.execute(text(
+                "INSERT INTO chat_history (id, conversation_id, user_id, message, role, timestamp) "
+                "SELECT id, conversation_id, user_id, message, role, timestamp FROM chat_history_old"
+            ))
+            connection.execute(text("DROP TABLE chat_history_old"))
+    for index in ChatHistory.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+class ChatHistoryStore:
+    """
+    Server-side conversation storage on the ChatHistory table.
+
+    Writes are appended to an in-memory buffer and flushed in batches by a
+    background thread, so persisting a message never waits on the database.
+    The last `window_size` messages of recently active conversations are
+    also kept in memory, so building the next prompt rarely reads the
+    database at all. Without DATABASE_URL the store is memory-only.
+
+    While the database is failing, flushes back off exponentially up to
+    `max_retry_interval` seconds and the buffer holds at most `max_buffer`
+    unwritten messages; the oldest beyond that are dropped (`dropped_rows`).
+    """
+
+    def __init__(self, window_size: int = 10, max_conversations: int = 10000,
+                 flush_interval: float = 0.5, flush_batch_size: int = 500, max_buffer: int = 10000,
+                 max_retry_interval: float = 30.0):
+        self.window_size = window_size
+        self.max_conversations = max_conversations
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.max_buffer = max_buffer
+        self.max_retry_interval = max_retry_interval
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_failures = 0
+        self._retry_at = 0.0
+        self._windows: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.flushed_rows = 0
+        self.flush_batches = 0
+        self.flush_errors = 0
+        self.dropped_rows = 0
+
+        self._async_session_factory = None
+        try:
+            from .database import SessionLocal, engine
+            Base.metadata.create_all(bind=engine)
+            migrate_chat_history(engine)
+            self._session_factory = SessionLocal
+        except Exception as e:
+            print(f"Chat history will not be persisted: {e}")
+            self._session_factory = None
+        else:
+            # Request-path reads go through the pooled async engine when its driver is installed
+            try:
+                from .database import AsyncSessionLocal, get_async_engine
+                get_async_engine()
+                self._async_session_factory = AsyncSessionLocal
+            except Exception as e:
+                print(f"Chat history reads will use the sync engine: {e}")
+
+        self._thread = None
+        if self._session_factory is not None:
+            self._thread = threading.Thread(target=self._flush_loop, name="chat-history-flush", daemon=True)
+            self._thread.start()
+
+    @property
+    def persistent(self) -> bool:
+        return self._session_factory is not None
+
+    def _window(self, conversation_id: str) -> Optional[deque]:
+        window = self._windows.get(conversation_id)
+        if window is not None:
+            self._windows.move_to_end(conversation_id)
+        return window
+
+    def _remember(self, conversation_id: str, messages: List[Dict[str, str]]) -> deque:
+        window = deque(messages[-self.window_size:], maxlen=self.window_size)
+        self._windows[conversation_id] = window
+        self._windows.move_to_end(conversation_id)
+        while len(self._windows) > self.max_conversations:
+            self._windows.popitem(last=False)
+        return window
+
+    def append(self, conversation_id: str, role: str, content: str, user_id: Optional[str] = None):
+        """Record a message; returns immediately and is persisted by the next flush"""
+        with self._lock:
+            window = self._window(conversation_id)
+            if window is None:
+                window = self._remember(conversation_id, [])
+            window.append({"role": role, "content": content})
+            if self.persistent:
+                self._buffer.append({
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "role": role,
+                    "message": content,
+                    "timestamp": datetime.utcnow(),
+                })
+                self._trim_buffer()
+                if len(self._buffer) >= self.flush_batch_size:
+                    self._wake.set()
+
+    def _trim_buffer(self):
+        """Drop the oldest unwritten messages beyond max_buffer (caller holds _lock)"""
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped_rows += overflow
+
+    def _cached_window(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            window = self._window(conversation_id)
+            return list(window) if window is not None else None
+
+    def _recent_query(self, conversation_id: str):
+        return (
+            select(ChatHistory.role, ChatHistory.message)
+            .where(ChatHistory.conversation_id == conversation_id)
+            .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+            .limit(self.window_size)
+        )
+
+    def _load_window(self, conversation_id: str, rows) -> List[Dict[str, str]]:
+        messages = [{"role": role, "content": message} for role, message in reversed(rows)]
+        with self._lock:
+            # A concurrent append may have created the window meanwhile
+            if conversation_id not in self._windows:
+                self._remember(conversation_id, messages)
+            return list(self._windows[conversation_id])
+
+    def recent_messages(self, conversation_id: str) -> List[Dict[str, str]]:
+        """
+        The last `window_size` messages of a conversation, oldest first.
+        Blocking on a cache miss; async code should use recent_messages_async.
+        """
+        cached = self._cached_window(conversation_id)
+        if cached is not None or not self.persistent:
+            return cached or []
+
+        self.flush()
+        with self._session_factory() as session:
+            rows = session.execute(self._recent_query(conversation_id)).all()
+        return self._load_window(conversation_id, rows)
+
+    async def recent_messages_async(self, conversation_id: str) -> List[Dict[str, str]]:
+        """recent_messages without blocking the event loop"""
+        if self._async_session_factory is None:
+            return await asyncio.to_thread(self.recent_messages, conversation_id)
+        cached = self._cached_window(conversation_id)
+        if cached is not None:
+            return cached
+
+        await self._flush_pending()
+        async with self._async_session_factory() as session:
+            rows = (await session.execute(self._recent_query(conversation_id))).all()
+        return self._load_window(conversation_id, rows)
+
+    def _history_query(self, conversation_id: str, before: Optional[str], limit: int):
+        query = select(ChatHistory).where(ChatHistory.conversation_id == conversation_id)
+        if before:
+            timestamp, row_id = parse_history_cursor(before)
+            query = query.where(or_(
+                ChatHistory.timestamp < timestamp,
+                and_(ChatHistory.timestamp == timestamp, ChatHistory.id < row_id)
+            ))
+        return query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit + 1)
+
+    @staticmethod
+    def _history_page(rows, limit: int) -> Dict[str, Any]:
+        page = rows[:limit]
+        next_before = f"{page[-1].timestamp.isoformat()}_{page[-1].id}" if len(rows) > limit else None
+        return {
+            "history": [
+                {
+                    "id": row.id,
+                    "conversation_id": row.conversation_id,
+                    "role": row.role,
+                    "content": row.message,
+                    "timestamp": row.timestamp.isoformat(),
+                }
+                for row in page
+            ],
+            "next_before": next_before,
+        }
+
+    def history(self, conversation_id: str, before: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        One page of a conversation's messages, newest first, using keyset
+        pagination on (timestamp, id). Pass the returned `next_before` to get
+        the next page; a malformed `before` raises ValueError. Reads are
+        scoped to a conversation, never to a user: its random ID is what a
+        caller must hold to read it.
+        """
+        if before:
+            parse_history_cursor(before)
+        if not self.persistent:
+            return {"history": [], "next_before": None}
+
+        self.flush()
+        with self._session_factory() as session:
+            rows = session.execute(self._history_query(conversation_id, before, limit)).scalars().all()
+        return self._history_page(rows, limit)
+
+    async def history_async(self, conversation_id: str, before: Optional[str] = None,
+                            limit: int = 50) -> Dict[str, Any]:
+        """history without blocking the event loop"""
+        if before:
+            parse_history_cursor(before)
+        if self._async_session_factory is None:
+            return await asyncio.to_thread(self.history, conversation_id, before, limit)
+
+        await self._flush_pending()
+        async with self._async_session_factory() as session:
+            rows = (await session.execute(self._history_query(conversation_id, before, limit))).scalars().all()
+        return self._history_page(rows, limit)
+
+    def ping(self):
+        """Round trip to the database (raises if it is unreachable)"""
+        with self._session_factory() as session:
+            session.execute(text("SELECT 1"))
+
+    async def ping_async(self) -> Dict[str, Any]:
+        """ping without blocking the event loop; opens a pooled connection on first use"""
+        if not self.persistent:
+            return {"persistent": False}
+        if self._async_session_factory is None:
+            await asyncio.to_thread(self.ping)
+        else:
+            async with self._async_session_factory() as session:
+                await session.execute(text("SELECT 1"))
+        return {"persistent": True, "buffered_rows": len(self._buffer)}
+
+    async def _flush_pending(self):
+        # Reads must see buffered writes; the flush itself is sync, so keep it off the loop
+        if self._buffer:
+            await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        """Write all buffered messages in one batch insert"""
+        if not self.persistent:
+            return
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            try:
+                with self._session_factory() as session:
+                    session.execute(insert(ChatHistory), rows)
+                    session.commit()
+            except IntegrityError:
+                # e.g. an unknown user_id; keep the rest of the batch
+                self._insert_individually(rows)
+            except Exception as e:
+                self._flush_failures += 1
+                self.flush_errors += 1
+                retry_in = min(self.max_retry_interval, self.flush_interval * 2 ** self._flush_failures)
+                self._retry_at = time.monotonic() + retry_in
+                with self._lock:
+                    self._buffer = rows + self._buffer
+                    self._trim_buffer()
+                    buffered = len(self._buffer)
+                print(f"Error flushing chat history ({buffered} messages buffered), retrying in {retry_in:.1f}s: {e}")
+                return
+            self._flush_failures = 0
+            self._retry_at = 0.0
+            self.flushed_rows += len(rows)
+            self.flush_batches += 1
+
+    def _insert_individually(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            try:
+                with self._session_factory() as session:
+                    session.execute(insert(ChatHistory), [row])
+                    session.commit()
+            except Exception as e:
+                print(f"Dropping chat history row for conversation {row['conversation_id']}: {e}")
+                self.dropped_rows += 1
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # Back off while the database is failing, however full the buffer gets
+            delay = self._retry_at - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            self.flush()
+
+    def close(self):
+        """Stop the background flusher and write what is left"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    async def aclose(self):
+        """close() off the event loop, then release the async connection pool"""
+        await asyncio.to_thread(self.close)
+        if self._async_session_factory is not None:
+            from .database import dispose_async_engine
+            await dispose_async_engine()
+
+    def pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Connection pool utilization, or None when history is memory-only"""
+        if not self.persistent:
+            return None
+        from .database import pool_stats
+        return pool_stats()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "persistent": self.persistent,
+                "buffered_rows": len(self._buffer),
+                "flushed_rows": self.flushed_rows,
+                "flush_batches": self.flush_batches,
+                "flush_errors": self.flush_errors,
+                "dropped_rows": self.dropped_rows,
+                "cached_conversations": len(self._windows),
+            }
+
+def create_chat_history_store() -> ChatHistoryStore:
+    """Build the store from CHAT_HISTORY_* environment settings"""
+    return ChatHistoryStore(
+        window_size=int(os.getenv("CHAT_HISTORY_WINDOW", "10")),
+        max_conversations=int(os.getenv("CHAT_HISTORY_MAX_CONVERSATIONS", "10000")),
+        flush_interval=float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "0.5")),
+        flush_batch_size=int(os.getenv("CHAT_HISTORY_FLUSH_BATCH_SIZE", "500")),
+        max_buffer=int(os.getenv("CHAT_HISTORY_MAX_BUFFER", "10000")),
+        max_retry_interval=float(os.getenv("CHAT_HISTORY_MAX_RETRY_INTERVAL", "30"))
+    )
+
+# Global chat history store instance, created on first use
+chat_history_store = Lazy(create_chat_history_store, "chat_history_store")
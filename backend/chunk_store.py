@@ -0,0 +1,78 @@
+import os
+import zlib
+import sqlite3
+import functools
+import threading
+from typing import List, Dict, Any, Optional
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+class ChunkStore:
+    """
+    Chunk text kept out of the vector index.
+
+    With a chunk store, Qdrant payloads and the local index hold only the
+    metadata needed for filtering and citing (chapter, section, source,
+    chunk_index, content_hash); the text is zlib-compressed in a SQLite
+    table keyed by point ID and read back only for the final top-k.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, content BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def put_many(self, chunks: List[Dict[str, Any]]):
+        """Store the content of chunk records carrying an "id" """
+        rows = [(str(chunk["id"]), zlib.compress(chunk["content"].encode("utf-8"))) for chunk in chunks]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO chunks (id, content) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, point_ids: List[Any]) -> Dict[str, str]:
+        """Content by point ID (as str); IDs missing from the store are left out"""
+        keys = list(dict.fromkeys(str(point_id) for point_id in point_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT id, content FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((point_id, zlib.decompress(blob).decode("utf-8")) for point_id, blob in rows)
+            self.lookups += len(keys)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def delete_many(self, point_ids: List[Any]):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(str(point_id),) for point_id in point_ids])
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, stored_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM chunks"
+            ).fetchone()
+            return {"chunks": count, "stored_bytes": stored_bytes, "lookups": self.lookups, "misses": self.misses}
+
+@functools.lru_cache(maxsize=None)
+def get_chunk_store() -> Optional[ChunkStore]:
+    """
+    The process-wide chunk store, or None when CHUNK_STORE_PATH is unset and
+    chunk text stays in the vector payloads.
+    """
+    path = os.getenv("CHUNK_STORE_PATH", "")
+    if not path:
+        return None
+    return ChunkStore(path)
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Optional
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream dependency.
+
+    After `failure_threshold` failures in a row the breaker opens and calls
+    fail immediately with CircuitOpenError instead of waiting for the
+    upstream to time out or rate limit again. After `reset_seconds` (or the
+    upstream's Retry-After, if longer) it lets a single probe call through
+    (half-open): success closes it, failure opens it again. Callers must
+    end every allowed call with record_success(), record_failure() or, if
+    it was cancelled, release(); otherwise a half-open probe is never
+    given back. A threshold of 0 disables the breaker.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() >= self._open_until:
+                return self.HALF_OPEN
+            return self._state
+
+    def available(self) -> bool:
+        """Whether a call would be let through now (without claiming the half-open probe)"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            return not self._probing and time.monotonic() >= self._open_until
+
+    def allow(self) -> bool:
+        """Claim permission for one call; False means fail fast"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._probing or time.monotonic() < self._open_until:
+                self.rejected += 1
+                return False
+            self._state, self._probing = self.HALF_OPEN, True
+            return True
+
+    def check(self):
+        """allow() that raises CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+    def release(self):
+        """End a call without an outcome (cancelled): a half-open probe it held goes to the next call"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state, self._failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self._failures += 1
+            if not self.failure_threshold:
+                return
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                    print(f"{self.name} circuit breaker opened after {self._failures} failures")
+                self._state, self._probing = self.OPEN, False
+                self._open_until = time.monotonic() + max(self.reset_seconds, retry_after or 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "open": int(state != self.CLOSED),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The Retry-After hint of an HTTP error response, if any"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def create_circuit_breaker(name: str) -> CircuitBreaker:
+    """Build a breaker from BREAKER_FAILURE_THRESHOLD / BREAKER_RESET_SECONDS"""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+        reset_seconds=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    )
@@ -0,0 +1,10 @@
+import functools
+from dotenv import load_dotenv
+
+@functools.lru_cache(maxsize=None)
+def load_environment() -> bool:
+    """
+    Load .env into the process environment, once per process. Every module
+    calls this before reading its settings; only the first call reads the file.
+    """
+    return load_dotenv()
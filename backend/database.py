@@ -1,31 +1,149 @@
 import os
+from typing import Any, Dict, Tuple
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from .config import load_environment
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
-# Get database URL from environment variables
+# Get database URL from environment variables (checked when the engine is first needed)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is required")
+def require_database_url() -> str:
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable is required")
+    return DATABASE_URL
 
-# Create engine
-engine = create_engine(DATABASE_URL)
+# Async drivers used for the request path, keyed by the sync driver's backend name
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_options(url: str) -> Dict[str, Any]:
+    """Pool settings from DB_POOL_* environment variables"""
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    # In-memory SQLite uses a single shared connection, which has no pool to size
+    if make_url(url).database not in (None, "", ":memory:"):
+        options.update({
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        })
+    return options
+
+def async_database_url(url: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Rewrite a sync DATABASE_URL for its async driver. asyncpg does not
+    understand libpq's sslmode/channel_binding query parameters (Neon URLs
+    carry both), so sslmode is translated into the `ssl` connect argument.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    connect_args = {}
+    if backend == "postgresql":
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        url = url.set(query=query)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = "require" if sslmode in ("allow", "prefer", "require") else "verify-full"
+    return url.render_as_string(hide_password=False), connect_args
+
+# Sync engine (scripts and the chat history writer thread) and its session
+# factory, created on first use: `from .database import engine, SessionLocal`
+# resolves them through __getattr__ below, so importing this module never
+# needs DATABASE_URL or a database driver
+_engine = None
+_session_factory = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        url = require_database_url()
+        _engine = create_engine(url, **pool_options(url))
+    return _engine
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _session_factory
+
+def __getattr__(name: str):
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Async engine for request handlers, created on first use so scripts don't need the async driver
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        url, connect_args = async_database_url(require_database_url())
+        _async_engine = create_async_engine(url, connect_args=connect_args, **pool_options(DATABASE_URL))
+    return _async_engine
+
+def AsyncSessionLocal():
+    """Open an AsyncSession on the pooled async engine"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        _async_session_factory = sessionmaker(
+            bind=get_async_engine(), class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory()
+
+async def dispose_async_engine():
+    """Close pooled async connections (call on application shutdown)"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+def _pool_stats(pool) -> Dict[str, Any]:
+    stats = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    if "size" in stats and "checkedout" in stats:
+        # Above 1.0 means overflow connections are in use
+        stats["utilization"] = round(stats["checkedout"] / max(stats["size"], 1), 3)
+    return stats
+
+def pool_stats() -> Dict[str, Any]:
+    """Checked-out/idle connection counts for the sync and async pools"""
+    return {
+        "sync": _pool_stats(_engine.pool) if _engine is not None else None,
+        "async": _pool_stats(_async_engine.sync_engine.pool) if _async_engine is not None else None,
+    }
 
 # Create base class for models
 Base = declarative_base()
 
 def get_db():
-    """Dependency to get DB session"""
-    db = SessionLocal()
+    """Dependency to get DB session (sync; runs in FastAPI's threadpool)"""
+    db = get_session_factory()()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Dependency to get an async DB session for async endpoints"""
+    async with AsyncSessionLocal() as db:
+        yield db
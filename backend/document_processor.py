@@ -1,11 +1,13 @@
-import os
-import re
 from typing import List, Dict, Any
 from .openai_client import openai_manager
+from .markdown_chunker import create_markdown_chunker
+from .lazy import Lazy
+from .metrics import DOCUMENT_SECONDS, DOCUMENT_CHUNKS
 
 class DocumentProcessor:
     def __init__(self):
-        pass
+        # Heading-aware, token-budgeted chunker for markdown files
+        self.markdown_chunker = create_markdown_chunker()
     
     def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
         """
@@ -38,72 +40,89 @@ class DocumentProcessor:
             if chunk:  # Only add non-empty chunks
                 chunks.append(chunk)
             
-            # Move start position (with overlap)
-            start = end - overlap
+            # Stop once the end of the text has been chunked
+            if end >= len(text):
+                break
+            
+            # Move start position (with overlap), always making progress
+            start = max(end - overlap, start + 1)
         
         return chunks
     
-    def process_document(self, content: str, source: str = "", chapter: str = "", section: str = "") -> List[Dict[str, Any]]:
+    def build_chunk_records(self, content: str, source: str = "", chapter: str = "", section: str = "") -> List[Dict[str, Any]]:
         """
-        Process a document by chunking it and generating embeddings for each chunk.
+        Chunk a document into records without embeddings.
         """
-        # Chunk the text
-        text_chunks = self.chunk_text(content)
-        
-        # Process each chunk
-        processed_chunks = []
-        for i, chunk in enumerate(text_chunks):
+        with DOCUMENT_SECONDS.time("chunk"):
+            chunks = self.chunk_text(content)
+        DOCUMENT_CHUNKS.inc(amount=len(chunks))
+        return [
+            {
+                "content": chunk,
+                "source": source,
+                "chapter": chapter,
+                "section": section,
+                "chunk_index": i
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+    
+    def embed_chunk_records(self, chunk_records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Attach embeddings to chunk records, sending them to OpenAI in batches.
+        Records from a failed batch are dropped.
+        """
+        texts = [record["content"] for record in chunk_records]
+        embedded = []
+        for batch in openai_manager.batch_texts(texts):
             try:
-                # Generate embedding
-                embedding = openai_manager.generate_embedding(chunk)
-                
-                # Create chunk record
-                chunk_record = {
-                    "content": chunk,
-                    "embedding": embedding,
-                    "source": source,
-                    "chapter": chapter,
-                    "section": section,
-                    "chunk_index": i
-                }
-                
-                processed_chunks.append(chunk_record)
+                with DOCUMENT_SECONDS.time("embed"):
+                    embeddings = openai_manager.generate_embeddings_with_retry([texts[i] for i in batch])
             except Exception as e:
-                print(f"Error processing chunk {i}: {e}")
+                print(f"Error embedding chunks {batch[0]}-{batch[-1]}: {e}")
                 continue
-        
-        return processed_chunks
+            for i, embedding in zip(batch, embeddings):
+                embedded.append({**chunk_records[i], "embedding": embedding})
+        return embedded
     
-    def process_markdown_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def process_document(self, content: str, source: str = "", chapter: str = "", section: str = "") -> List[Dict[str, Any]]:
+        """
+        Process a document by chunking it and generating embeddings for each chunk.
+        """
+        chunk_records = self.build_chunk_records(content, source, chapter, section)
+        return self.embed_chunk_records(chunk_records)
+    
+    def process_markdown_file(self, file_path: str, embed: bool = True,
+                              raise_errors: bool = False) -> List[Dict[str, Any]]:
         """
-        Process a markdown file and extract chapter/section information.
+        Process a markdown file into chunks tagged with their chapter and section.
+        With embed=False the chunk records are returned without embeddings so
+        the caller can batch embedding requests across files. Errors are logged
+        and give no chunks, unless `raise_errors` (ingestion must not take an
+        unreadable file for an empty one).
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Extract chapter title from filename or first heading
-            filename = os.path.basename(file_path)
-            chapter_title = os.path.splitext(filename)[0]
-            
-            # Try to extract chapter title from first heading
-            first_heading_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
-            if first_heading_match:
-                chapter_title = first_heading_match.group(1)
-            
-            # Extract section headings
-            section_headings = re.findall(r'^##\s+(.+)$', content, re.MULTILINE)
-            
-            # Process the content
-            return self.process_document(
-                content=content,
-                source=file_path,
-                chapter=chapter_title,
-                section=", ".join(section_headings) if section_headings else ""
-            )
+            # Stream the file through the markdown chunker; each chunk carries
+            # its own chapter and section path
+            with DOCUMENT_SECONDS.time("chunk"):
+                chunk_records = [
+                    {
+                        "content": chunk["content"],
+                        "source": file_path,
+                        "chapter": chunk["chapter"],
+                        "section": chunk["section"],
+                        "heading_path": chunk["heading_path"],
+                        "chunk_index": i
+                    }
+                    for i, chunk in enumerate(self.markdown_chunker.chunk_file(file_path))
+                ]
+            DOCUMENT_CHUNKS.inc(amount=len(chunk_records))
+            return self.embed_chunk_records(chunk_records) if embed else chunk_records
         except Exception as e:
             print(f"Error processing markdown file {file_path}: {e}")
+            if raise_errors:
+                raise
             return []
 
-# Global document processor instance
-document_processor = DocumentProcessor()
\ No newline at end of file
+# Global document processor instance, created on first use
+document_processor = Lazy(DocumentProcessor, "document_processor")
\ No newline at end of file
@@ -0,0 +1,96 @@
+import os
+import asyncio
+from typing import List, Dict, Any, Awaitable, Callable, Tuple
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched calls.
+
+    The first request after an idle period opens a window of `window_ms`;
+    everything that arrives before it closes (or until `max_batch` texts are
+    waiting) is sent as one call to `embed_many`, and each caller gets its own
+    vector back. Identical texts in a batch are embedded once. A window of 0
+    disables coalescing.
+    """
+
+    def __init__(self, embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 window_ms: float = 5.0, max_batch: int = 64):
+        self.embed_many = embed_many
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer = None
+        # The loop only keeps weak references to tasks, so in-flight sends are held here
+        self._sending = set()
+        self.requests = 0
+        self.calls = 0
+        self.texts_sent = 0
+
+    async def embed(self, text: str) -> List[float]:
+        self.requests += 1
+        if self.window_ms <= 0:
+            self.calls += 1
+            self.texts_sent += 1
+            return (await self.embed_many([text]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000.0, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.calls += 1
+        self.texts_sent += len(texts)
+        try:
+            embeddings = await self.embed_many(texts)
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} query embeddings, got {len(embeddings)}")
+            vectors = dict(zip(texts, embeddings))
+            for text, future in batch:
+                # Callers that were cancelled (e.g. client disconnected) are skipped
+                if not future.done():
+                    future.set_result(vectors[text])
+        except BaseException as e:
+            # Callers must not wait forever, also when the send is cancelled (e.g. at shutdown)
+            error = e if isinstance(e, Exception) else RuntimeError("Query embedding batch was cancelled")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            if not isinstance(e, Exception):
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_ms,
+            "requests": self.requests,
+            "calls": self.calls,
+            "texts_sent": self.texts_sent,
+            "mean_batch_size": round(self.texts_sent / self.calls, 2) if self.calls else 0.0,
+        }
+
+def create_embedding_batcher(embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]) -> EmbeddingBatcher:
+    """Build the batcher from QUERY_EMBEDDING_* environment settings"""
+    return EmbeddingBatcher(
+        embed_many,
+        window_ms=float(os.getenv("QUERY_EMBEDDING_WINDOW_MS", "5")),
+        max_batch=int(os.getenv("QUERY_EMBEDDING_MAX_BATCH", "64"))
+    )
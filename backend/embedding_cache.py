@@ -0,0 +1,182 @@
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+def text_hash(text: str) -> str:
+    """SHA-256 hex digest used as the cache key for a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache keyed by (model, sha256(text)).
+
+    An in-process LRU bounded by total vector bytes sits in front of a
+    SQLite table of float32 blobs, so vectors survive restarts and are
+    shared between ingestion runs and the chat server.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+        self._memory_bytes = 0
+        # _lock guards the LRU and counters and is never held during SQLite I/O (_db_lock)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                    "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Embedding cache disabled for {path}: {e}")
+                self._db = None
+
+    def _remember(self, key: Tuple[str, str], vector: array):
+        """Insert into the LRU, evicting least recently used vectors past the byte budget"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        size = vector.itemsize * len(vector)
+        if size > self.max_memory_bytes:
+            return
+        self._memory[key] = vector
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.itemsize * len(evicted)
+
+    def _memory_lookup(self, model: str, texts: List[str]) -> Tuple[Dict[int, List[float]], Dict[str, List[int]]]:
+        """Vectors found in the LRU, and the indices of the rest by text hash"""
+        found = {}
+        disk_lookups = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = (model, text_hash(text))
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector.tolist()
+                    self.hits += 1
+                else:
+                    disk_lookups.setdefault(key[1], []).append(i)
+        return found, disk_lookups
+
+    def _disk_lookup(self, model: str, disk_lookups: Dict[str, List[int]], found: Dict[int, List[float]]):
+        """Fill `found` from SQLite, promoting hits into the LRU; counts the remaining misses"""
+        if self._db is not None:
+            hashes = list(disk_lookups)
+            try:
+                with self._db_lock:
+                    rows = []
+                    for start in range(0, len(hashes), 500):
+                        chunk = hashes[start:start + 500]
+                        rows.extend(self._db.execute(
+                            f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                            f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                            [model, *chunk]
+                        ).fetchall())
+            except sqlite3.Error as e:
+                print(f"Error reading embedding cache: {e}")
+                rows = []
+            with self._lock:
+                for hash_value, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    self._remember((model, hash_value), vector)
+                    for i in disk_lookups.pop(hash_value):
+                        found[i] = vector.tolist()
+                        self.disk_hits += 1
+        with self._lock:
+            self.misses += sum(len(indices) for indices in disk_lookups.values())
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Return cached vectors for the given texts, keyed by index in `texts`"""
+        found, disk_lookups = self._memory_lookup(model, texts)
+        if disk_lookups:
+            self._disk_lookup(model, disk_lookups, found)
+        return found
+
+    async def get_many_async(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """get_many for the event loop: LRU hits are served inline, SQLite is read in a worker thread"""
+        found, disk_lookups = self._memory_lookup(model, texts)
+        if disk_lookups:
+            if self._db is None:
+                self._disk_lookup(model, disk_lookups, found)
+            else:
+                await asyncio.to_thread(self._disk_lookup, model, disk_lookups, found)
+        return found
+
+    def _remember_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> List[Tuple[str, str, bytes]]:
+        """Put vectors in the LRU; returns their SQLite rows"""
+        rows = []
+        with self._lock:
+            for text, values in zip(texts, vectors):
+                key = (model, text_hash(text))
+                vector = array("f", values)
+                self._remember(key, vector)
+                rows.append((model, key[1], vector.tobytes()))
+        return rows
+
+    def _write(self, rows: List[Tuple[str, str, bytes]]):
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    rows
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing embedding cache: {e}")
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Store freshly generated vectors in memory and on disk"""
+        rows = self._remember_many(model, texts, vectors)
+        if rows and self._db is not None:
+            self._write(rows)
+
+    async def put_many_async(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """put_many for the event loop: the SQLite write and commit run in a worker thread"""
+        rows = self._remember_many(model, texts, vectors)
+        if rows and self._db is not None:
+            await asyncio.to_thread(self._write, rows)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+def create_embedding_cache() -> EmbeddingCache:
+    """Build the cache from environment settings (EMBEDDING_CACHE_PATH="" keeps it in memory only)"""
+    path = os.getenv(
+        "EMBEDDING_CACHE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache.sqlite3")
+    )
+    max_memory_mb = float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))
+    return EmbeddingCache(path=path or None, max_memory_bytes=int(max_memory_mb * 1024 * 1024))
@@ -1,71 +1,504 @@
 #!/usr/bin/env python3
 """
 Script to ingest textbook content into Qdrant for RAG functionality.
+
+Run from the project root so the backend package imports resolve:
+
+    python -m backend.ingest_textbook [docs_directory] [--concurrency N] [--batch-size N] [--full]
+                                      [--workers N] [--local-index DIR] [--skip-qdrant] [--questions]
+
+Ingestion is incremental by default: every chunk gets a point ID derived from
+its source path and content hash, and a local manifest records what is already
+indexed, so only new or changed chunks are embedded and orphaned points are
+deleted. Pass --full to re-embed everything and prune the whole collection.
+
+Files are chunked in a process pool and embedded batches are upserted as
+soon as they are ready. Progress is checkpointed in the manifest, so an
+interrupted run picks up where it stopped. Points of a file that could not
+be read, or whose changed chunks failed to embed or upsert, are kept until
+a run succeeds for it; a file that could not be read also leaves the BM25,
+local and question indexes as they were.
+
+--local-index DIR also writes the in-process vector index used when
+RETRIEVAL_BACKEND=local; add --skip-qdrant to build only that index. The
+BM25 index used by RETRIEVAL_MODE=hybrid is rebuilt on every run.
+
+--questions also generates the question index: likely questions per chunk
+and overview questions per page, with answers grounded in that text, which
+/chat serves without a completion call. Like embeddings, questions are
+only generated for new or changed chunks; runs without --questions drop the
+questions of changed chunks from an existing index.
 """
 
+import argparse
+import json
 import os
 import sys
-from pathlib import Path
+import time
+import itertools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Iterator
+
+from .document_processor import document_processor
+from .openai_client import openai_manager
+from .qdrant_client import qdrant_manager, chunk_point_id, content_hash, INGEST_MANIFEST_PATH
+from .retrieval import LocalVectorIndex, LOCAL_INDEX_PATH
+from .lexical_index import LexicalIndex, LEXICAL_INDEX_PATH
+from .chunk_store import get_chunk_store
+from .question_index import QuestionIndex, QUESTION_INDEX_PATH
+
+def load_manifest(manifest_path: str, collection_name: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the point manifest for a collection. A missing, unreadable or
+    foreign-collection manifest yields an empty one.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
 
-# Add the backend directory to the Python path
-backend_path = Path(__file__).parent
-sys.path.append(str(backend_path))
+    if manifest.get("collection") != collection_name:
+        return {}
+    return manifest.get("points", {})
 
-from document_processor import document_processor
-from qdrant_client import qdrant_manager
+def save_manifest(manifest_path: str, collection_name: str, points: Dict[str, Dict[str, Any]]):
+    """Atomically write the point manifest"""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"collection": collection_name, "points": points}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
 
-def ingest_textbook_content(docs_directory: str):
+def assign_point_ids(chunks: List[Dict[str, Any]], docs_directory: str) -> List[Dict[str, Any]]:
+    """
+    Give each chunk a content hash, a stable point ID and its doc path (the
+    path relative to the docs directory, which scoped retrieval filters on).
+    IDs use the doc path so they survive moving the checkout.
     """
-    Ingest all markdown files from the docs directory into Qdrant.
+    for chunk in chunks:
+        doc_path = os.path.relpath(chunk["source"], docs_directory).replace(os.sep, "/")
+        chunk["content_hash"] = content_hash(chunk["content"])
+        chunk["id"] = chunk_point_id(doc_path, chunk["content"])
+        chunk["doc_path"] = doc_path
+    return chunks
+
+def embed_chunks_concurrently(chunks: List[Dict[str, Any]], concurrency: int = 4) -> List[Dict[str, Any]]:
+    """
+    Embed chunk records in batches, keeping up to `concurrency` batch
+    requests in flight. Each batch retries with backoff on rate limits;
+    chunks from a batch that still fails are dropped.
+    """
+    texts = [chunk["content"] for chunk in chunks]
+    batches = openai_manager.batch_texts(texts)
+    embeddings: List[Any] = [None] * len(chunks)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(openai_manager.generate_embeddings_with_retry, [texts[i] for i in batch]): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                for i, embedding in zip(batch, future.result()):
+                    embeddings[i] = embedding
+            except Exception as e:
+                print(f"Error embedding batch of {len(batch)} chunks: {e}")
+
+    return [
+        {**chunk, "embedding": embedding}
+        for chunk, embedding in zip(chunks, embeddings)
+        if embedding is not None
+    ]
+
+def chunk_markdown_file(file_path: str):
+    """Chunk one markdown file in a worker process; returns (chunks, seconds)"""
+    started = time.perf_counter()
+    chunks = document_processor.process_markdown_file(file_path, embed=False, raise_errors=True)
+    return chunks, time.perf_counter() - started
+
+def find_markdown_files(docs_directory: str) -> List[str]:
+    files = []
+    for root, dirs, names in os.walk(docs_directory):
+        for name in sorted(names):
+            if name.endswith('.md'):
+                files.append(os.path.join(root, name))
+    return files
+
+class StageStats:
+    """Item count and busy time of one pipeline stage"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.seconds = 0.0
+
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.seconds += seconds
+
+    def report(self) -> str:
+        rate = self.items / self.seconds if self.seconds else 0.0
+        return f"  {self.name:10s} {self.items:7d} {self.unit:7s} in {self.seconds:7.2f}s ({rate:,.0f} {self.unit}/s)"
+
+class IngestionPipeline:
+    """
+    Streaming ingestion: files are chunked in a process pool, new or changed
+    chunks are embedded in batches with up to `concurrency` requests in
+    flight, and each embedded batch is upserted to Qdrant as soon as it is
+    ready. For the whole run only each chunk's ID, doc path and content hash
+    are held in memory; the chunk records go to a temporary spool file that
+    the index writers stream back (iter_chunks). Text and embeddings are
+    held only between a file's chunking and its batch's upsert.
+
+    The manifest doubles as the checkpoint: it is saved every
+    `checkpoint_seconds` with every upserted chunk, so an interrupted run
+    resumes with the chunks that are still missing.
+
+    Files that fail (unreadable, or with a batch that failed to embed or
+    upsert) are recorded in `failed_files`; their old points are not
+    deleted as orphans, and a --full run with failures prunes nothing.
+    """
+
+    def __init__(self, docs_directory: str, concurrency: int = 4, workers: int = None, full: bool = False,
+                 manifest_path: str = INGEST_MANIFEST_PATH, skip_qdrant: bool = False,
+                 checkpoint_seconds: float = 5.0):
+        self.docs_directory = docs_directory
+        self.concurrency = max(1, concurrency)
+        self.workers = workers or os.cpu_count() or 1
+        self.full = full
+        self.manifest_path = manifest_path
+        self.skip_qdrant = skip_qdrant
+        self.checkpoint_seconds = checkpoint_seconds
+
+        self.collection_name = None if skip_qdrant else qdrant_manager.collection_name
+        self.manifest = {} if full or skip_qdrant else load_manifest(manifest_path, self.collection_name)
+        self.indexed = dict(self.manifest)
+        self.current: Dict[str, Dict[str, str]] = {}
+        self.spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.pending: List[Dict[str, Any]] = []
+        self.failed_chunks = 0
+        # Doc paths of files that could not be read, or had chunks fail to embed or upsert
+        self.failed_files = set()
+        self.unreadable_files = 0
+        self.manifest_dirty = False
+        self.last_checkpoint = time.monotonic()
+
+        self.stats = {
+            "chunk": StageStats("chunk", "files"),
+            "embed": StageStats("embed", "chunks"),
+            "upsert": StageStats("upsert", "points"),
+            "delete": StageStats("delete", "points"),
+        }
+
+    def run(self) -> bool:
+        files = find_markdown_files(self.docs_directory)
+        if not files:
+            print("No content to ingest.")
+            return False
+
+        started = time.perf_counter()
+        embed_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        in_flight = {}
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(files))) as chunk_executor:
+                futures = {chunk_executor.submit(chunk_markdown_file, file_path): file_path for file_path in files}
+                progress_every = max(1, len(files) // 10)
+                for done, future in enumerate(as_completed(futures), start=1):
+                    try:
+                        chunks, seconds = future.result()
+                    except Exception as e:
+                        print(f"Skipping {futures[future]}: {e}")
+                        self.failed_files.add(self._doc_path(futures[future]))
+                        self.unreadable_files += 1
+                        continue
+                    self.stats["chunk"].add(1, seconds)
+                    self._add_chunks(chunks)
+                    if done % progress_every == 0 or done == len(files):
+                        print(f"Chunked {done}/{len(files)} files: {len(self.current)} chunks, "
+                              f"{self.stats['upsert'].items} upserted")
+                    self._submit_ready_batches(embed_executor, in_flight, final=False)
+
+            self._submit_ready_batches(embed_executor, in_flight, final=True)
+            while in_flight:
+                self._drain(in_flight, return_when=FIRST_COMPLETED)
+        finally:
+            embed_executor.shutdown(wait=True)
+            if not self.skip_qdrant:
+                self._checkpoint(force=True)
+
+        if not self.current:
+            print("No content to ingest.")
+            return False
+
+        deleted = self.skip_qdrant or self._delete_orphans()
+        self.elapsed = time.perf_counter() - started
+        return deleted and not self.failed_chunks and not self.failed_files
+
+    def _doc_path(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.docs_directory).replace(os.sep, "/")
+
+    def _add_chunks(self, chunks: List[Dict[str, Any]]):
+        """Register a file's chunks and queue those not yet indexed"""
+        for chunk in assign_point_ids(chunks, self.docs_directory):
+            # Identical chunks within a file collapse onto the same point
+            if chunk["id"] in self.current:
+                continue
+            self.current[chunk["id"]] = {"doc_path": chunk["doc_path"], "content_hash": chunk["content_hash"]}
+            self.spool.write(json.dumps(chunk) + "\n")
+            if not self.skip_qdrant and chunk["id"] not in self.manifest:
+                self.pending.append(chunk)
+
+    def iter_chunks(self) -> Iterator[Dict[str, Any]]:
+        """Stream this run's chunk records back from the spool, in chunking order"""
+        self.spool.flush()
+        self.spool.seek(0)
+        for line in self.spool:
+            yield json.loads(line)
+
+    def close(self):
+        """Delete the spool file"""
+        self.spool.close()
+
+    def _submit_ready_batches(self, executor, in_flight, final: bool):
+        """Send full embedding batches (all remaining ones if final), keeping the in-flight bound"""
+        if not self.pending:
+            return
+        batches = openai_manager.batch_texts([chunk["content"] for chunk in self.pending])
+        # Hold back the last partial batch until more chunks arrive
+        if not final and len(batches[-1]) < openai_manager.embedding_batch_size:
+            batches = batches[:-1]
+        submitted = 0
+        for batch in batches:
+            while len(in_flight) >= self.concurrency:
+                self._drain(in_flight, return_when=FIRST_COMPLETED)
+            chunks = [self.pending[i] for i in batch]
+            future = executor.submit(self._embed_batch, chunks)
+            in_flight[future] = chunks
+            submitted += len(batch)
+        self.pending = self.pending[submitted:]
+
+    def _embed_batch(self, chunks: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        embeddings = openai_manager.generate_embeddings_with_retry([chunk["content"] for chunk in chunks])
+        return embeddings, time.perf_counter() - started
+
+    def _drain(self, in_flight, return_when):
+        """Upsert the embedded batches that have completed"""
+        done, _ = wait(list(in_flight), return_when=return_when)
+        for future in done:
+            chunks = in_flight.pop(future)
+            try:
+                embeddings, seconds = future.result()
+            except Exception as e:
+                print(f"Error embedding batch of {len(chunks)} chunks: {e}")
+                self._fail(chunks)
+                continue
+            self.stats["embed"].add(len(chunks), seconds)
+
+            points = [{**chunk, "embedding": embedding} for chunk, embedding in zip(chunks, embeddings)]
+            started = time.perf_counter()
+            if not qdrant_manager.insert_chunks(points):
+                self._fail(chunks)
+                continue
+            self.stats["upsert"].add(len(points), time.perf_counter() - started)
+
+            for chunk in chunks:
+                self.indexed[chunk["id"]] = {"source": chunk["doc_path"], "content_hash": chunk["content_hash"]}
+            self.manifest_dirty = True
+            self._checkpoint()
+
+    def _fail(self, chunks: List[Dict[str, Any]]):
+        self.failed_chunks += len(chunks)
+        self.failed_files.update(chunk["doc_path"] for chunk in chunks)
+
+    def _checkpoint(self, force: bool = False):
+        """Persist progress so an interrupted run can resume"""
+        now = time.monotonic()
+        if not self.manifest_dirty or (not force and now - self.last_checkpoint < self.checkpoint_seconds):
+            return
+        save_manifest(self.manifest_path, self.collection_name, self.indexed)
+        self.manifest_dirty = False
+        self.last_checkpoint = now
+
+    def _delete_orphans(self) -> bool:
+        """
+        Delete points whose chunk no longer exists in the docs, except those
+        of files that failed this run (their replacements are not indexed)
+        """
+        if self.full:
+            if self.failed_files:
+                # The collection's points carry no source here, so nothing can be pruned safely
+                print(f"Not pruning the collection: {len(self.failed_files)} files failed")
+                return False
+            orphaned = [point_id for point_id in qdrant_manager.list_point_ids() if str(point_id) not in self.current]
+        else:
+            orphaned = [
+                point_id for point_id, entry in self.indexed.items()
+                if point_id not in self.current and entry.get("source") not in self.failed_files
+            ]
+        if not orphaned:
+            if self.full:
+                self.manifest_dirty = True
+                self._checkpoint(force=True)
+            return True
+
+        started = time.perf_counter()
+        if not qdrant_manager.delete_points(orphaned):
+            return False
+        self.stats["delete"].add(len(orphaned), time.perf_counter() - started)
+        for point_id in orphaned:
+            self.indexed.pop(str(point_id), None)
+        # Only rewrite the manifest when the index changed; its mtime tells the
+        # chat server's answer cache that cached answers are stale
+        self.manifest_dirty = True
+        self._checkpoint(force=True)
+        return True
+
+    def report(self):
+        print(f"{len(self.current)} chunks total: {self.stats['upsert'].items} embedded and upserted, "
+              f"{len(self.current) - self.stats['upsert'].items - self.failed_chunks} unchanged, "
+              f"{self.failed_chunks} failed, {self.stats['delete'].items} orphans deleted")
+        if self.failed_files:
+            print(f"{len(self.failed_files)} files failed ({self.unreadable_files} unreadable); "
+                  f"their earlier points were kept: {', '.join(sorted(self.failed_files))}")
+        print(f"Stage throughput ({self.workers} chunking workers, {self.concurrency} embedding requests in flight):")
+        for stage in self.stats.values():
+            print(stage.report())
+        print(f"  {'total':10s} {self.elapsed:.2f}s wall time (stages overlap; stage times are summed worker time)")
+
+def ingest_textbook_content(docs_directory: str, concurrency: int = 4, full: bool = False,
+                            manifest_path: str = INGEST_MANIFEST_PATH, local_index_path: str = None,
+                            skip_qdrant: bool = False, lexical_index_path: str = LEXICAL_INDEX_PATH,
+                            workers: int = None, questions: bool = False,
+                            question_index_path: str = QUESTION_INDEX_PATH, questions_per_chunk: int = 3,
+                            questions_per_page: int = 2):
+    """
+    Ingest all markdown files from the docs directory into Qdrant and/or
+    the local vector index, rebuild the lexical (BM25) index and, with
+    `questions`, update the question index of precomputed answers.
     """
     print(f"Ingesting textbook content from: {docs_directory}")
-    
+
     # Check if docs directory exists
     if not os.path.exists(docs_directory):
         print(f"Error: Docs directory not found at {docs_directory}")
         return False
-    
-    # Process each markdown file
-    processed_chunks = []
-    
-    for root, dirs, files in os.walk(docs_directory):
-        for file in files:
-            if file.endswith('.md'):
-                file_path = os.path.join(root, file)
-                print(f"Processing file: {file_path}")
-                
-                # Process the markdown file
-                chunks = document_processor.process_markdown_file(file_path)
-                processed_chunks.extend(chunks)
-                
-                print(f"  - Extracted {len(chunks)} chunks")
-    
-    # Insert all chunks into Qdrant
-    if processed_chunks:
-        print(f"Inserting {len(processed_chunks)} chunks into Qdrant...")
-        qdrant_manager.insert_chunks(processed_chunks)
+
+    pipeline = IngestionPipeline(docs_directory, concurrency=concurrency, workers=workers, full=full,
+                                 manifest_path=manifest_path, skip_qdrant=skip_qdrant)
+    try:
+        success = pipeline.run()
+        if not pipeline.current:
+            return False
+        if pipeline.failed_chunks:
+            print(f"{pipeline.failed_chunks} chunks failed to embed or upsert; re-run to resume with them.")
+        if pipeline.unreadable_files:
+            # Rebuilding from this run's chunks would drop the unreadable files' text
+            print(f"{pipeline.unreadable_files} files could not be read; "
+                  "the lexical, local and question indexes were left as they were.")
+        else:
+            # The BM25 index needs no embeddings, so it is always rebuilt
+            LexicalIndex.write(lexical_index_path, pipeline.iter_chunks())
+
+            if local_index_path:
+                success = write_local_index(pipeline, local_index_path, concurrency) and success
+
+            # Without --questions an existing question index is only pruned of changed chunks
+            if questions or os.path.exists(question_index_path):
+                built = QuestionIndex.build(question_index_path, pipeline.iter_chunks(), generate=questions,
+                                            concurrency=concurrency, questions_per_chunk=questions_per_chunk,
+                                            questions_per_page=questions_per_page)
+                success = not built["failed"] and success
+    finally:
+        pipeline.close()
+
+    pipeline.report()
+    if success:
         print("Ingestion completed successfully!")
-        return True
-    else:
-        print("No content to ingest.")
+    return success
+
+def write_local_index(pipeline: IngestionPipeline, local_index_path: str, concurrency: int = 4) -> bool:
+    """
+    Write every current chunk to the in-process vector index, streaming the
+    chunks through the embedder a few batches at a time. Unchanged chunks
+    come from the embedding cache, so only new text is embedded.
+    """
+    store = get_chunk_store()
+    group_size = openai_manager.embedding_batch_size * max(1, concurrency)
+    failed = 0
+
+    def embedded_chunks() -> Iterator[Dict[str, Any]]:
+        nonlocal failed
+        group = []
+        for chunk in itertools.chain(pipeline.iter_chunks(), [None]):
+            if chunk is not None:
+                group.append(chunk)
+                if len(group) < group_size:
+                    continue
+            embedded = embed_chunks_concurrently(group, concurrency)
+            failed += len(group) - len(embedded)
+            if store is not None:
+                store.put_many(embedded)
+            group = []
+            yield from embedded
+
+    try:
+        LocalVectorIndex.build(local_index_path, embedded_chunks(), include_content=store is None,
+                               count=len(pipeline.current))
+    except ValueError as e:
+        print(f"{failed} chunks failed to embed; local index not written ({e}).")
         return False
+    return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest textbook markdown into Qdrant")
     # Default docs directory (relative to project root)
-    default_docs_dir = "../docs"
-    
-    # Allow overriding docs directory via command line argument
-    docs_dir = sys.argv[1] if len(sys.argv) > 1 else default_docs_dir
-    
+    parser.add_argument("docs_dir", nargs="?", default="docs", help="Directory containing markdown files")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+                        help="Number of embedding batches kept in flight")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Maximum number of chunks per embedding request")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-embed every chunk and delete all points not in the docs")
+    parser.add_argument("--manifest", default=INGEST_MANIFEST_PATH,
+                        help="Path of the local manifest of indexed chunks")
+    parser.add_argument("--local-index", nargs="?", const=LOCAL_INDEX_PATH, default=None,
+                        help="Also write the in-process vector index (default directory: LOCAL_INDEX_PATH)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to read and chunk files (default: CPU count)")
+    parser.add_argument("--skip-qdrant", action="store_true",
+                        help="Do not touch Qdrant (use with --local-index)")
+    parser.add_argument("--questions", action="store_true",
+                        help="Generate precomputed answers for new or changed chunks (completion calls)")
+    parser.add_argument("--question-index", default=QUESTION_INDEX_PATH,
+                        help="Directory of the question index (default: QUESTION_INDEX_PATH)")
+    parser.add_argument("--questions-per-chunk", type=int, default=int(os.getenv("QUESTIONS_PER_CHUNK", "3")))
+    parser.add_argument("--questions-per-page", type=int, default=int(os.getenv("QUESTIONS_PER_PAGE", "2")))
+    args = parser.parse_args()
+
+    if args.batch_size:
+        openai_manager.embedding_batch_size = args.batch_size
+
     # Convert to absolute path
-    docs_dir = os.path.abspath(docs_dir)
-    
+    docs_dir = os.path.abspath(args.docs_dir)
+
     # Ingest the content
-    success = ingest_textbook_content(docs_dir)
-    
+    success = ingest_textbook_content(docs_dir, concurrency=args.concurrency, full=args.full,
+                                      manifest_path=args.manifest, local_index_path=args.local_index,
+                                      skip_qdrant=args.skip_qdrant, workers=args.workers,
+                                      questions=args.questions, question_index_path=args.question_index,
+                                      questions_per_chunk=args.questions_per_chunk,
+                                      questions_per_page=args.questions_per_page)
+
     if success:
         print("Textbook content ingestion completed!")
         sys.exit(0)
     else:
         print("Textbook content ingestion failed!")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable
+
+class Lazy:
+    """
+    Module-level singleton that is built on first use instead of at import.
+
+    Attribute access and assignment are forwarded to the instance, so
+    `from .openai_client import openai_manager` keeps working unchanged while
+    construction (client setup, config checks, index loading) waits until
+    something actually needs it. A failed construction raises to that caller
+    and is retried on the next use.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "init_seconds", None)
+
+    def get_instance(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    object.__setattr__(self, "_instance", self._factory())
+                    object.__setattr__(self, "init_seconds", time.perf_counter() - started)
+                instance = self._instance
+        return instance
+
+    async def get_instance_async(self) -> Any:
+        """get_instance without blocking the event loop on a slow or concurrent construction"""
+        if self._instance is not None:
+            return self._instance
+        return await asyncio.to_thread(self.get_instance)
+
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_instance(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self.get_instance(), name, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self._instance is not None else "not initialized"
+        return f"<Lazy {self._name} ({state})>"
@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable
+from .config import load_environment
+from .retrieval import SearchHit
+
+# Load environment variables
+load_environment()
+
+# Persisted BM25 index written by ingest_textbook.py
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lexical_index.json")
+)
+
+# Words and compound identifiers such as "ros2", "cmd_vel", "nav2_bringup" or "sensor_msgs/msg"
+TOKEN_PATTERN = re.compile(r"\w+(?:[./-]\w+)*")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it its of on or that the this to "
+    "was what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms for BM25. Compound identifiers are kept whole and
+    their parts are indexed too, so "sensor_msgs/msg" matches "msg".
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = re.split(r"[./_-]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunk contents.
+
+    Built once during ingestion, persisted as JSON, and loaded once at
+    server startup. Chunk IDs match the vector store's point IDs so lexical
+    and dense rankings can be fused.
+    """
+
+    def __init__(self, ids: List[Any], payloads: List[Dict[str, Any]], postings: Dict[str, List[List[int]]],
+                 doc_lengths: List[int], k1: float = 1.2, b: float = 0.75):
+        self.ids = ids
+        self.payloads = payloads
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        document_count = len(doc_lengths)
+        self.idf = {
+            term: math.log(1 + (document_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+
+    @staticmethod
+    def _document(chunk: Dict[str, Any]):
+        """The BM25 terms and stored payload of a chunk record"""
+        # Headings carry strong topical signal, so index them with the text
+        terms = tokenize(f"{chunk.get('chapter', '')} {chunk.get('section', '')} {chunk['content']}")
+        payload = {
+            "content": chunk["content"],
+            "chapter": chunk.get("chapter", ""),
+            "section": chunk.get("section", ""),
+            "source": chunk.get("source", ""),
+            "doc_path": chunk.get("doc_path", ""),
+            "chunk_index": chunk.get("chunk_index"),
+        }
+        return terms, payload
+
+    @classmethod
+    def build(cls, chunks: List[Dict[str, Any]]) -> "LexicalIndex":
+        """Index chunk records (content plus chapter/section/source metadata)"""
+        postings: Dict[str, List[List[int]]] = {}
+        doc_lengths = []
+        payloads = []
+        for doc, chunk in enumerate(chunks):
+            terms, payload = cls._document(chunk)
+            doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append([doc, frequency])
+            payloads.append(payload)
+        ids = [chunk.get("id", i) for i, chunk in enumerate(chunks)]
+        return cls(ids, payloads, postings, doc_lengths)
+
+    @classmethod
+    def write(cls, path: str, chunks: Iterable[Dict[str, Any]]):
+        """
+        Build and save the index of a stream of chunk records in one pass.
+        Payloads (the chunk text) go to disk as they are read; only postings,
+        IDs and document lengths are held in memory.
+        """
+        postings: Dict[str, List[List[int]]] = {}
+        doc_lengths = []
+        ids = []
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write('{"payloads": [')
+                for doc, chunk in enumerate(chunks):
+                    terms, payload = cls._document(chunk)
+                    doc_lengths.append(len(terms))
+                    for term, frequency in Counter(terms).items():
+                        postings.setdefault(term, []).append([doc, frequency])
+                    f.write(("," if doc else "") + json.dumps(payload))
+                    ids.append(chunk.get("id", doc))
+                f.write('], "ids": ')
+                json.dump(ids, f)
+                f.write(', "postings": ')
+                json.dump(postings, f)
+                f.write(', "doc_lengths": ')
+                json.dump(doc_lengths, f)
+                f.write("}")
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        print(f"Wrote lexical index of {len(ids)} chunks to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        """Load a persisted index, or None if it is missing or unreadable"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"Lexical index not found at {path}; run ingestion to build it")
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error loading lexical index from {path}: {e}")
+            return None
+        return cls(data["ids"], data["payloads"], data["postings"], data["doc_lengths"])
+
+    def _matches(self, payload: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        for field, accepted in filters.items():
+            value = payload.get(field, "")
+            if isinstance(accepted, (list, tuple, set)):
+                if value not in accepted:
+                    return False
+            elif value != accepted:
+                return False
+        return True
+
+    def search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """Top chunks by BM25 score for the query text"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, frequency in self.postings[term]:
+                length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / self.avg_doc_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        hits = []
+        for doc, score in ranked:
+            if filters and not self._matches(self.payloads[doc], filters):
+                continue
+            hits.append(SearchHit(id=self.ids[doc], score=score, payload=self.payloads[doc]))
+            if len(hits) == limit:
+                break
+        return hits
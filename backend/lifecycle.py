@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Awaitable, Callable, Optional
+from .config import load_environment
+from .openai_client import openai_manager
+from .rag_chat import rag_chat
+from .chat_history import chat_history_store
+from .page_transforms import page_transformer
+
+# Load environment variables
+load_environment()
+
+# Lazily created singletons, reported on /ready with their construction time
+COMPONENTS = {
+    "openai_manager": openai_manager,
+    "rag_chat": rag_chat,
+    "chat_history_store": chat_history_store,
+    "page_transformer": page_transformer,
+}
+
+async def check_openai() -> Dict[str, Any]:
+    # Configuration only: a network probe would spend API quota on every readiness poll
+    manager = await openai_manager.get_instance_async()
+    return {"completion_model": manager.completion_model, "embedding_model": manager.embedding_model}
+
+async def check_retrieval() -> Dict[str, Any]:
+    chat = await rag_chat.get_instance_async()
+    details = await chat.retriever.check()
+    if chat.retrieval_mode == "hybrid":
+        if chat.lexical_index is None:
+            raise RuntimeError("Hybrid retrieval is configured but the lexical index is not loaded")
+        details = {**details, "lexical_chunks": len(chat.lexical_index.ids)}
+    return details
+
+async def check_database() -> Dict[str, Any]:
+    store = await chat_history_store.get_instance_async()
+    details = await store.ping_async()
+    # Memory-only history is a supported configuration, not a failure
+    return details if store.persistent else {"status": "disabled", **details}
+
+CHECKS: Dict[str, Callable[[], Awaitable[Dict[str, Any]]]] = {
+    "openai": check_openai,
+    "retrieval": check_retrieval,
+    "database": check_database,
+}
+
+async def run_check(check: Callable[[], Awaitable[Dict[str, Any]]], timeout: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        result = {"status": "ok", **await asyncio.wait_for(check(), timeout)}
+    except asyncio.TimeoutError:
+        result = {"status": "error", "error": f"timed out after {timeout:g}s"}
+    except Exception as e:
+        result = {"status": "error", "error": str(e) or type(e).__name__}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+class Lifecycle:
+    """
+    Startup, readiness and shutdown of the backend's clients.
+
+    Nothing is built at import or before the server starts accepting
+    requests; with `warmup` the singletons are constructed (indexes loaded,
+    tables created) and their connections opened in a background task right
+    after startup. /ready runs the dependency checks, each bounded by
+    `check_timeout`, and reports whether the warm-up has finished.
+    """
+
+    def __init__(self, warmup: bool = True, check_timeout: float = 2.0):
+        self.warmup = warmup
+        self.check_timeout = check_timeout
+        self.warmup_task: Optional[asyncio.Task] = None
+        self.warmup_seconds: Optional[float] = None
+
+    async def check(self) -> Dict[str, Any]:
+        names = list(CHECKS)
+        results = await asyncio.gather(*(run_check(CHECKS[name], self.check_timeout) for name in names))
+        return dict(zip(names, results))
+
+    async def warm_up(self):
+        started = time.perf_counter()
+        # Construction is blocking (files, tiktoken, table creation), so it runs on worker threads
+        await asyncio.gather(
+            *(component.get_instance_async() for component in COMPONENTS.values()),
+            return_exceptions=True
+        )
+        # The checks double as pre-connect: the first Qdrant and database connections are opened here
+        checks = await self.check()
+        self.warmup_seconds = time.perf_counter() - started
+        failed = {name: result["error"] for name, result in checks.items() if result["status"] == "error"}
+        print(f"Warm-up finished in {self.warmup_seconds:.2f}s" + (f"; not ready: {failed}" if failed else ""))
+
+    def warmup_status(self) -> str:
+        if self.warmup_task is None:
+            return "disabled"
+        if not self.warmup_task.done():
+            return "running"
+        return "failed" if not self.warmup_task.cancelled() and self.warmup_task.exception() else "done"
+
+    async def readiness(self) -> Dict[str, Any]:
+        checks = await self.check()
+        ready = all(result["status"] != "error" for result in checks.values())
+        return {
+            "ready": ready,
+            "warmup": {
+                "status": self.warmup_status(),
+                "seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            },
+            "components": {
+                name: {
+                    "initialized": component.is_initialized(),
+                    "init_seconds": round(component.init_seconds, 3) if component.init_seconds is not None else None,
+                }
+                for name, component in COMPONENTS.items()
+            },
+            "checks": checks,
+        }
+
+    def start(self):
+        if self.warmup:
+            self.warmup_task = asyncio.create_task(self.warm_up())
+
+    async def stop(self):
+        """Stop the warm-up and release whatever clients were actually created"""
+        if self.warmup_task is not None and not self.warmup_task.done():
+            self.warmup_task.cancel()
+        if openai_manager.is_initialized():
+            await openai_manager.aclose()
+        if rag_chat.is_initialized():
+            await rag_chat.retriever.aclose()
+        if chat_history_store.is_initialized():
+            await chat_history_store.aclose()
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
+
+def create_lifecycle() -> Lifecycle:
+    """Build the lifecycle from STARTUP_WARMUP and READINESS_TIMEOUT_SECONDS"""
+    return Lifecycle(
+        warmup=os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes"),
+        check_timeout=float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+    )
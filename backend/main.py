@@ -1,21 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.background import BackgroundTask
+from typing import List, Dict, Any, Optional
 import os
-from dotenv import load_dotenv
+import json
+import math
+import asyncio
+from .config import load_environment
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
 # Import RAG chat functionality
 from .rag_chat import rag_chat
+from .openai_client import openai_manager, openai_breaker
+from .qdrant_client import qdrant_breaker
+from .admission import create_admission_controller, create_transform_rate_limiter, Admission
+from .chat_history import chat_history_store, new_conversation_id
+from .metrics import REGISTRY, RequestMetricsMiddleware, request_metrics_options
+from .page_transforms import page_transformer, TransformBusyError
+from .lifecycle import create_lifecycle
+
+# Clients are created on first use; the lifespan warms them up in the
+# background after startup and releases them on shutdown
+lifecycle = create_lifecycle()
 
 # Create FastAPI app
 app = FastAPI(
     title="Physical AI & Humanoid Robotics Textbook Chatbot",
     description="RAG chatbot for the Physical AI & Humanoid Robotics textbook",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifecycle.lifespan
 )
 
 # Add CORS middleware
@@ -25,31 +42,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-Id", "X-Trace-Id"],
 )
 
+# Per-client and global rate limits, the concurrency limit with its bounded queue, and
+# degraded (retrieval-only) answers when the queue sheds or an upstream breaker is open
+admission = create_admission_controller()
+# Per-client-address limit on page translation/personalization, which may start generations
+transform_limiter = create_transform_rate_limiter()
+
+# Request latency, in-flight gauge, sampled per-request traces and the slow-request log
+app.add_middleware(RequestMetricsMiddleware, **request_metrics_options())
+
+# Existing component stats, exported as gauges on /metrics (scrapes never create a component)
+REGISTRY.register_stats("answer_cache", lambda: rag_chat.answer_cache.stats()
+                        if rag_chat.is_initialized() and rag_chat.answer_cache else None)
+REGISTRY.register_stats("question_index", lambda: rag_chat.question_index.stats()
+                        if rag_chat.is_initialized() and rag_chat.question_index else None)
+REGISTRY.register_stats("embedding_cache", lambda: openai_manager.embedding_cache.stats()
+                        if openai_manager.is_initialized() else None)
+REGISTRY.register_stats("query_embeddings", lambda: openai_manager.query_batcher.stats()
+                        if openai_manager.is_initialized() else None)
+REGISTRY.register_stats("chat_history", lambda: chat_history_store.stats()
+                        if chat_history_store.is_initialized() else None)
+REGISTRY.register_stats("page_transforms", lambda: page_transformer.stats()
+                        if page_transformer.is_initialized() else None)
+REGISTRY.register_stats("admission", admission.stats)
+REGISTRY.register_stats("transform_rate_limit", transform_limiter.stats)
+REGISTRY.register_stats("openai_breaker", openai_breaker.stats)
+REGISTRY.register_stats("qdrant_breaker", qdrant_breaker.stats)
+REGISTRY.register_stats("db_pool", lambda: chat_history_store.pool_stats()
+                        if chat_history_store.is_initialized() else None)
+
 # Pydantic models
 class Message(BaseModel):
     role: str
     content: str
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    # Either just the new `message` (history is loaded server-side from
+    # `conversation_id`) or the full `messages` list
+    message: Optional[str] = None
+    conversation_id: Optional[str] = None
+    messages: Optional[List[Message]] = None
     selected_text: Optional[str] = None
+    # Route of the book page being read ("/docs/module1"); retrieval searches it first
+    doc_path: Optional[str] = None
     user_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     message: Message
     sources: List[str]
+    conversation_id: str
+    prompt_tokens: int = 0
+    # True for retrieval-only answers given under overload or while OpenAI is unavailable
+    degraded: bool = False
 
-# Health check endpoint
+# Liveness: the process is up and serving, whatever state its dependencies are in
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
-# Chat endpoint
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    # Extract the latest user message
+# Readiness: dependency checks; 503 until the backend can answer chat requests
+@app.get("/ready")
+async def readiness_check():
+    report = await lifecycle.readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+def split_messages(request: ChatRequest):
+    """Extract the latest user message and the preceding conversation history"""
     user_message = ""
     conversation_history = []
     
@@ -58,23 +119,206 @@ async def chat(request: ChatRequest):
         if message.role == "user":
             user_message = message.content
     
-    # Use RAG chat to generate response
-    rag_result = rag_chat.chat_with_rag(
-        query=user_message,
-        conversation_history=conversation_history[:-1] if conversation_history else None,
-        selected_text=request.selected_text
-    )
+    return user_message, conversation_history[:-1] if conversation_history else None
+
+async def start_turn(request: ChatRequest):
+    """
+    Resolve the user message, history and conversation ID for a chat turn
+    and record the user message in the conversation.
+    """
+    if request.message is None and not request.messages:
+        raise HTTPException(status_code=422,
+                            detail="Either message or messages is required")
+    
+    conversation_id = request.conversation_id or new_conversation_id()
+    store = await chat_history_store.get_instance_async()
+    if request.message is not None:
+        user_message = request.message
+        # New conversations have no history to load
+        conversation_history = await store.recent_messages_async(conversation_id) \
+            if request.conversation_id else []
+    else:
+        user_message, conversation_history = split_messages(request)
+    
+    store.append(conversation_id, "user", user_message, request.user_id)
+    return user_message, conversation_history, conversation_id
+
+async def admit(http_request: Request, request: ChatRequest) -> Admission:
+    """
+    Admission decision for a chat request, rate limited per client address
+    (`user_id` is not authenticated, so it is never the key). Rejections
+    raise 503 (degraded answers saturated) with Retry-After.
+    """
+    key = http_request.client.host if http_request.client else "anonymous"
+    unavailable = not openai_breaker.available() or not qdrant_breaker.available()
+    ticket = await admission.admit(key, unavailable)
+    if ticket.mode == "rejected":
+        raise HTTPException(
+            status_code=503,
+            detail="Server overloaded",
+            headers={"Retry-After": str(max(1, math.ceil(ticket.retry_after)))}
+        )
+    return ticket
+
+# Chat endpoint
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    ticket = await admit(http_request, request)
+    try:
+        user_message, conversation_history, conversation_id = await start_turn(request)
+        chat_engine = await rag_chat.get_instance_async()
+        
+        # Use RAG chat to generate response without blocking the event loop
+        answer = chat_engine.answer_degraded_async if ticket.mode == "degraded" else chat_engine.chat_with_rag_async
+        rag_result = await answer(
+            query=user_message,
+            conversation_history=conversation_history,
+            selected_text=request.selected_text,
+            doc_path=request.doc_path
+        )
+    finally:
+        ticket.release()
     
+    chat_history_store.append(conversation_id, "assistant", rag_result["response"], request.user_id)
     return ChatResponse(
         message=Message(role="assistant", content=rag_result["response"]),
-        sources=rag_result["sources"]
+        sources=rag_result["sources"],
+        conversation_id=conversation_id,
+        prompt_tokens=rag_result.get("prompt_tokens", 0),
+        degraded=rag_result.get("degraded", False)
     )
 
-# Get chat history endpoint
-@app.get("/chat/history/{user_id}")
-async def get_chat_history(user_id: str):
-    # This is a placeholder implementation
-    return {"user_id": user_id, "history": []}
+# Streaming chat endpoint: newline-delimited JSON events (sources, delta..., done)
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    ticket = await admit(http_request, request)
+    try:
+        user_message, conversation_history, conversation_id = await start_turn(request)
+        chat_engine = await rag_chat.get_instance_async()
+    except BaseException:
+        ticket.release()
+        raise
+    stream = chat_engine.stream_degraded if ticket.mode == "degraded" else chat_engine.stream_chat_with_rag
+    
+    async def events():
+        deltas = []
+        try:
+            async for event in stream(
+                query=user_message,
+                conversation_history=conversation_history,
+                selected_text=request.selected_text,
+                doc_path=request.doc_path
+            ):
+                if event["type"] == "delta":
+                    deltas.append(event["content"])
+                elif event["type"] == "done":
+                    event = {**event, "conversation_id": conversation_id}
+                    chat_history_store.append(conversation_id, "assistant", "".join(deltas), request.user_id)
+                yield json.dumps(event) + "\n"
+        finally:
+            ticket.release()
+    
+    # The background task also frees the slot if the stream is never iterated
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Conversation-Id": conversation_id},
+        background=BackgroundTask(ticket.release)
+    )
+
+def page_response(request: Request, result: Dict[str, Any], cache_control: str) -> Response:
+    """JSON page with its ETag; 304 when the client already holds that version"""
+    headers = {
+        "ETag": result["etag"],
+        "Cache-Control": cache_control,
+        "X-Cache": "miss" if result["generated_sections"] else "hit",
+    }
+    # Weak comparison: W/"x" matches "x"
+    client_tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if "*" in client_tags or result["etag"] in (tag[2:] if tag.startswith("W/") else tag for tag in client_tags):
+        return Response(status_code=304, headers=headers)
+    body = {key: value for key, value in result.items() if key not in ("etag", "generated_sections")}
+    return JSONResponse(body, headers=headers)
+
+# Suggested wait when every page generation slot is taken
+TRANSFORM_RETRY_AFTER_SECONDS = 5
+
+def limit_transforms(request: Request):
+    """Page transform rate limit per client address: 429 with Retry-After beyond it"""
+    retry_after = transform_limiter.retry_after(request.client.host if request.client else "anonymous")
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many page requests",
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+async def transform_page(transform) -> Dict[str, Any]:
+    try:
+        return await transform
+    except TransformBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(TRANSFORM_RETRY_AFTER_SECONDS)})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+# Page translation: every section of a book page in `language`, generated once and cached
+@app.get("/translate")
+async def translate_page(request: Request, doc_path: str, language: str = "ur"):
+    limit_transforms(request)
+    transformer = await page_transformer.get_instance_async()
+    result = await transform_page(transformer.translate(doc_path, language))
+    # Revalidated on each view (ETag), so edits to the docs show up immediately
+    return page_response(request, result, "public, no-cache")
+
+# Page personalization for a reader's software/hardware background (as stored on the User)
+@app.get("/personalize")
+async def personalize_page(request: Request, doc_path: str, software_background: Optional[str] = None,
+                           hardware_background: Optional[str] = None):
+    limit_transforms(request)
+    transformer = await page_transformer.get_instance_async()
+    result = await transform_page(transformer.personalize(doc_path, software_background, hardware_background))
+    return page_response(request, result, "private, no-cache")
+
+# Cache metrics
+@app.get("/cache/stats")
+async def cache_stats():
+    await asyncio.gather(rag_chat.get_instance_async(), chat_history_store.get_instance_async())
+    return {
+        "answer_cache": rag_chat.answer_cache.stats() if rag_chat.answer_cache else None,
+        "question_index": rag_chat.question_index.stats() if rag_chat.question_index else None,
+        "embedding_cache": openai_manager.embedding_cache.stats(),
+        "query_embeddings": openai_manager.query_batcher.stats(),
+        "chat_history": chat_history_store.stats(),
+        "page_transforms": page_transformer.stats() if page_transformer.is_initialized() else None
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Database connection pool utilization
+@app.get("/db/stats")
+async def db_stats():
+    store = await chat_history_store.get_instance_async()
+    return {"pools": store.pool_stats()}
+
+# One page of a conversation's messages, newest first. The conversation ID (X-Conversation-Id,
+# a random ID minted by the server) is what grants access: history is never listed by user ID,
+# which is unauthenticated
+@app.get("/chat/conversations/{conversation_id}/history")
+async def get_chat_history(
+    conversation_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
+    store = await chat_history_store.get_instance_async()
+    try:
+        page = await store.history_async(conversation_id, before, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"conversation_id": conversation_id, **page}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,227 @@
+import os
+import re
+from collections import deque
+from typing import List, Dict, Any, Iterable, Iterator, Callable, Optional
+from .openai_client import estimate_tokens
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+FRONTMATTER_TITLE_PATTERN = re.compile(r'^title:\s*["\']?(.+?)["\']?\s*$')
+
+class MarkdownChunker:
+    """
+    Single-pass markdown chunker.
+
+    Lines are consumed as a stream. Headings (outside code fences) close the
+    current section, so no chunk spans two sections, and each chunk records
+    its chapter (the H1) and section path ("Section > Subsection"). Within a
+    section, paragraphs and whole code fences are packed into chunks up to
+    `max_tokens`; blocks larger than the budget are split by line, and the
+    last `overlap_tokens` worth of blocks are repeated in the next chunk,
+    less whatever the budget has no room for.
+    """
+
+    def __init__(self, max_tokens: int = 300, overlap_tokens: int = 40,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens
+
+    def _blocks(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Yield heading, paragraph and code blocks from a stream of lines"""
+        paragraph: List[str] = []
+        fence: Optional[List[str]] = None
+        fence_marker = ""
+        first = True
+        in_frontmatter = False
+
+        for line in lines:
+            line = line.rstrip("\n")
+
+            # Skip YAML frontmatter, keeping its title if present
+            if first:
+                first = False
+                if line.strip() == "---":
+                    in_frontmatter = True
+                    continue
+            if in_frontmatter:
+                if line.strip() == "---":
+                    in_frontmatter = False
+                else:
+                    title = FRONTMATTER_TITLE_PATTERN.match(line)
+                    if title:
+                        yield {"type": "title", "text": title.group(1)}
+                continue
+
+            if fence is not None:
+                fence.append(line)
+                if line.strip().startswith(fence_marker):
+                    yield {"type": "code", "text": "\n".join(fence)}
+                    fence = None
+                continue
+
+            fence_match = FENCE_PATTERN.match(line)
+            if fence_match:
+                if paragraph:
+                    yield {"type": "text", "text": "\n".join(paragraph)}
+                    paragraph = []
+                fence = [line]
+                fence_marker = fence_match.group(1)
+                continue
+
+            heading = HEADING_PATTERN.match(line)
+            if heading:
+                if paragraph:
+                    yield {"type": "text", "text": "\n".join(paragraph)}
+                    paragraph = []
+                yield {"type": "heading", "level": len(heading.group(1)), "title": heading.group(2), "text": line}
+                continue
+
+            if line.strip():
+                paragraph.append(line)
+            elif paragraph:
+                yield {"type": "text", "text": "\n".join(paragraph)}
+                paragraph = []
+
+        # Unterminated fences and trailing paragraphs still count
+        if fence is not None:
+            yield {"type": "code", "text": "\n".join(fence)}
+        if paragraph:
+            yield {"type": "text", "text": "\n".join(paragraph)}
+
+    def _split_oversized(self, text: str, budget: Optional[int] = None) -> List[str]:
+        """Split a block that exceeds the budget (max_tokens by default) by line, then by characters"""
+        budget = budget or self.max_tokens
+        pieces = []
+        current = ""
+        for line in text.split("\n"):
+            tokens = self.count_tokens(line)
+            if tokens > budget:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                # Characters per token is roughly constant, so slice proportionally
+                step = max(1, len(line) * budget // (tokens + 1))
+                pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+                continue
+            candidate = f"{current}\n{line}" if current else line
+            if current and self.count_tokens(candidate) > budget:
+                pieces.append(current)
+                candidate = line
+            current = candidate
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def chunk_lines(self, lines: Iterable[str], default_chapter: str = "") -> Iterator[Dict[str, Any]]:
+        """
+        Yield {"content", "chapter", "section", "heading_path"} chunks from a
+        stream of markdown lines.
+        """
+        chapter = default_chapter
+        headings: List[str] = []
+        # Blocks of the chunk being built as (text, tokens). Blocks before
+        # `fresh` are overlap already emitted in the previous chunk.
+        blocks: List[tuple] = []
+        fresh = 0
+        has_body = False
+
+        def emit():
+            nonlocal blocks, fresh, has_body
+            chunk = {
+                "content": "\n\n".join(text for text, _ in blocks),
+                "chapter": chapter,
+                "section": " > ".join(headings),
+                "heading_path": [chapter] + headings,
+            }
+            # Keep trailing blocks as overlap for the next chunk in this section
+            overlap: List[tuple] = []
+            overlap_tokens = 0
+            for block in reversed(blocks):
+                if overlap_tokens + block[1] > self.overlap_tokens:
+                    break
+                overlap.insert(0, block)
+                overlap_tokens += block[1]
+            blocks, fresh, has_body = overlap, len(overlap), False
+            return chunk
+
+        def fits(piece: str) -> bool:
+            # Measure the joined text so separators and overlap count against the budget
+            return self.count_tokens("\n\n".join([b[0] for b in blocks] + [piece])) <= self.max_tokens
+
+        for block in self._blocks(lines):
+            if block["type"] == "title":
+                chapter = block["text"]
+                continue
+
+            if block["type"] == "heading":
+                if has_body:
+                    yield emit()
+                # New section: drop overlap but keep headings not yet emitted,
+                # so a heading is never a chunk on its own
+                blocks, fresh = blocks[fresh:], 0
+                if block["level"] == 1:
+                    chapter = block["title"]
+                    headings = []
+                else:
+                    headings = headings[:block["level"] - 2] + [block["title"]]
+                blocks.append((block["text"], self.count_tokens(block["text"])))
+                continue
+
+            tokens = self.count_tokens(block["text"])
+            pieces = deque([block["text"]] if tokens <= self.max_tokens else self._split_oversized(block["text"]))
+            while pieces:
+                piece = pieces.popleft()
+                if not piece.strip():
+                    continue
+                if fits(piece):
+                    blocks.append((piece, self.count_tokens(piece)))
+                    has_body = True
+                    continue
+                if has_body:
+                    yield emit()
+                # Drop overlap, oldest first, until the piece fits; a chunk never holds only overlap
+                while fresh and not fits(piece):
+                    blocks.pop(0)
+                    fresh -= 1
+                if not fits(piece) and blocks:
+                    # Only the section's headings are left: split the piece to fit beside them
+                    # (one token of slack for the rounding of the joined count)
+                    room = self.max_tokens - self.count_tokens("\n\n".join([b[0] for b in blocks] + [""])) - 1
+                    parts = self._split_oversized(piece, room) if room > 0 else [piece]
+                    if len(parts) > 1:
+                        pieces.extendleft(reversed(parts))
+                        continue
+                blocks.append((piece, self.count_tokens(piece)))
+                has_body = True
+
+        if has_body:
+            yield emit()
+
+    def sections(self, lines: Iterable[str]) -> List[Dict[str, str]]:
+        """
+        Split markdown into heading-delimited {"heading", "content"} sections,
+        blocks kept whole (text before the first heading is a section with an
+        empty heading). Frontmatter is dropped.
+        """
+        sections: List[Dict[str, Any]] = []
+        for block in self._blocks(lines):
+            if block["type"] == "title":
+                continue
+            if block["type"] == "heading" or not sections:
+                sections.append({"heading": block.get("title", ""), "blocks": []})
+            sections[-1]["blocks"].append(block["text"])
+        return [{"heading": section["heading"], "content": "\n\n".join(section["blocks"])} for section in sections]
+
+    def chunk_file(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream a markdown file from disk into chunks"""
+        default_chapter = os.path.splitext(os.path.basename(file_path))[0]
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from self.chunk_lines(f, default_chapter)
+
+def create_markdown_chunker() -> MarkdownChunker:
+    """Build the chunker from CHUNK_MAX_TOKENS / CHUNK_OVERLAP_TOKENS"""
+    return MarkdownChunker(
+        max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", "300")),
+        overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+    )
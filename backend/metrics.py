@@ -0,0 +1,325 @@
+import os
+import re
+import time
+import uuid
+import random
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+# Latency buckets in seconds, from cache hits to slow completions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 8000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for metrics keyed by label values; all updates hold one lock"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def track(self, *labelvalues: str) -> "_InFlight":
+        """Context manager counting the calls currently inside it"""
+        return _InFlight(self, labelvalues)
+
+class _InFlight:
+    __slots__ = ("gauge", "labelvalues")
+
+    def __init__(self, gauge: Gauge, labelvalues: Tuple[str, ...]):
+        self.gauge = gauge
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.gauge.inc(*self.labelvalues)
+
+    def __exit__(self, *exc):
+        self.gauge.dec(*self.labelvalues)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, plus sum and count
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labelvalues: str) -> "Timer":
+        return Timer(self, labelvalues)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Trace:
+    """Per-request record of stage timings, kept only for sampled requests"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans: List[Tuple[str, float]] = []
+
+    def summary(self) -> str:
+        return " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.spans)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+class Timer:
+    """
+    Observes the elapsed time of a `with` block into a histogram and, when
+    the current request is traced, appends it as a span.
+    """
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_duration(self.histogram, time.perf_counter() - self.started, *self.labelvalues)
+
+def record_duration(histogram: Histogram, seconds: float, *labelvalues: str):
+    """Observe a duration and add it to the current trace, if any"""
+    histogram.observe(seconds, *labelvalues)
+    trace = _current_trace.get()
+    if trace is not None:
+        # e.g. "rag.embed", "openai.completion", "qdrant.search"
+        prefix = histogram.name.split("_", 1)[0]
+        trace.spans.append((".".join((prefix,) + labelvalues), seconds))
+
+class Registry:
+    """Metrics plus collectors that turn existing stats() dicts into gauges at scrape time"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Tuple[str, Callable[[], Optional[Dict[str, Any]]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_stats(self, prefix: str, stats: Callable[[], Optional[Dict[str, Any]]]):
+        """Expose the numeric fields of a component's stats() as `<prefix>_<field>` gauges"""
+        self._collectors.append((prefix, stats))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats in self._collectors:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                print(f"Error collecting {prefix} stats: {e}")
+                continue
+            for field, value in _flatten(values):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{field}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _flatten(values: Dict[str, Any], prefix: str = ""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        else:
+            yield f"{prefix}{key}", value
+
+# Global registry and the metrics shared by the RAG pipeline
+REGISTRY = Registry()
+
+RAG_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent in each RAG pipeline stage", ("stage",))
+RAG_REQUESTS = REGISTRY.counter(
+    "rag_requests_total", "RAG chat requests by outcome", ("outcome",))
+RAG_IN_FLIGHT = REGISTRY.gauge(
+    "rag_requests_in_flight", "RAG chat requests currently being answered")
+RAG_RETRIEVAL_SCOPE = REGISTRY.counter(
+    "rag_retrieval_scope_total", "Page-scoped retrievals, answered in scope or widened", ("outcome",))
+RAG_ADMISSION = REGISTRY.counter(
+    "rag_admission_total", "Chat admission decisions by mode and reason", ("mode", "reason"))
+RAG_PROMPT_TOKENS = REGISTRY.histogram(
+    "rag_prompt_tokens", "Prompt tokens sent per completion", buckets=TOKEN_BUCKETS)
+
+OPENAI_SECONDS = REGISTRY.histogram(
+    "openai_request_seconds", "OpenAI API call latency", ("operation",))
+OPENAI_IN_FLIGHT = REGISTRY.gauge(
+    "openai_requests_in_flight", "OpenAI API calls currently in flight", ("operation",))
+OPENAI_TOKENS = REGISTRY.counter(
+    "openai_tokens_total", "Tokens reported by the OpenAI API", ("kind",))
+OPENAI_ERRORS = REGISTRY.counter(
+    "openai_errors_total", "Failed OpenAI API calls", ("operation",))
+OPENAI_RETRIES = REGISTRY.counter(
+    "openai_retries_total", "Embedding batch retries after retryable errors")
+
+QDRANT_SECONDS = REGISTRY.histogram(
+    "qdrant_request_seconds", "Qdrant call latency", ("operation",))
+QDRANT_IN_FLIGHT = REGISTRY.gauge(
+    "qdrant_requests_in_flight", "Qdrant calls currently in flight", ("operation",))
+QDRANT_ERRORS = REGISTRY.counter(
+    "qdrant_errors_total", "Failed Qdrant calls", ("operation",))
+
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    "document_processing_seconds", "Document chunking and embedding time", ("stage",))
+DOCUMENT_CHUNKS = REGISTRY.counter(
+    "document_chunks_total", "Chunks produced by the document processor")
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_seconds", "HTTP request latency including streamed bodies", ("method", "route", "status"))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served")
+
+def stage(name: str) -> Timer:
+    """Time a RAG pipeline stage"""
+    return RAG_STAGE_SECONDS.time(name)
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording request latency (until the last body chunk,
+    so streamed responses count in full) and the in-flight gauge.
+
+    A fraction `sample_rate` of requests, plus any sent with an X-Trace-Id
+    header, is traced: stage timings are collected, the trace ID is returned
+    in X-Trace-Id and the breakdown is logged. Requests slower than
+    `slow_seconds` are always logged.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0, slow_seconds: float = 5.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = None
+        incoming = next((value for key, value in scope.get("headers", []) if key == b"x-trace-id"), None)
+        if incoming or (self.sample_rate and random.random() < self.sample_rate):
+            trace = Trace(incoming.decode("latin-1")[:64] if incoming else None)
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_SECONDS.observe(elapsed, scope["method"], route_path, str(status))
+            if trace is not None or elapsed >= self.slow_seconds:
+                label = "Slow request" if elapsed >= self.slow_seconds else "Trace"
+                trace_id = trace.trace_id if trace is not None else "-"
+                spans = trace.summary() if trace is not None else ""
+                print(f"{label} {trace_id} {scope['method']} {scope['path']} {status} {elapsed * 1000:.1f}ms {spans}".rstrip())
+            _current_trace.reset(token)
+
+def request_metrics_options() -> Dict[str, float]:
+    """Middleware options from METRICS_* environment settings"""
+    return {
+        "sample_rate": float(os.getenv("METRICS_TRACE_SAMPLE_RATE", "0")),
+        "slow_seconds": float(os.getenv("METRICS_SLOW_REQUEST_SECONDS", "5")),
+    }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -20,9 +20,16 @@ class User(Base):
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # Messages by user, and history pages and recent-window loads per conversation
+        # (chat_history.migrate_chat_history upgrades tables created by earlier versions)
+        Index("ix_chat_history_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_chat_history_conversation_id_timestamp", "conversation_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    conversation_id = Column(String, nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=True)  # NULL for anonymous readers
     message = Column(Text, nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     timestamp = Column(DateTime, default=func.now())
@@ -1,10 +1,56 @@
 import os
-from openai import OpenAI
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+import random
+import time
+import httpx
+from typing import List, Dict, Any, AsyncIterator
+from .config import load_environment
+from .embedding_cache import create_embedding_cache
+from .embedding_batcher import create_embedding_batcher
+from .lazy import Lazy
+from .metrics import OPENAI_SECONDS, OPENAI_IN_FLIGHT, OPENAI_TOKENS, OPENAI_ERRORS, OPENAI_RETRIES
+from .circuit_breaker import create_circuit_breaker, retry_after_seconds
 
 # Load environment variables
-load_dotenv()
+load_environment()
+
+def retryable_errors() -> tuple:
+    """Errors worth retrying when embedding in bulk"""
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Native vector size of the OpenAI embedding models
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+def embedding_dimensions() -> int:
+    """
+    Size of the vectors the configured embedding model returns.
+    OPENAI_EMBEDDING_DIMENSIONS shortens text-embedding-3 vectors; the
+    models are trained so that a truncated prefix keeps most of the quality.
+    """
+    requested = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS") or 0)
+    if requested:
+        return requested
+    model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+    return EMBEDDING_MODEL_DIMENSIONS.get(model, 1536)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return max(1, len(text) // 4)
+
+def record_usage(operation: str, response):
+    """Count the tokens an API response reports"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    if operation == "embeddings":
+        OPENAI_TOKENS.inc("embedding", amount=usage.total_tokens or 0)
+    else:
+        OPENAI_TOKENS.inc("prompt", amount=usage.prompt_tokens or 0)
+        OPENAI_TOKENS.inc("completion", amount=usage.completion_tokens or 0)
 
 class OpenAIManager:
     def __init__(self):
@@ -12,27 +58,174 @@ class OpenAIManager:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
-    
+
+        # Chat model used for answers
+        self.completion_model = os.getenv("OPENAI_COMPLETION_MODEL", "gpt-3.5-turbo")
+
+        # Embedding configuration
+        self.embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+        self.embedding_dimensions = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS") or 0) or None
+        if self.embedding_dimensions and not self.embedding_model.startswith("text-embedding-3"):
+            raise ValueError(f"OPENAI_EMBEDDING_DIMENSIONS is not supported by {self.embedding_model}")
+        # Arguments for every embeddings call; truncated vectors are cached apart from full ones
+        self.embedding_options = {"model": self.embedding_model}
+        self.embedding_cache_key = self.embedding_model
+        if self.embedding_dimensions:
+            self.embedding_options["dimensions"] = self.embedding_dimensions
+            self.embedding_cache_key = f"{self.embedding_model}:{self.embedding_dimensions}"
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+        self.embedding_batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+        self.embedding_max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+        # Embedding cache keyed by (model, sha256(text))
+        self.embedding_cache = create_embedding_cache()
+
+        # Concurrent query embeddings on the async path are sent as batched calls
+        self.query_batcher = create_embedding_batcher(self._embed_texts_async)
+
+        # Initialize OpenAI client (OPENAI_BASE_URL allows pointing at a local fake server).
+        # The SDK takes ~0.4s to import, so it is imported here rather than at module load
+        from openai import OpenAI, AsyncOpenAI
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+
+        # Async client for the request path, sharing one pooled HTTP connection set.
+        # Its timeout and retries bound how long a request waits on a struggling API
+        max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+        self.async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60")), connect=5.0)
+            )
+        )
+
+    def _call(self, operation: str, create, **kwargs):
+        """Make an API call, recording latency, in-flight calls, errors and token usage"""
+        with OPENAI_IN_FLIGHT.track(operation), OPENAI_SECONDS.time(operation):
+            try:
+                response = create(**kwargs)
+            except Exception:
+                OPENAI_ERRORS.inc(operation)
+                raise
+        record_usage(operation, response)
+        return response
+
+    async def _acall(self, operation: str, create, **kwargs):
+        """
+        Async variant of _call for the request path, behind the OpenAI circuit
+        breaker: rate limits, timeouts and server errors count as failures,
+        and while the breaker is open calls fail with CircuitOpenError at once.
+        """
+        openai_breaker.check()
+        with OPENAI_IN_FLIGHT.track(operation), OPENAI_SECONDS.time(operation):
+            try:
+                response = await create(**kwargs)
+            except Exception as e:
+                OPENAI_ERRORS.inc(operation)
+                if isinstance(e, retryable_errors()):
+                    openai_breaker.record_failure(retry_after_seconds(e))
+                else:
+                    openai_breaker.record_success()
+                raise
+            except BaseException:
+                # Cancelled: says nothing about OpenAI, but give back a half-open probe
+                openai_breaker.release()
+                raise
+        openai_breaker.record_success()
+        record_usage(operation, response)
+        return response
+
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for given text using OpenAI"""
+        cached = self.embedding_cache.get_many(self.embedding_cache_key, [text])
+        if cached:
+            return cached[0]
         try:
-            response = self.client.embeddings.create(
+            response = self._call("embeddings", self.client.embeddings.create,
                 input=text,
-                model="text-embedding-ada-002"
+                **self.embedding_options
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            self.embedding_cache.put_many(self.embedding_cache_key, [text], [embedding])
+            return embedding
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
-    
+
+    async def cached_embedding_async(self, text: str):
+        """The embedding of `text` if it is cached (no API call), else None"""
+        cached = await self.embedding_cache.get_many_async(self.embedding_cache_key, [text])
+        return cached[0] if cached else None
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts, requesting only cache misses in a single API call"""
+        if not texts:
+            return []
+        embeddings = self.embedding_cache.get_many(self.embedding_cache_key, texts)
+        missing = [i for i in range(len(texts)) if i not in embeddings]
+        if not missing:
+            return [embeddings[i] for i in range(len(texts))]
+        try:
+            response = self._call("embeddings", self.client.embeddings.create,
+                input=[texts[i] for i in missing],
+                **self.embedding_options
+            )
+            # The API does not guarantee ordering, so sort by input index
+            fresh = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            print(f"Error generating embeddings for batch of {len(missing)}: {e}")
+            raise
+        self.embedding_cache.put_many(self.embedding_cache_key, [texts[i] for i in missing], fresh)
+        embeddings.update(zip(missing, fresh))
+        return [embeddings[i] for i in range(len(texts))]
+
+    def generate_embeddings_with_retry(self, texts: List[str]) -> List[List[float]]:
+        """Batch embedding call with exponential backoff on rate limits and transient errors"""
+        delay = 1.0
+        retryable = retryable_errors()
+        for attempt in range(self.embedding_max_retries + 1):
+            try:
+                return self.generate_embeddings(texts)
+            except retryable as e:
+                if attempt == self.embedding_max_retries:
+                    raise
+                wait = delay
+                # Honour the server's Retry-After hint when present
+                wait = max(wait, retry_after_seconds(e) or 0.0)
+                wait += random.uniform(0, wait / 2)
+                print(f"Embedding batch failed ({type(e).__name__}), retrying in {wait:.1f}s")
+                OPENAI_RETRIES.inc()
+                time.sleep(wait)
+                delay = min(delay * 2, 30.0)
+
+    def batch_texts(self, texts: List[str]) -> List[List[int]]:
+        """
+        Group text indices into batches that respect both the configured
+        batch size and the per-request token budget.
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.embedding_batch_size or current_tokens + tokens > self.embedding_batch_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
     def generate_completion(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> str:
         """Generate completion using OpenAI chat model"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = self._call("completion", self.client.chat.completions.create,
+                model=self.completion_model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=0.7
@@ -42,5 +235,65 @@ class OpenAIManager:
             print(f"Error generating completion: {e}")
             raise
 
-# Global OpenAI manager instance
-openai_manager = OpenAIManager()
\ No newline at end of file
+    async def generate_embedding_async(self, text: str) -> List[float]:
+        """Async variant of generate_embedding; cache misses go through the query batcher"""
+        cached = await self.embedding_cache.get_many_async(self.embedding_cache_key, [text])
+        if cached:
+            return cached[0]
+        try:
+            return await self.query_batcher.embed(text)
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            raise
+
+    async def _embed_texts_async(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings call for a batch of texts, cached like generate_embeddings"""
+        response = await self._acall("embeddings", self.async_client.embeddings.create,
+            input=texts,
+            **self.embedding_options
+        )
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        await self.embedding_cache.put_many_async(self.embedding_cache_key, texts, embeddings)
+        return embeddings
+
+    async def generate_completion_async(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> str:
+        """Async variant of generate_completion"""
+        try:
+            response = await self._acall("completion", self.async_client.chat.completions.create,
+                model=self.completion_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"Error generating completion: {e}")
+            raise
+
+    async def stream_completion_async(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> AsyncIterator[str]:
+        """Yield completion text deltas as the chat model produces them"""
+        try:
+            # Latency here is time until the stream opens
+            stream = await self._acall("completion_stream", self.async_client.chat.completions.create,
+                model=self.completion_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"Error streaming completion: {e}")
+            raise
+
+    async def aclose(self):
+        """Close the pooled async HTTP connections"""
+        await self.async_client.close()
+
+# Guards the request path; module-level so admission control can read it before the client exists
+openai_breaker = create_circuit_breaker("openai")
+
+# Global OpenAI manager instance, created on first use
+openai_manager = Lazy(OpenAIManager, "openai_manager")
@@ -0,0 +1,366 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from .config import load_environment
+from .openai_client import openai_manager, estimate_tokens
+from .markdown_chunker import MarkdownChunker
+from .retrieval import doc_path_candidates
+from .lazy import Lazy
+
+# Load environment variables
+load_environment()
+
+# Part of every cache key: bump when the prompts change so older outputs are regenerated
+PROMPT_VERSION = "1"
+
+# Languages pages can be requested in; the docs are written in SOURCE_LANGUAGE
+SOURCE_LANGUAGE = "en"
+LANGUAGES = {"en": "English", "ur": "Urdu"}
+
+BATCH_FORMAT = (
+    'The user message is a JSON object {"sections": [...]} of markdown sections of a robotics textbook. '
+    'Reply with only a JSON object {"sections": [...]} holding exactly one rewritten section per input '
+    'section, in the same order. Keep the markdown structure, code blocks, commands, identifiers and URLs unchanged.'
+)
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+# Reader backgrounds are free text from the request: short, and words and plain punctuation only
+MAX_BACKGROUND_CHARS = 300
+BACKGROUND_PATTERN = re.compile(r"^[\w\s.,;:+#/()&'-]*$")
+
+class TransformBusyError(Exception):
+    """Raised instead of starting a generation while max_generations are already in flight"""
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a section's source text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def normalize_background(text: Optional[str]) -> str:
+    return " ".join((text or "").lower().split())
+
+def validate_background(name: str, text: Optional[str]):
+    """ValueError unless a background is short plain text (it becomes part of the prompt)"""
+    if text and len(text) > MAX_BACKGROUND_CHARS:
+        raise ValueError(f"{name} is longer than {MAX_BACKGROUND_CHARS} characters")
+    if text and not BACKGROUND_PATTERN.match(text):
+        raise ValueError(f"{name} may only hold letters, digits, spaces and .,;:+#/()&'-")
+
+def profile_key(software_background: Optional[str], hardware_background: Optional[str]) -> str:
+    """Cache key of a reader profile; readers with the same backgrounds share personalized pages"""
+    profile = [normalize_background(software_background), normalize_background(hardware_background)]
+    return hashlib.sha256(json.dumps(profile).encode("utf-8")).hexdigest()[:16]
+
+def parse_sections(reply: str, count: int) -> List[str]:
+    """The rewritten sections of a batched completion; ValueError unless there is one per input"""
+    match = JSON_OBJECT.search(reply or "")
+    if not match:
+        raise ValueError("Completion holds no JSON object")
+    sections = json.loads(match.group(0)).get("sections")
+    if not isinstance(sections, list) or len(sections) != count or not all(isinstance(s, str) for s in sections):
+        raise ValueError(f"Expected {count} rewritten sections")
+    return sections
+
+class TransformCache:
+    """
+    Rewritten page sections (translations, personalized versions) in SQLite.
+
+    Outputs are zlib-compressed and keyed by (kind, doc path, variant,
+    section content hash): editing one section of a page regenerates only
+    that section, and the cache survives restarts. The section count and
+    stored size are counted once at startup and kept up to date on writes,
+    so stats() never scans the table.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transforms ("
+            "kind TEXT NOT NULL, doc_path TEXT NOT NULL, variant TEXT NOT NULL, section_hash TEXT NOT NULL, "
+            "output BLOB NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, doc_path, variant, section_hash)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        self.sections, self.stored_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(output)), 0) FROM transforms"
+        ).fetchone()
+
+    def get_many(self, kind: str, doc_path: str, variant: str, section_hashes: List[str]) -> Dict[str, str]:
+        """Cached outputs by section hash; hashes not cached are left out"""
+        keys = list(dict.fromkeys(section_hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    "SELECT section_hash, output FROM transforms WHERE kind = ? AND doc_path = ? AND variant = ? "
+                    f"AND section_hash IN ({','.join('?' * len(batch))})",
+                    [kind, doc_path, variant, *batch]
+                ).fetchall()
+                found.update((section_hash, zlib.decompress(blob).decode("utf-8")) for section_hash, blob in rows)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    async def get_many_async(self, kind: str, doc_path: str, variant: str, section_hashes: List[str]) -> Dict[str, str]:
+        """get_many on a worker thread, keeping SQLite off the event loop"""
+        return await asyncio.to_thread(self.get_many, kind, doc_path, variant, section_hashes)
+
+    def put_many(self, kind: str, doc_path: str, variant: str, outputs: Dict[str, str]):
+        now = time.time()
+        rows = [
+            (kind, doc_path, variant, section_hash, zlib.compress(output.encode("utf-8")), now)
+            for section_hash, output in outputs.items()
+        ]
+        with self._lock:
+            # Rows being replaced, so the counters stay exact
+            replaced = {}
+            keys = list(outputs)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                replaced.update(self._db.execute(
+                    "SELECT section_hash, LENGTH(output) FROM transforms WHERE kind = ? AND doc_path = ? "
+                    f"AND variant = ? AND section_hash IN ({','.join('?' * len(batch))})",
+                    [kind, doc_path, variant, *batch]
+                ).fetchall())
+            self._db.executemany(
+                "INSERT OR REPLACE INTO transforms (kind, doc_path, variant, section_hash, output, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+            self.sections += len(rows) - len(replaced)
+            self.stored_bytes += sum(len(row[4]) for row in rows) - sum(replaced.values())
+
+    async def put_many_async(self, kind: str, doc_path: str, variant: str, outputs: Dict[str, str]):
+        """put_many on a worker thread"""
+        await asyncio.to_thread(self.put_many, kind, doc_path, variant, outputs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sections": self.sections, "stored_bytes": self.stored_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+class PageTransformer:
+    """
+    Translation and background-personalization of whole book pages.
+
+    Pages are read from the docs directory and split into heading sections.
+    Sections missing from the cache are rewritten in batched completion
+    calls (as many sections per call as fit `batch_tokens`, a page's
+    batches concurrently) and cached, so every later view of the page in
+    that language or for that profile is a cache read. Concurrent requests
+    for the same uncached page share one generation, and at most
+    `max_generations` generations run at once (0 disables the limit);
+    requests needing another raise TransformBusyError.
+    """
+
+    def __init__(self, docs_directory: str, cache: TransformCache, route_base: str = "/docs",
+                 batch_tokens: int = 2000, max_output_tokens: int = 4096, max_generations: int = 4):
+        self.docs_directory = os.path.realpath(docs_directory)
+        self.cache = cache
+        self.route_base = route_base
+        self.batch_tokens = batch_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_generations = max_generations
+        self.chunker = MarkdownChunker()
+        # Split pages by relative path, reused while the file's mtime is unchanged
+        self._pages: Dict[str, Tuple[float, List[Dict[str, str]]]] = {}
+        self._pending: Dict[Tuple[str, str, str, Tuple[str, ...]], asyncio.Future] = {}
+        self.completion_calls = 0
+        self.generated_sections = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def resolve(self, doc_path: str) -> Optional[str]:
+        """The markdown file (relative to the docs directory) rendering the page at `doc_path`"""
+        for candidate in doc_path_candidates(doc_path, self.route_base):
+            path = os.path.realpath(os.path.join(self.docs_directory, candidate))
+            if path.startswith(self.docs_directory + os.sep) and os.path.isfile(path):
+                return candidate
+        return None
+
+    def page_sections(self, relative_path: str) -> List[Dict[str, str]]:
+        path = os.path.join(self.docs_directory, relative_path)
+        mtime = os.path.getmtime(path)
+        cached = self._pages.get(relative_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            sections = self.chunker.sections(f)
+        self._pages[relative_path] = (mtime, sections)
+        return sections
+
+    def load_page(self, doc_path: str) -> Tuple[str, List[Dict[str, str]]]:
+        """The markdown file rendering `doc_path` and its sections; FileNotFoundError for unknown pages"""
+        relative_path = self.resolve(doc_path)
+        if relative_path is None:
+            raise FileNotFoundError(f"No page at {doc_path}")
+        return relative_path, self.page_sections(relative_path)
+
+    async def translate(self, doc_path: str, language: str) -> Dict[str, Any]:
+        if language not in LANGUAGES:
+            raise ValueError(f"Unsupported language {language!r}; expected one of {', '.join(LANGUAGES)}")
+        instructions = None
+        if language != SOURCE_LANGUAGE:
+            instructions = (
+                f"Translate each section into {LANGUAGES[language]}. Leave technical terms that are "
+                "usually written in English (ROS 2, URDF, Gazebo, API names) in English."
+            )
+        result = await self.transform("translate", doc_path, f"v{PROMPT_VERSION}:{language}", instructions)
+        return {**result, "language": language}
+
+    async def personalize(self, doc_path: str, software_background: Optional[str] = None,
+                          hardware_background: Optional[str] = None) -> Dict[str, Any]:
+        validate_background("software_background", software_background)
+        validate_background("hardware_background", hardware_background)
+        software, hardware = normalize_background(software_background), normalize_background(hardware_background)
+        instructions = None
+        if software or hardware:
+            # Quoted, so the reader's words read as a description rather than instructions
+            instructions = (
+                "Adapt each section for a reader with this background. "
+                f"Software: {json.dumps(software) if software else 'not given'}. "
+                f"Hardware: {json.dumps(hardware) if hardware else 'not given'}. "
+                "Keep every fact and code example. Add short explanations or analogies where the background "
+                "makes a concept unfamiliar, and do not over-explain what the reader already knows."
+            )
+        variant = f"v{PROMPT_VERSION}:{profile_key(software_background, hardware_background)}"
+        return await self.transform("personalize", doc_path, variant, instructions)
+
+    async def transform(self, kind: str, doc_path: str, variant: str, instructions: Optional[str]) -> Dict[str, Any]:
+        """
+        The page's sections rewritten per `instructions` (the source sections
+        when None), with an ETag over the outputs. Raises FileNotFoundError
+        for unknown pages and RuntimeError when generation fails.
+        """
+        # File checks and reads, and the cache's SQLite queries, run on worker threads
+        relative_path, sections = await asyncio.to_thread(self.load_page, doc_path)
+
+        generated = 0
+        if instructions is None:
+            outputs = [section["content"] for section in sections]
+        else:
+            hashes = [content_hash(section["content"]) for section in sections]
+            found = await self.cache.get_many_async(kind, relative_path, variant, hashes)
+            missing = {h: section["content"] for h, section in zip(hashes, sections) if h not in found}
+            if missing:
+                key = (kind, relative_path, variant, tuple(missing))
+                future = self._pending.get(key)
+                if future is None:
+                    if self.max_generations and len(self._pending) >= self.max_generations:
+                        self.rejected += 1
+                        raise TransformBusyError(f"{self.max_generations} page generations are already running")
+                    future = asyncio.ensure_future(self._generate(kind, relative_path, variant, instructions, missing))
+                    self._pending[key] = future
+                    future.add_done_callback(lambda _: self._pending.pop(key, None))
+                # Shielded: a reader who disconnects does not cancel a generation others wait on
+                found.update(await asyncio.shield(future))
+                generated = len(missing)
+            outputs = [found[h] for h in hashes]
+
+        etag = hashlib.sha256(json.dumps([kind, variant, outputs]).encode("utf-8")).hexdigest()[:32]
+        return {
+            "doc_path": relative_path,
+            "sections": [
+                {"heading": section["heading"], "content": output}
+                for section, output in zip(sections, outputs)
+            ],
+            "etag": f'"{etag}"',
+            "generated_sections": generated,
+        }
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        """Indexes of `texts` grouped into batches of up to batch_tokens"""
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and current_tokens + tokens > self.batch_tokens:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _rewrite_batch(self, instructions: str, texts: List[str]) -> List[str]:
+        messages = [
+            {"role": "system", "content": f"{instructions} {BATCH_FORMAT}"},
+            {"role": "user", "content": json.dumps({"sections": texts}, ensure_ascii=False)},
+        ]
+        # Translations into Urdu run to roughly twice the source tokens
+        max_tokens = min(self.max_output_tokens, 3 * sum(estimate_tokens(text) for text in texts) + 256)
+        self.completion_calls += 1
+        reply = await openai_manager.generate_completion_async(messages, max_tokens=max_tokens)
+        return parse_sections(reply, len(texts))
+
+    async def _generate(self, kind: str, relative_path: str, variant: str, instructions: str,
+                        missing: Dict[str, str]) -> Dict[str, str]:
+        hashes, texts = list(missing), list(missing.values())
+        batches = self._batches(texts)
+        results = await asyncio.gather(
+            *(self._rewrite_batch(instructions, [texts[i] for i in batch]) for batch in batches),
+            return_exceptions=True
+        )
+        outputs, errors = {}, []
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                continue
+            outputs.update((hashes[i], output) for i, output in zip(batch, result))
+        # Batches that succeeded are kept even if another failed
+        if outputs:
+            await self.cache.put_many_async(kind, relative_path, variant, outputs)
+            self.generated_sections += len(outputs)
+        if errors:
+            self.failures += 1
+            print(f"Error rewriting {relative_path} ({kind}): {errors[0]}")
+            raise RuntimeError(f"Could not {kind} {relative_path}")
+        return outputs
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "completion_calls": self.completion_calls,
+            "generated_sections": self.generated_sections,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "in_flight": len(self._pending),
+            **self.cache.stats(),
+        }
+
+def create_page_transformer() -> PageTransformer:
+    """
+    Build the transformer from DOCS_DIRECTORY, TRANSFORM_CACHE_PATH
+    ("" keeps the cache in memory), TRANSFORM_BATCH_TOKENS,
+    TRANSFORM_MAX_OUTPUT_TOKENS and TRANSFORM_MAX_GENERATIONS.
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.getenv(
+        "TRANSFORM_CACHE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".transform_cache.sqlite3")
+    )
+    return PageTransformer(
+        docs_directory=os.getenv("DOCS_DIRECTORY", os.path.join(project_root, "docs")),
+        cache=TransformCache(path or None),
+        route_base=os.getenv("DOCS_ROUTE_BASE", "/docs"),
+        batch_tokens=int(os.getenv("TRANSFORM_BATCH_TOKENS", "2000")),
+        max_output_tokens=int(os.getenv("TRANSFORM_MAX_OUTPUT_TOKENS", "4096")),
+        max_generations=int(os.getenv("TRANSFORM_MAX_GENERATIONS", "4"))
+    )
+
+# Global page transformer, created on first use
+page_transformer = Lazy(create_page_transformer, "page_transformer")
@@ -0,0 +1,217 @@
+import os
+import re
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from .config import load_environment
+from .openai_client import estimate_tokens
+
+# Load environment variables
+load_environment()
+
+SYSTEM_PROMPT = "You are an expert assistant for a textbook on Physical AI and Humanoid Robotics."
+
+PROMPT_TEMPLATE = """
+You are an expert assistant for a textbook on Physical AI and Humanoid Robotics.
+Answer the user's question using the provided context from the textbook.
+
+Context information:
+{context}
+
+Conversation history:
+{history}
+
+User question: {query}
+
+Please provide a comprehensive answer based on the context provided.
+If the context doesn't contain enough information to answer the question,
+please state that clearly and suggest what additional information might be needed.
+"""
+
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+
+# Chat format overhead per message and for priming the reply (OpenAI cookbook figures)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+# Shortest shared text treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+
+WORD = re.compile(r"\w+")
+
+def create_token_counter(model: str) -> Callable[[str], int]:
+    """
+    Count tokens with the model's tiktoken encoding. Falls back to the
+    character estimate when tiktoken or its encoding files are unavailable
+    (tiktoken downloads them on first use).
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Counting prompt tokens with the character estimate: {e}")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def join_overlapping(first: str, second: str) -> str:
+    """Concatenate two passages, writing text shared by first's end and second's start only once"""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        start = first.find(probe)
+        while start != -1:
+            if second.startswith(first[start:]):
+                return first + second[len(first) - start:]
+            start = first.find(probe, start + 1)
+    return f"{first}\n\n{second}"
+
+def shingles(text: str, size: int = 5) -> set:
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+class PromptBuilder:
+    """
+    Assembles the chat prompt within token budgets.
+
+    Retrieved chunks from the same source and section are merged when they
+    are adjacent (consecutive chunk_index) or overlap, passages mostly
+    contained in a higher-scoring one are dropped, and the rest fill
+    `context_tokens` in score order. The last `recent_messages` history
+    messages are kept verbatim, older ones are cut to `older_message_tokens`,
+    and history stops at `history_tokens`.
+    """
+
+    def __init__(self, context_tokens: int = 1200, history_tokens: int = 300, recent_messages: int = 2,
+                 older_message_tokens: int = 40, duplicate_threshold: float = 0.8,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.recent_messages = recent_messages
+        self.older_message_tokens = older_message_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.count_tokens = count_tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text at a word boundary to at most max_tokens"""
+        tokens = self.count_tokens(text)
+        original, limit = text, len(text)
+        while tokens > max_tokens and limit > 0:
+            limit = int(limit * max_tokens / tokens * 0.9)
+            cut = original[:limit]
+            text = (cut.rsplit(None, 1)[0] if " " in cut else cut) + "…"
+            tokens = self.count_tokens(text)
+        return text if tokens <= max_tokens else ""
+
+    def merge_passages(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge adjacent or overlapping chunks of the same source and section"""
+        groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            groups.setdefault((chunk.get("source", ""), chunk.get("section", "")), []).append(chunk)
+
+        passages = []
+        for group in groups.values():
+            # Chunks without a chunk_index (older ingests) keep retrieval order
+            group.sort(key=lambda chunk: -1 if chunk.get("chunk_index") is None else chunk["chunk_index"])
+            current = dict(group[0])
+            for chunk in group[1:]:
+                first_index, second_index = current.get("chunk_index"), chunk.get("chunk_index")
+                adjacent = first_index is not None and second_index is not None and second_index - first_index <= 1
+                joined = join_overlapping(current["content"], chunk["content"])
+                if adjacent or len(joined) < len(current["content"]) + len(chunk["content"]) + 2:
+                    current["content"] = joined
+                    current["score"] = max(current.get("score", 0), chunk.get("score", 0))
+                    current["chunk_index"] = second_index
+                else:
+                    passages.append(current)
+                    current = dict(chunk)
+            passages.append(current)
+        return passages
+
+    def drop_duplicates(self, passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep passages in score order, skipping any mostly contained in one already kept"""
+        kept, kept_shingles = [], []
+        for passage in sorted(passages, key=lambda passage: passage.get("score", 0), reverse=True):
+            passage_shingles = shingles(passage["content"])
+            if any(
+                len(passage_shingles & other) / max(min(len(passage_shingles), len(other)), 1) >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(passage)
+            kept_shingles.append(passage_shingles)
+        return kept
+
+    def build_context(self, chunks: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        passages = self.merge_passages(chunks)
+        merged = len(chunks) - len(passages)
+        unique = self.drop_duplicates(passages)
+
+        parts, used_tokens = [], 0
+        separator_tokens = self.count_tokens(PASSAGE_SEPARATOR)
+        for passage in unique:
+            part = f"Chapter: {passage.get('chapter', '')}\nSection: {passage.get('section', '')}\nContent: {passage['content']}"
+            tokens = self.count_tokens(part) + (separator_tokens if parts else 0)
+            if used_tokens + tokens > self.context_tokens:
+                if parts:
+                    continue
+                # Always send something: cut the best passage down to the budget
+                part = self.truncate(part, self.context_tokens)
+                tokens = self.count_tokens(part)
+            parts.append(part)
+            used_tokens += tokens
+
+        return PASSAGE_SEPARATOR.join(parts), {
+            "context_tokens": used_tokens,
+            "chunks_retrieved": len(chunks),
+            "chunks_merged": merged,
+            "duplicates_dropped": len(passages) - len(unique),
+            "passages_used": len(parts),
+        }
+
+    def build_history(self, conversation_history: Optional[List[Dict[str, str]]]) -> Tuple[str, Dict[str, Any]]:
+        history = conversation_history or []
+        lines, used_tokens = [], 0
+        # Newest first, so whatever does not fit is the oldest
+        for position, msg in enumerate(reversed(history)):
+            content = msg["content"]
+            if position >= self.recent_messages:
+                content = self.truncate(content, self.older_message_tokens)
+            line = f"{msg['role']}: {content}"
+            tokens = self.count_tokens(line) + 1
+            if used_tokens + tokens > self.history_tokens:
+                break
+            lines.append(line)
+            used_tokens += tokens
+        lines.reverse()
+        return "\n".join(lines), {
+            "history_tokens": used_tokens,
+            "history_messages": len(history),
+            "history_messages_used": len(lines),
+        }
+
+    def build(self, query: str, context_chunks: List[Dict[str, Any]],
+              conversation_history: Optional[List[Dict[str, str]]] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Return the chat messages and token accounting for this prompt"""
+        context, context_stats = self.build_context(context_chunks)
+        history, history_stats = self.build_history(conversation_history)
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": PROMPT_TEMPLATE.format(context=context, history=history, query=query)}
+        ]
+        prompt_tokens = REPLY_PRIMING_TOKENS + sum(
+            MESSAGE_OVERHEAD_TOKENS + self.count_tokens(message["content"]) for message in messages
+        )
+        return messages, {"prompt_tokens": prompt_tokens, **context_stats, **history_stats}
+
+def create_prompt_builder(model: str) -> PromptBuilder:
+    """Build the prompt builder from PROMPT_* environment settings"""
+    return PromptBuilder(
+        context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKENS", "1200")),
+        history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", "300")),
+        recent_messages=int(os.getenv("PROMPT_RECENT_MESSAGES", "2")),
+        older_message_tokens=int(os.getenv("PROMPT_OLDER_MESSAGE_TOKENS", "40")),
+        duplicate_threshold=float(os.getenv("PROMPT_DUPLICATE_THRESHOLD", "0.8")),
+        count_tokens=create_token_counter(model)
+    )
@@ -1,11 +1,75 @@
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+import hashlib
+import uuid
+import inspect
+import httpx
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, PointIdsList, Filter, FieldCondition, MatchValue, MatchAny,
+    PayloadSchemaType, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams
+)
+from typing import List, Dict, Any, Optional
+from .config import load_environment
+from .lazy import Lazy
+from .chunk_store import get_chunk_store
+from .openai_client import embedding_dimensions
+from .retrieval import FILTERABLE_FIELDS
+from .metrics import QDRANT_SECONDS, QDRANT_IN_FLIGHT, QDRANT_ERRORS
+from .circuit_breaker import create_circuit_breaker
 
 # Load environment variables
-load_dotenv()
+load_environment()
+
+# Manifest of indexed chunks written by ingest_textbook.py, keyed by point ID
+INGEST_MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ingest_manifest.json")
+)
+
+# Namespace for deterministic chunk point IDs
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2b9e-4d3a-5e8f-9a7b-0c1d2e3f4a5b")
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a chunk's content"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_point_id(source: str, text: str) -> str:
+    """Stable point ID derived from the chunk's source path and content hash"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}:{content_hash(text)}"))
+
+def build_payload_filter(filters: Optional[Dict[str, Any]]) -> Optional[Filter]:
+    """Translate {"field": value or [values]} into a Qdrant payload filter"""
+    if not filters:
+        return None
+    conditions = []
+    for field, accepted in filters.items():
+        if isinstance(accepted, (list, tuple, set)):
+            conditions.append(FieldCondition(key=field, match=MatchAny(any=list(accepted))))
+        else:
+            conditions.append(FieldCondition(key=field, match=MatchValue(value=accepted)))
+    return Filter(must=conditions)
+
+def quantization_config(mode: str):
+    """Qdrant quantization for QDRANT_QUANTIZATION: none, scalar (int8, 4x smaller) or binary (1 bit, 32x)"""
+    if mode == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if mode == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    if mode != "none":
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION: {mode}")
+    return None
+
+def connection_options(host: str, port: int, api_key: Optional[str]) -> Dict[str, Any]:
+    """Client arguments; constructing a client with them makes no network calls"""
+    if api_key:
+        options = {"url": host, "api_key": api_key}
+    else:
+        options = {"host": host, "port": port}
+    # Newer clients ask the server for its version in the constructor; skip that round trip
+    if "check_compatibility" in inspect.signature(QdrantClient.__init__).parameters:
+        options["check_compatibility"] = False
+    return options
 
 class QdrantManager:
     def __init__(self):
@@ -15,77 +79,248 @@ class QdrantManager:
         self.api_key = os.getenv("QDRANT_API_KEY")
         self.collection_name = os.getenv("QDRANT_COLLECTION", "textbook_chunks")
         
+        # Storage layout, applied when the collection is created
+        self.vector_size = embedding_dimensions()
+        self.quantization = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+        self.quantization_config = quantization_config(self.quantization)
+        self.vectors_on_disk = os.getenv("QDRANT_VECTORS_ON_DISK", "false").lower() in ("1", "true", "yes")
+        # Quantized candidates are rescored against the original vectors
+        self.search_params = None
+        if self.quantization_config is not None:
+            self.search_params = SearchParams(quantization=QuantizationSearchParams(
+                rescore=True,
+                oversampling=float(os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0"))
+            ))
+        
         # Initialize Qdrant client
-        if self.api_key:
-            self.client = QdrantClient(
-                url=self.host,
-                api_key=self.api_key
-            )
-        else:
-            self.client = QdrantClient(
-                host=self.host,
-                port=self.port
-            )
+        connection_args = connection_options(self.host, self.port, self.api_key)
+        self.client = QdrantClient(**connection_args)
         
-        # Create collection if it doesn't exist
-        self._create_collection_if_not_exists()
+        # Async client for the request path with a shared connection pool
+        max_connections = int(os.getenv("QDRANT_MAX_CONNECTIONS", "100"))
+        self.async_client = AsyncQdrantClient(
+            **connection_args,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        
+        # The collection is created on first write, so serving never waits on it
+        self._collection_checked = False
     
-    def _create_collection_if_not_exists(self):
-        """Create Qdrant collection if it doesn't exist"""
+    def ensure_collection(self):
+        """Create Qdrant collection if it doesn't exist (checked once per process)"""
+        if self._collection_checked:
+            return
         try:
             # Check if collection exists
             collections = self.client.get_collections()
             collection_names = [collection.name for collection in collections.collections]
             
             if self.collection_name not in collection_names:
-                # Create collection with vector size of 1536 (for OpenAI embeddings)
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=1536, distance=Distance.COSINE)
+                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE,
+                                                on_disk=self.vectors_on_disk),
+                    quantization_config=self.quantization_config
                 )
-                print(f"Created Qdrant collection: {self.collection_name}")
+                print(f"Created Qdrant collection: {self.collection_name} "
+                      f"({self.vector_size} dimensions, quantization {self.quantization})")
+                indexed_fields = set()
             else:
+                info = self.client.get_collection(self.collection_name)
+                existing_size = getattr(info.config.params.vectors, "size", None)
+                if existing_size is not None and existing_size != self.vector_size:
+                    raise ValueError(f"Collection {self.collection_name} holds {existing_size}-dimensional vectors "
+                                     f"but the embedding model returns {self.vector_size}; ingest into a new "
+                                     f"QDRANT_COLLECTION instead")
+                indexed_fields = set(info.payload_schema or {})
                 print(f"Collection {self.collection_name} already exists")
+            
+            # Keyword indexes keep chapter/source filters from scanning the whole collection
+            for field in FILTERABLE_FIELDS:
+                if field not in indexed_fields:
+                    self.client.create_payload_index(self.collection_name, field, field_schema=PayloadSchemaType.KEYWORD)
+            self._collection_checked = True
         except Exception as e:
             print(f"Error creating/checking collection: {e}")
     
-    def insert_chunks(self, chunks: List[Dict[str, Any]]):
-        """Insert document chunks into Qdrant"""
+    def insert_chunks(self, chunks: List[Dict[str, Any]], batch_size: int = 256) -> bool:
+        """
+        Upsert document chunks into Qdrant. Chunks carrying an "id" keep it;
+        otherwise a stable ID is derived from source and content.
+        """
+        self.ensure_collection()
+        store = get_chunk_store()
         try:
             points = []
-            for i, chunk in enumerate(chunks):
+            for chunk in chunks:
+                payload = {
+                    "chapter": chunk.get("chapter", ""),
+                    "section": chunk.get("section", ""),
+                    "source": chunk.get("source", ""),
+                    "doc_path": chunk.get("doc_path", ""),
+                    "chunk_index": chunk.get("chunk_index"),
+                    "content_hash": chunk.get("content_hash") or content_hash(chunk["content"])
+                }
+                # Without a chunk store the text travels in the payload
+                if store is None:
+                    payload["content"] = chunk["content"]
                 point = PointStruct(
-                    id=i,
+                    id=chunk.get("id") or chunk_point_id(chunk.get("source", ""), chunk["content"]),
                     vector=chunk["embedding"],
-                    payload={
-                        "content": chunk["content"],
-                        "chapter": chunk.get("chapter", ""),
-                        "section": chunk.get("section", ""),
-                        "source": chunk.get("source", "")
-                    }
+                    payload=payload
                 )
                 points.append(point)
             
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            # Text is stored before its point exists, so no search hit lacks it
+            if store is not None:
+                store.put_many([{"id": point.id, "content": chunk["content"]} for point, chunk in zip(points, chunks)])
+            
+            for start in range(0, len(points), batch_size):
+                with QDRANT_IN_FLIGHT.track("upsert"), QDRANT_SECONDS.time("upsert"):
+                    self.client.upsert(
+                        collection_name=self.collection_name,
+                        points=points[start:start + batch_size]
+                    )
             print(f"Inserted {len(points)} chunks into Qdrant")
+            return True
         except Exception as e:
             print(f"Error inserting chunks: {e}")
+            QDRANT_ERRORS.inc("upsert")
+            return False
     
-    def search_similar_chunks(self, query_vector: List[float], limit: int = 5):
-        """Search for similar chunks based on query vector"""
+    def delete_points(self, point_ids: List[Any]) -> bool:
+        """Delete points from the collection by ID"""
+        if not point_ids:
+            return True
         try:
-            search_result = self.client.search(
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=list(point_ids))
+            )
+            store = get_chunk_store()
+            if store is not None:
+                store.delete_many(point_ids)
+            print(f"Deleted {len(point_ids)} points from Qdrant")
+            return True
+        except Exception as e:
+            print(f"Error deleting points: {e}")
+            return False
+    
+    def list_point_ids(self, page_size: int = 1000) -> List[Any]:
+        """Return the IDs of every point in the collection"""
+        self.ensure_collection()
+        point_ids = []
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
                 collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=limit
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
             )
+            point_ids.extend(record.id for record in records)
+            if offset is None:
+                return point_ids
+    
+    def search_similar_chunks(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None):
+        """Search for similar chunks based on query vector, optionally restricted by payload filters"""
+        try:
+            with QDRANT_IN_FLIGHT.track("search"), QDRANT_SECONDS.time("search"):
+                search_result = self.client.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_vector,
+                    query_filter=build_payload_filter(filters),
+                    search_params=self.search_params,
+                    limit=limit
+                )
+            return search_result
+        except Exception as e:
+            print(f"Error searching chunks: {e}")
+            QDRANT_ERRORS.inc("search")
+            return []
+
+    async def search_similar_chunks_async(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None):
+        """
+        Async variant of search_similar_chunks. Like every async call it is
+        skipped (no results) while the Qdrant circuit breaker is open.
+        """
+        if not qdrant_breaker.allow():
+            return []
+        try:
+            with QDRANT_IN_FLIGHT.track("search"), QDRANT_SECONDS.time("search"):
+                search_result = await self.async_client.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_vector,
+                    query_filter=build_payload_filter(filters),
+                    search_params=self.search_params,
+                    limit=limit
+                )
+            qdrant_breaker.record_success()
             return search_result
         except Exception as e:
             print(f"Error searching chunks: {e}")
+            QDRANT_ERRORS.inc("search")
+            qdrant_breaker.record_failure()
             return []
+        except BaseException:
+            # Cancelled: give back a half-open probe
+            qdrant_breaker.release()
+            raise
+    
+    def retrieve_vectors(self, point_ids: List[Any]) -> Dict[str, Any]:
+        """Stored vectors of the given points by ID (as str)"""
+        if not point_ids:
+            return {}
+        try:
+            with QDRANT_IN_FLIGHT.track("retrieve"), QDRANT_SECONDS.time("retrieve"):
+                records = self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=list(point_ids),
+                    with_payload=False,
+                    with_vectors=True
+                )
+            return {str(record.id): record.vector for record in records if record.vector is not None}
+        except Exception as e:
+            print(f"Error retrieving vectors: {e}")
+            QDRANT_ERRORS.inc("retrieve")
+            return {}
+    
+    async def retrieve_vectors_async(self, point_ids: List[Any]) -> Dict[str, Any]:
+        """Async variant of retrieve_vectors"""
+        if not point_ids or not qdrant_breaker.allow():
+            return {}
+        try:
+            with QDRANT_IN_FLIGHT.track("retrieve"), QDRANT_SECONDS.time("retrieve"):
+                records = await self.async_client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=list(point_ids),
+                    with_payload=False,
+                    with_vectors=True
+                )
+            qdrant_breaker.record_success()
+            return {str(record.id): record.vector for record in records if record.vector is not None}
+        except Exception as e:
+            print(f"Error retrieving vectors: {e}")
+            QDRANT_ERRORS.inc("retrieve")
+            qdrant_breaker.record_failure()
+            return {}
+        except BaseException:
+            # Cancelled: give back a half-open probe
+            qdrant_breaker.release()
+            raise
+    
+    async def collection_info_async(self) -> Dict[str, Any]:
+        """Point count and status of the collection (raises if Qdrant or the collection is unavailable)"""
+        info = await self.async_client.get_collection(self.collection_name)
+        return {"collection": self.collection_name, "points": info.points_count, "collection_status": str(info.status)}
+    
+    async def aclose(self):
+        """Close the async client's connections"""
+        await self.async_client.close()
+
+# Guards the request path; module-level so admission control can read it before the client exists
+qdrant_breaker = create_circuit_breaker("qdrant")
 
-# Global Qdrant manager instance
-qdrant_manager = QdrantManager()
\ No newline at end of file
+# Global Qdrant manager instance, created on first use
+qdrant_manager = Lazy(QdrantManager, "qdrant_manager")
\ No newline at end of file
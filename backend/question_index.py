@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Iterable
+import numpy as np
+from .config import load_environment
+from .openai_client import openai_manager, estimate_tokens
+
+# Load environment variables
+load_environment()
+
+# Persisted question index written by ingest_textbook.py --questions
+QUESTION_INDEX_PATH = os.getenv(
+    "QUESTION_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".question_index")
+)
+
+# Part of every entry key: bump when the prompts change so older questions are regenerated
+PROMPT_VERSION = "1"
+
+QUESTION_FORMAT = (
+    'The user message is a JSON object {"chapter", "section", "passage"} from a robotics textbook. '
+    'Reply with only a JSON object {"questions": [{"question": ..., "answer": ...}, ...]}. '
+    'Each question must make sense on its own: name the topic instead of saying "this passage" or "this section". '
+    'Answer only from the passage, in at most 120 words of markdown; keep commands, code and identifiers exact.'
+)
+
+CHUNK_INSTRUCTIONS = (
+    "Write up to {count} questions a student reading this passage is most likely to ask and that the passage "
+    "fully answers: definitions of the key terms it introduces first, then what it explains or shows how to do."
+)
+
+PAGE_INSTRUCTIONS = (
+    "The passage is a whole chapter. Write up to {count} ways a student would ask for an overview of it "
+    "(what the chapter covers, a summary of its topic), all with the same answer: a summary of the chapter."
+)
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+def entry_key(kind: str, text: str, count: int) -> str:
+    """Key of the questions generated for a chunk or page: changes with its text and the prompts"""
+    return hashlib.sha256(f"{PROMPT_VERSION}\0{kind}\0{count}\0{text}".encode("utf-8")).hexdigest()
+
+def parse_questions(reply: str) -> List[Dict[str, str]]:
+    """The question/answer pairs of a generation reply; ValueError if it holds none"""
+    match = JSON_OBJECT.search(reply or "")
+    if not match:
+        raise ValueError("Completion holds no JSON object")
+    pairs = [
+        {"question": pair["question"].strip(), "answer": pair["answer"].strip()}
+        for pair in json.loads(match.group(0)).get("questions") or []
+        if isinstance(pair, dict) and isinstance(pair.get("question"), str) and isinstance(pair.get("answer"), str)
+        and pair["question"].strip() and pair["answer"].strip()
+    ]
+    if not pairs:
+        raise ValueError("Completion holds no questions")
+    return pairs
+
+def generation_items(chunks: Iterable[Dict[str, Any]], questions_per_chunk: int = 3, questions_per_page: int = 2,
+                     min_chunk_tokens: int = 40, page_tokens: int = 3000) -> List[Dict[str, Any]]:
+    """
+    What to generate questions for: every chunk of at least
+    `min_chunk_tokens`, and every page as a whole (its chunks in order, cut
+    at `page_tokens`) for overview questions.
+    """
+    items = []
+    pages: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        pages.setdefault(chunk.get("doc_path", ""), []).append(chunk)
+        if questions_per_chunk and estimate_tokens(chunk["content"]) >= min_chunk_tokens:
+            items.append({
+                "kind": "chunk",
+                "key": entry_key("chunk", chunk["content"], questions_per_chunk),
+                "count": questions_per_chunk,
+                "chapter": chunk.get("chapter", ""),
+                "section": chunk.get("section", ""),
+                "doc_path": chunk.get("doc_path", ""),
+                "text": chunk["content"],
+            })
+
+    for doc_path, page_chunks in sorted(pages.items()):
+        if not questions_per_page:
+            break
+        page_chunks.sort(key=lambda chunk: chunk.get("chunk_index") or 0)
+        parts, tokens = [], 0
+        for chunk in page_chunks:
+            tokens += estimate_tokens(chunk["content"])
+            if parts and tokens > page_tokens:
+                break
+            parts.append(chunk["content"])
+        text = "\n\n".join(parts)
+        items.append({
+            "kind": "page",
+            "key": entry_key("page", text, questions_per_page),
+            "count": questions_per_page,
+            "chapter": page_chunks[0].get("chapter", ""),
+            "section": "",
+            "doc_path": doc_path,
+            "text": text,
+        })
+    return items
+
+def generate_questions(item: Dict[str, Any]) -> List[Dict[str, str]]:
+    """One completion call: question/answer pairs grounded in the item's text"""
+    instructions = CHUNK_INSTRUCTIONS if item["kind"] == "chunk" else PAGE_INSTRUCTIONS
+    messages = [
+        {"role": "system", "content": f"{instructions.format(count=item['count'])} {QUESTION_FORMAT}"},
+        {"role": "user", "content": json.dumps(
+            {"chapter": item["chapter"], "section": item["section"], "passage": item["text"]}, ensure_ascii=False)},
+    ]
+    reply = openai_manager.generate_completion(messages, max_tokens=250 * item["count"] + 100)
+    return parse_questions(reply)[:item["count"]]
+
+class QuestionIndex:
+    """
+    Precomputed answers to likely questions, built at ingestion time.
+
+    Ingestion asks the completion model for the questions each chunk
+    answers (and overview questions for each page) with answers grounded in
+    that text only, and embeds the questions. At request time a question
+    whose embedding lies within `threshold` cosine similarity of a
+    precomputed one is answered from the index without a completion call.
+
+    On disk the index is a directory with vectors.npy and entries.json,
+    written by QuestionIndex.build and reloaded when ingestion rewrites it.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    ENTRIES_FILE = "entries.json"
+
+    def __init__(self, path: str, threshold: float = 0.92, reload_check_seconds: float = 5.0):
+        self.path = path
+        self.threshold = threshold
+        self.reload_check_seconds = reload_check_seconds
+        self.stamp_path = os.path.join(path, self.ENTRIES_FILE)
+        self._lock = threading.Lock()
+        self._loaded_stamp = None
+        self._checked_at = 0.0
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.entries: List[Dict[str, Any]] = []
+        self.hits = 0
+        self.misses = 0
+        self._maybe_reload(force=True)
+
+    @classmethod
+    def read(cls, path: str):
+        """Entries and their vectors as last written to `path` (empty if there is no index)"""
+        try:
+            vectors = np.load(os.path.join(path, cls.VECTORS_FILE))
+            with open(os.path.join(path, cls.ENTRIES_FILE), 'r', encoding='utf-8') as f:
+                entries = json.load(f)["entries"]
+        except FileNotFoundError:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        if len(vectors) != len(entries):
+            raise ValueError(f"Question index at {path} is inconsistent")
+        return entries, vectors
+
+    @classmethod
+    def write(cls, path: str, entries: List[Dict[str, Any]], vectors: np.ndarray):
+        """Atomically write entries with their (normalized) question vectors"""
+        os.makedirs(path, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(entries), -1)
+        if len(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        # Write vectors before entries: the entries file is the reload stamp
+        vectors_tmp = os.path.join(path, "vectors.tmp.npy")
+        np.save(vectors_tmp, vectors)
+        os.replace(vectors_tmp, os.path.join(path, cls.VECTORS_FILE))
+        entries_tmp = os.path.join(path, f"{cls.ENTRIES_FILE}.tmp")
+        with open(entries_tmp, 'w', encoding='utf-8') as f:
+            json.dump({"entries": entries}, f)
+        os.replace(entries_tmp, os.path.join(path, cls.ENTRIES_FILE))
+
+    @classmethod
+    def build(cls, path: str, chunks: Iterable[Dict[str, Any]], generate: bool = True, concurrency: int = 4,
+              **item_options) -> Dict[str, int]:
+        """
+        Bring the index at `path` up to date with the current chunk records.
+        Questions of unchanged chunks and pages are kept with their vectors,
+        those of chunks no longer in the docs are dropped, and (if `generate`)
+        missing ones are generated with up to `concurrency` completion calls
+        in flight and embedded. Items whose generation fails are left out and
+        retried by the next run. Returns counts of what was done.
+        """
+        try:
+            old_entries, old_vectors = cls.read(path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable question index {path}: {e}")
+            old_entries, old_vectors = [], np.zeros((0, 0), dtype=np.float32)
+
+        items = generation_items(chunks, **item_options)
+        current_keys = {item["key"] for item in items}
+        kept = [row for row, entry in enumerate(old_entries) if entry["key"] in current_keys]
+        entries = [old_entries[row] for row in kept]
+        vectors = [old_vectors[row] for row in kept]
+        existing_keys = {entry["key"] for entry in entries}
+        missing = [item for item in items if item["key"] not in existing_keys] if generate else []
+
+        failed = 0
+        fresh: List[Dict[str, Any]] = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(generate_questions, item): item for item in missing}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    pairs = future.result()
+                except Exception as e:
+                    print(f"Error generating questions for {item['doc_path']} ({item['kind']}): {e}")
+                    failed += 1
+                    continue
+                fresh.extend({
+                    "key": item["key"],
+                    "kind": item["kind"],
+                    "question": pair["question"],
+                    "answer": pair["answer"],
+                    "chapter": item["chapter"],
+                    "doc_path": item["doc_path"],
+                } for pair in pairs)
+
+        questions = [entry["question"] for entry in fresh]
+        embedded = 0
+        for batch in openai_manager.batch_texts(questions):
+            try:
+                batch_vectors = openai_manager.generate_embeddings_with_retry([questions[i] for i in batch])
+            except Exception as e:
+                print(f"Error embedding batch of {len(batch)} questions: {e}")
+                continue
+            entries.extend(fresh[i] for i in batch)
+            vectors.extend(batch_vectors)
+            embedded += len(batch)
+
+        if entries != old_entries:
+            cls.write(path, entries, np.asarray(vectors, dtype=np.float32))
+        print(f"Question index at {path}: {len(entries)} questions, {len(missing) - failed} chunks and pages "
+              f"generated, {failed} failed, {len(old_entries) - len(kept)} stale questions dropped")
+        return {"questions": len(entries), "generated": len(missing) - failed, "failed": failed,
+                "embedded": embedded, "dropped": len(old_entries) - len(kept)}
+
+    def _maybe_reload(self, force: bool = False):
+        """Reload the index if ingestion rewrote it since the last check"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_check_seconds:
+            return
+        self._checked_at = now
+        try:
+            stamp = os.path.getmtime(self.stamp_path)
+        except OSError:
+            if force:
+                print(f"Question index not found at {self.path}; run ingestion with --questions to build it")
+            self.vectors, self.entries, self._loaded_stamp = np.zeros((0, 0), dtype=np.float32), [], None
+            return
+        if stamp == self._loaded_stamp:
+            return
+        try:
+            entries, vectors = self.read(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading question index from {self.path}: {e}")
+            return
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.entries = entries
+        self._loaded_stamp = stamp
+        print(f"Loaded question index of {len(entries)} questions from {self.path}")
+
+    def match(self, query_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """The precomputed entry closest to the query (with its "score"), if within the threshold"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        with self._lock:
+            self._maybe_reload()
+            vectors, entries = self.vectors, self.entries
+            if not norm or not entries or vectors.shape[1] != len(query):
+                self.misses += 1
+                return None
+            scores = vectors @ (query / norm)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {**entries[best], "score": float(scores[best])}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "questions": len(self.entries),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def create_question_index() -> Optional[QuestionIndex]:
+    """Load the question index from environment settings (QUESTION_INDEX_ENABLED=false disables it)"""
+    if os.getenv("QUESTION_INDEX_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    return QuestionIndex(
+        QUESTION_INDEX_PATH,
+        threshold=float(os.getenv("QUESTION_INDEX_THRESHOLD", "0.92"))
+    )
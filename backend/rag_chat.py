@@ -1,127 +1,590 @@
-from typing import List, Dict, Any
-from .qdrant_client import qdrant_manager
+import os
+import time
+import asyncio
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 from .openai_client import openai_manager
+from .answer_cache import create_answer_cache
+from .question_index import create_question_index
+from .retrieval import create_retrieval_backend, reciprocal_rank_fusion, mmr_rerank, doc_path_candidates
+from .lexical_index import LexicalIndex, LEXICAL_INDEX_PATH
+from .prompt_builder import create_prompt_builder
+from .chunk_store import get_chunk_store
+from .lazy import Lazy
+from .metrics import stage, record_duration, RAG_STAGE_SECONDS, RAG_REQUESTS, RAG_IN_FLIGHT, RAG_PROMPT_TOKENS, \
+    RAG_RETRIEVAL_SCOPE
+
+GENERATION_ERROR_MESSAGE = "Sorry, I encountered an error while generating a response."
+
+# Retrieval-only answers given under overload or while OpenAI is unavailable
+DEGRADED_MESSAGE = "The assistant is very busy right now, so here are the most relevant passages from the textbook:"
+DEGRADED_EMPTY_MESSAGE = "The assistant is very busy right now. Please try again in a moment."
 
 class RAGChat:
     def __init__(self):
-        pass
+        # Vector retrieval backend (Qdrant or the in-process local index)
+        self.retriever = create_retrieval_backend()
+        
+        # Hybrid mode fuses BM25 and vector rankings with reciprocal rank fusion
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "dense").lower()
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+        self.lexical_index = LexicalIndex.load(LEXICAL_INDEX_PATH) if self.retrieval_mode == "hybrid" else None
+        
+        # Degraded answers are retrieved without OpenAI, from BM25 when the query embedding is not cached
+        self.fallback_index = self.lexical_index or LexicalIndex.load(LEXICAL_INDEX_PATH)
+        self.degraded_chunks = int(os.getenv("DEGRADED_ANSWER_CHUNKS", "3"))
+        
+        # Questions asked on a book page search that page first and widen to the
+        # whole book when its best match scores below scope_min_score
+        self.scope_min_score = float(os.getenv("SCOPED_RETRIEVAL_MIN_SCORE", "0.75"))
+        self.docs_route_base = os.getenv("DOCS_ROUTE_BASE", "/docs")
+        
+        # "parallel" embeds the query variants and runs the scoped and widened
+        # searches concurrently instead of one after another (async path)
+        self.retrieval_pipeline = os.getenv("RETRIEVAL_PIPELINE", "sequential").lower()
+        
+        # "mmr" reorders the top RERANK_CANDIDATES hits for diversity before prompt assembly
+        self.rerank = os.getenv("RERANK", "none").lower()
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.5"))
+        
+        # Semantic cache of complete answers; invalidated when ingestion changes the index
+        self.answer_cache = create_answer_cache(stamp_path=self.retriever.stamp_path)
+        
+        # Answers to likely questions precomputed at ingestion (ingest_textbook.py --questions)
+        self.question_index = create_question_index()
+        
+        # Token-budgeted prompt assembly with chunk merging and deduplication
+        self.prompt_builder = create_prompt_builder(openai_manager.completion_model)
     
-    def retrieve_relevant_chunks(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def _chunks_from_results(self, search_results, contents: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
         """
-        Retrieve relevant chunks from Qdrant based on the query.
+        Extract payload from search results. Text kept in the chunk store
+        (payloads without "content") is fetched for these hits only, unless
+        already given as `contents`.
+        """
+        if contents is None:
+            store = get_chunk_store()
+            missing = [result.id for result in search_results if "content" not in result.payload]
+            contents = store.get_many(missing) if store is not None and missing else {}
+        
+        relevant_chunks = []
+        for result in search_results:
+            chunk_data = {
+                "content": result.payload.get("content", contents.get(str(result.id), "")),
+                "chapter": result.payload.get("chapter", ""),
+                "section": result.payload.get("section", ""),
+                "source": result.payload.get("source", ""),
+                "chunk_index": result.payload.get("chunk_index"),
+                "score": result.score
+            }
+            relevant_chunks.append(chunk_data)
+        return relevant_chunks
+    
+    async def _chunks_from_results_async(self, search_results) -> List[Dict[str, Any]]:
+        """
+        Async variant of _chunks_from_results; the chunk store is read in a
+        worker thread.
+        """
+        store = get_chunk_store()
+        missing = [result.id for result in search_results if "content" not in result.payload]
+        contents = await asyncio.to_thread(store.get_many, missing) if store is not None and missing else {}
+        return self._chunks_from_results(search_results, contents)
+    
+    def _search(self, query: str, query_embedding: List[float], limit: int, filters: Optional[Dict[str, Any]]):
+        """
+        Dense or hybrid search. Returns the results and the best dense score,
+        which (unlike fused rank scores) is comparable across searches.
+        """
+        if self.lexical_index is None:
+            with stage("search"):
+                search_results = self.retriever.search(query_embedding, limit, filters)
+            return search_results, search_results[0].score if search_results else None
+        depth = max(limit, self.hybrid_candidates)
+        with stage("search"):
+            dense_results = self.retriever.search(query_embedding, depth, filters)
+        with stage("lexical"):
+            lexical_results = self.lexical_index.search(query, depth, filters)
+        return reciprocal_rank_fusion([dense_results, lexical_results], limit), \
+            dense_results[0].score if dense_results else None
+    
+    async def _search_async(self, query: str, query_embedding: List[float], limit: int, filters: Optional[Dict[str, Any]]):
+        """
+        Async variant of _search.
+        """
+        if self.lexical_index is None:
+            with stage("search"):
+                search_results = await self.retriever.search_async(query_embedding, limit, filters)
+            return search_results, search_results[0].score if search_results else None
+        depth = max(limit, self.hybrid_candidates)
+        with stage("search"):
+            dense_results = await self.retriever.search_async(query_embedding, depth, filters)
+        with stage("lexical"):
+            lexical_results = self.lexical_index.search(query, depth, filters)
+        return reciprocal_rank_fusion([dense_results, lexical_results], limit), \
+            dense_results[0].score if dense_results else None
+    
+    def _in_scope(self, scope: Optional[Dict[str, Any]], search_results, top_score: Optional[float]) -> bool:
+        """Whether scoped results are good enough to answer from; counts the outcome"""
+        if not scope:
+            return False
+        in_scope = bool(search_results) and top_score is not None and top_score >= self.scope_min_score
+        RAG_RETRIEVAL_SCOPE.inc("scoped" if in_scope else "widened")
+        return in_scope
+    
+    def page_scope(self, doc_path: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Payload filter for the chunks of the book page at `doc_path`, if it is one"""
+        candidates = doc_path_candidates(doc_path, self.docs_route_base) if doc_path else []
+        return {"doc_path": candidates} if candidates else None
+    
+    def _candidates(self, limit: int) -> int:
+        """Hits to retrieve for `limit` chunks: reranking chooses from a deeper list"""
+        return max(limit, self.rerank_candidates) if self.rerank == "mmr" else limit
+    
+    def _rerank(self, search_results, limit: int):
+        if self.rerank != "mmr" or len(search_results) <= 1:
+            return search_results[:limit]
+        with stage("rerank"):
+            hit_vectors = self.retriever.get_vectors([hit.id for hit in search_results])
+            return mmr_rerank(search_results, hit_vectors, limit, self.mmr_lambda)
+    
+    async def _rerank_async(self, search_results, limit: int):
+        if self.rerank != "mmr" or len(search_results) <= 1:
+            return search_results[:limit]
+        with stage("rerank"):
+            hit_vectors = await self.retriever.get_vectors_async([hit.id for hit in search_results])
+            return mmr_rerank(search_results, hit_vectors, limit, self.mmr_lambda)
+    
+    def retrieve_relevant_chunks(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant chunks from the retrieval backend based on the query.
+        Filters restrict results by payload "chapter", "source" or "doc_path".
+        """
+        relevant_chunks, _ = self.retrieve_scoped_chunks(query, None, limit, filters)
+        return relevant_chunks
+    
+    def retrieve_scoped_chunks(self, query: str, scope: Optional[Dict[str, Any]], limit: int = 5,
+                               filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Retrieve within `scope` (see page_scope) first, widening to `filters`
+        alone with the same query embedding when the best scoped match scores
+        below scope_min_score. Also returns whether the chunks came from the scope.
         """
         try:
             # Generate embedding for the query
-            query_embedding = openai_manager.generate_embedding(query)
-            
-            # Search for similar chunks in Qdrant
-            search_results = qdrant_manager.search_similar_chunks(query_embedding, limit)
+            with stage("embed"):
+                query_embedding = openai_manager.generate_embedding(query)
             
-            # Extract payload from search results
-            relevant_chunks = []
-            for result in search_results:
-                chunk_data = {
-                    "content": result.payload.get("content", ""),
-                    "chapter": result.payload.get("chapter", ""),
-                    "section": result.payload.get("section", ""),
-                    "source": result.payload.get("source", ""),
-                    "score": result.score
-                }
-                relevant_chunks.append(chunk_data)
+            depth = self._candidates(limit)
+            if scope:
+                search_results, top_score = self._search(query, query_embedding, depth, {**(filters or {}), **scope})
+                if self._in_scope(scope, search_results, top_score):
+                    return self._chunks_from_results(self._rerank(search_results, limit)), True
             
-            return relevant_chunks
+            # Search for similar chunks
+            search_results, _ = self._search(query, query_embedding, depth, filters)
+            return self._chunks_from_results(self._rerank(search_results, limit)), False
         except Exception as e:
             print(f"Error retrieving relevant chunks: {e}")
-            return []
+            return [], False
     
-    def generate_response(self, query: str, context_chunks: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None) -> str:
+    async def retrieve_relevant_chunks_async(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
-        Generate a response using the retrieved context chunks and conversation history.
+        Async variant of retrieve_relevant_chunks.
+        """
+        relevant_chunks, _ = await self.retrieve_scoped_chunks_async(query, None, limit, filters)
+        return relevant_chunks
+    
+    async def retrieve_scoped_chunks_async(self, query: str, scope: Optional[Dict[str, Any]], limit: int = 5,
+                                           filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Async variant of retrieve_scoped_chunks.
         """
         try:
-            # Build context from retrieved chunks
-            context_parts = []
-            for chunk in context_chunks:
-                context_part = f"Chapter: {chunk['chapter']}\nSection: {chunk['section']}\nContent: {chunk['content']}"
-                context_parts.append(context_part)
-            
-            context = "\n\n---\n\n".join(context_parts)
+            with stage("embed"):
+                query_embedding = await openai_manager.generate_embedding_async(query)
+            depth = self._candidates(limit)
+            if scope:
+                search_results, top_score = await self._search_async(
+                    query, query_embedding, depth, {**(filters or {}), **scope})
+                if self._in_scope(scope, search_results, top_score):
+                    return await self._chunks_from_results_async(
+                        await self._rerank_async(search_results, limit)), True
+            search_results, _ = await self._search_async(query, query_embedding, depth, filters)
+            return await self._chunks_from_results_async(await self._rerank_async(search_results, limit)), False
+        except Exception as e:
+            print(f"Error retrieving relevant chunks: {e}")
+            return [], False
+    
+    async def retrieve_pipelined_async(self, query: str, selected_text: Optional[str], scope: Optional[Dict[str, Any]],
+                                       limit: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Speculative variant of retrieve_scoped_chunks_async: the query with and
+        without the selected text are embedded concurrently (one batched call
+        through the query batcher), and every variant is searched within the
+        scope and across the whole book at once. The scoped or the widened
+        rankings are then chosen by the best scoped score, fused, deduplicated
+        and reranked. Returns the chunks and whether they came from the scope.
+        """
+        try:
+            variants = [self._enhance_query(query, selected_text)] + ([query] if selected_text else [])
+            with stage("embed"):
+                embeddings = await asyncio.gather(*(openai_manager.generate_embedding_async(v) for v in variants))
             
-            # Build conversation history context
-            history_context = ""
-            if conversation_history:
-                history_lines = []
-                for msg in conversation_history[-5:]:  # Last 5 messages
-                    history_lines.append(f"{msg['role']}: {msg['content']}")
-                history_context = "\n".join(history_lines)
+            depth = self._candidates(limit)
+            filter_sets = [scope, None] if scope else [None]
+            runs = await asyncio.gather(*(
+                self._search_async(variant, embedding, depth, filters)
+                for filters in filter_sets
+                for variant, embedding in zip(variants, embeddings)
+            ))
             
-            # Create prompt for OpenAI
-            prompt = f"""
-You are an expert assistant for a textbook on Physical AI and Humanoid Robotics. 
-Answer the user's question using the provided context from the textbook.
-
-Context information:
-{context}
-
-Conversation history:
-{history_context}
-
-User question: {query}
+            # Scoped runs come first; the widened ones are the last len(variants)
+            scoped = False
+            if scope:
+                scoped_runs = runs[:len(variants)]
+                top_scores = [top_score for _, top_score in scoped_runs if top_score is not None]
+                scoped = self._in_scope(scope, [hit for results, _ in scoped_runs for hit in results],
+                                        max(top_scores) if top_scores else None)
+            chosen = [results for results, _ in (runs[:len(variants)] if scoped else runs[-len(variants):])]
+            search_results = reciprocal_rank_fusion(chosen, depth) if len(chosen) > 1 else chosen[0]
+            return await self._chunks_from_results_async(await self._rerank_async(search_results, limit)), scoped
+        except Exception as e:
+            print(f"Error retrieving relevant chunks: {e}")
+            return [], False
+    
+    async def _retrieve_for_chat_async(self, query: str, selected_text: Optional[str],
+                                       scope: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], bool]:
+        """Chat retrieval through the configured pipeline"""
+        if self.retrieval_pipeline == "parallel":
+            return await self.retrieve_pipelined_async(query, selected_text, scope)
+        return await self.retrieve_scoped_chunks_async(self._enhance_query(query, selected_text), scope)
+    
+    def build_prompt(self, query: str, context_chunks: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Build the chat messages within the context and history token budgets.
+        Also returns the prompt's token accounting.
+        """
+        with stage("prompt"):
+            messages, prompt_stats = self.prompt_builder.build(query, context_chunks, conversation_history)
+        RAG_PROMPT_TOKENS.observe(prompt_stats["prompt_tokens"])
+        return messages, prompt_stats
+    
+    def _messages(self, messages: Union[List[Dict[str, str]], str], context_chunks: List[Dict[str, Any]] = None,
+                  conversation_history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        # The earlier generate_response(query, context_chunks, conversation_history) form
+        if isinstance(messages, str):
+            return self.build_prompt(messages, context_chunks or [], conversation_history)[0]
+        return messages
 
-Please provide a comprehensive answer based on the context provided. 
-If the context doesn't contain enough information to answer the question, 
-please state that clearly and suggest what additional information might be needed.
-"""
-            
+    def generate_response(self, messages: Union[List[Dict[str, str]], str], context_chunks: List[Dict[str, Any]] = None,
+                          conversation_history: List[Dict[str, str]] = None) -> str:
+        """
+        Generate a response for the prompt built by build_prompt. The earlier
+        form, generate_response(query, context_chunks, conversation_history),
+        is still accepted and builds that prompt first.
+        """
+        messages = self._messages(messages, context_chunks, conversation_history)
+        try:
             # Generate response using OpenAI
-            messages = [
-                {"role": "system", "content": "You are an expert assistant for a textbook on Physical AI and Humanoid Robotics."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            response = openai_manager.generate_completion(messages)
+            with stage("completion"):
+                response = openai_manager.generate_completion(messages)
             return response
         except Exception as e:
             print(f"Error generating response: {e}")
-            return "Sorry, I encountered an error while generating a response."
+            return GENERATION_ERROR_MESSAGE
     
-    def chat_with_rag(self, query: str, conversation_history: List[Dict[str, str]] = None, selected_text: str = None) -> Dict[str, Any]:
+    async def generate_response_async(self, messages: Union[List[Dict[str, str]], str],
+                                      context_chunks: List[Dict[str, Any]] = None,
+                                      conversation_history: List[Dict[str, str]] = None) -> str:
         """
-        Perform a complete RAG chat interaction.
+        Async variant of generate_response.
         """
+        messages = self._messages(messages, context_chunks, conversation_history)
         try:
-            # If there's selected text, use it as additional context
-            if selected_text:
-                # Add the selected text to the query for better context
-                enhanced_query = f"{query}\n\nSelected text for context: {selected_text}"
-            else:
-                enhanced_query = query
+            with stage("completion"):
+                return await openai_manager.generate_completion_async(messages)
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            return GENERATION_ERROR_MESSAGE
+    
+    def chat_with_rag(self, query: str, conversation_history: List[Dict[str, str]] = None, selected_text: str = None,
+                      doc_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Perform a complete RAG chat interaction. `doc_path` is the book page
+        the reader is on, whose chunks are searched first.
+        """
+        RAG_IN_FLIGHT.inc()
+        try:
+            scope = self.page_scope(doc_path)
+            
+            # Serve repeated questions from the semantic answer cache, and
+            # likely ones from the precomputed question index
+            cache_embedding = None
+            if self._cacheable(conversation_history):
+                with stage("answer_cache"):
+                    cache_embedding = openai_manager.generate_embedding(query)
+                    cached, outcome = self._lookup_answer(cache_embedding, selected_text, scope)
+                if cached:
+                    RAG_REQUESTS.inc(outcome)
+                    return {**cached, "prompt_tokens": 0}
             
-            # Retrieve relevant chunks
-            relevant_chunks = self.retrieve_relevant_chunks(enhanced_query)
+            enhanced_query = self._enhance_query(query, selected_text)
             
-            # If no relevant chunks found, try with original query
-            if not relevant_chunks and selected_text:
-                relevant_chunks = self.retrieve_relevant_chunks(query)
+            # Retrieve relevant chunks, from the reader's page if it answers the question
+            relevant_chunks, scoped = self.retrieve_scoped_chunks(enhanced_query, scope)
             
             # Generate response
-            response = self.generate_response(enhanced_query, relevant_chunks, conversation_history)
+            messages, prompt_stats = self.build_prompt(enhanced_query, relevant_chunks, conversation_history)
+            response = self.generate_response(messages)
+            if response == GENERATION_ERROR_MESSAGE and relevant_chunks:
+                RAG_REQUESTS.inc("degraded")
+                return self._degraded_result(relevant_chunks)
             
-            # Extract sources from relevant chunks
-            sources = list(set([chunk["chapter"] for chunk in relevant_chunks if chunk["chapter"]]))
+            result = self._build_result(response, relevant_chunks, prompt_stats)
+            self._store_answer(cache_embedding, selected_text, result, scope if scoped else None)
+            RAG_REQUESTS.inc("error" if response == GENERATION_ERROR_MESSAGE else "answered")
+            return result
+        except Exception as e:
+            print(f"Error in RAG chat: {e}")
+            RAG_REQUESTS.inc("error")
+            return self._error_result()
+        finally:
+            RAG_IN_FLIGHT.dec()
+    
+    async def chat_with_rag_async(self, query: str, conversation_history: List[Dict[str, str]] = None, selected_text: str = None,
+                                  doc_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async variant of chat_with_rag that never blocks the event loop on I/O.
+        """
+        RAG_IN_FLIGHT.inc()
+        try:
+            scope = self.page_scope(doc_path)
+            cache_embedding = None
+            if self._cacheable(conversation_history):
+                with stage("answer_cache"):
+                    cache_embedding = await openai_manager.generate_embedding_async(query)
+                    cached, outcome = self._lookup_answer(cache_embedding, selected_text, scope)
+                if cached:
+                    RAG_REQUESTS.inc(outcome)
+                    return {**cached, "prompt_tokens": 0}
             
-            return {
-                "response": response,
-                "sources": sources,
-                "chunks_used": len(relevant_chunks)
-            }
+            enhanced_query = self._enhance_query(query, selected_text)
+            
+            relevant_chunks, scoped = await self._retrieve_for_chat_async(query, selected_text, scope)
+            
+            messages, prompt_stats = self.build_prompt(enhanced_query, relevant_chunks, conversation_history)
+            response = await self.generate_response_async(messages)
+            if response == GENERATION_ERROR_MESSAGE:
+                # OpenAI failed or its circuit breaker is open: answer from the passages instead
+                RAG_REQUESTS.inc("degraded")
+                return self._degraded_result(relevant_chunks or await self._degraded_chunks_async(enhanced_query))
+            
+            result = self._build_result(response, relevant_chunks, prompt_stats)
+            self._store_answer(cache_embedding, selected_text, result, scope if scoped else None)
+            RAG_REQUESTS.inc("answered")
+            return result
         except Exception as e:
+            # Upstream failures (rate limits, open circuit breakers) still get the passages when there are any
             print(f"Error in RAG chat: {e}")
-            return {
-                "response": "Sorry, I encountered an error while processing your request.",
-                "sources": [],
-                "chunks_used": 0
-            }
+            fallback_chunks = await self._degraded_chunks_async(self._enhance_query(query, selected_text))
+            RAG_REQUESTS.inc("degraded" if fallback_chunks else "error")
+            return self._degraded_result(fallback_chunks) if fallback_chunks else self._error_result()
+        finally:
+            RAG_IN_FLIGHT.dec()
+    
+    async def stream_chat_with_rag(self, query: str, conversation_history: List[Dict[str, str]] = None, selected_text: str = None,
+                                   doc_path: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming RAG chat. Yields a "sources" event as soon as retrieval
+        finishes, then "delta" events with completion text, then "done"
+        (or "error" if generation fails part way).
+        """
+        with RAG_IN_FLIGHT.track():
+            async for event in self._stream_events(query, conversation_history, selected_text, self.page_scope(doc_path)):
+                yield event
+    
+    async def _stream_events(self, query: str, conversation_history: Optional[List[Dict[str, str]]], selected_text: Optional[str],
+                             scope: Optional[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        cache_embedding = None
+        if self._cacheable(conversation_history):
+            try:
+                with stage("answer_cache"):
+                    cache_embedding = await openai_manager.generate_embedding_async(query)
+                    cached, outcome = self._lookup_answer(cache_embedding, selected_text, scope)
+            except Exception as e:
+                print(f"Error checking answer cache: {e}")
+                cached = None
+            if cached:
+                RAG_REQUESTS.inc(outcome)
+                yield {"type": "sources", "sources": cached["sources"]}
+                yield {"type": "delta", "content": cached["response"]}
+                yield {"type": "done", "chunks_used": cached["chunks_used"], "prompt_tokens": 0, "cached": True}
+                return
+        
+        enhanced_query = self._enhance_query(query, selected_text)
+        
+        relevant_chunks, scoped = await self._retrieve_for_chat_async(query, selected_text, scope)
+        
+        messages, prompt_stats = self.build_prompt(enhanced_query, relevant_chunks, conversation_history)
+        result = self._build_result("", relevant_chunks, prompt_stats)
+        yield {"type": "sources", "sources": result["sources"]}
+        
+        deltas = []
+        try:
+            with stage("completion"):
+                started = time.perf_counter()
+                async for delta in openai_manager.stream_completion_async(messages):
+                    if not deltas:
+                        record_duration(RAG_STAGE_SECONDS, time.perf_counter() - started, "first_token")
+                    deltas.append(delta)
+                    yield {"type": "delta", "content": delta}
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            fallback_chunks = [] if deltas else relevant_chunks or await self._degraded_chunks_async(enhanced_query)
+            if fallback_chunks:
+                # Nothing streamed yet, so the passages can still stand in for the answer
+                RAG_REQUESTS.inc("degraded")
+                degraded = self._degraded_result(fallback_chunks)
+                if not relevant_chunks:
+                    yield {"type": "sources", "sources": degraded["sources"]}
+                yield {"type": "delta", "content": degraded["response"]}
+                yield {"type": "done", "chunks_used": degraded["chunks_used"], "prompt_tokens": 0, "degraded": True}
+                return
+            RAG_REQUESTS.inc("error")
+            yield {"type": "error", "message": GENERATION_ERROR_MESSAGE}
+            return
+        
+        RAG_REQUESTS.inc("answered")
+        result["response"] = "".join(deltas)
+        self._store_answer(cache_embedding, selected_text, result, scope if scoped else None)
+        yield {"type": "done", "chunks_used": result["chunks_used"], "prompt_tokens": result["prompt_tokens"]}
+    
+    async def answer_degraded_async(self, query: str, conversation_history: List[Dict[str, str]] = None,
+                                    selected_text: str = None, doc_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Answer without calling OpenAI, for requests shed under overload or
+        made while an upstream circuit breaker is open: a cached or
+        precomputed answer when the query's embedding is already cached,
+        otherwise the most relevant passages quoted with their sources.
+        """
+        with RAG_IN_FLIGHT.track():
+            scope = self.page_scope(doc_path)
+            if self._cacheable(conversation_history):
+                cache_embedding = await openai_manager.cached_embedding_async(query)
+                if cache_embedding is not None:
+                    cached, outcome = self._lookup_answer(cache_embedding, selected_text, scope)
+                    if cached:
+                        RAG_REQUESTS.inc(outcome)
+                        return {**cached, "prompt_tokens": 0}
+            RAG_REQUESTS.inc("degraded")
+            return self._degraded_result(await self._degraded_chunks_async(self._enhance_query(query, selected_text)))
+    
+    async def stream_degraded(self, query: str, conversation_history: List[Dict[str, str]] = None,
+                              selected_text: str = None, doc_path: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """answer_degraded_async as the events of stream_chat_with_rag"""
+        result = await self.answer_degraded_async(query, conversation_history, selected_text, doc_path)
+        yield {"type": "sources", "sources": result["sources"]}
+        yield {"type": "delta", "content": result["response"]}
+        yield {"type": "done", "chunks_used": result["chunks_used"], "prompt_tokens": 0,
+               "degraded": result.get("degraded", False), "cached": not result.get("degraded", False)}
+    
+    async def _degraded_chunks_async(self, query: str) -> List[Dict[str, Any]]:
+        """Top chunks without an OpenAI call: dense search if the query's embedding is cached, else BM25"""
+        search_results = []
+        try:
+            query_embedding = await openai_manager.cached_embedding_async(query)
+            if query_embedding is not None:
+                with stage("search"):
+                    search_results = await self.retriever.search_async(query_embedding, self.degraded_chunks)
+            if not search_results and self.fallback_index is not None:
+                with stage("lexical"):
+                    search_results = self.fallback_index.search(query, self.degraded_chunks)
+            return await self._chunks_from_results_async(search_results)
+        except Exception as e:
+            print(f"Error retrieving chunks for a degraded answer: {e}")
+            return []
+    
+    def _degraded_result(self, relevant_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """A retrieval-only answer: the top passages with their chapter and section"""
+        passages = []
+        for chunk in relevant_chunks[:self.degraded_chunks]:
+            heading = " > ".join(part for part in (chunk["chapter"], chunk["section"]) if part)
+            passages.append(f"**{heading}**\n\n{chunk['content']}" if heading else chunk["content"])
+        result = self._build_result(
+            "\n\n".join([DEGRADED_MESSAGE] + passages) if passages else DEGRADED_EMPTY_MESSAGE,
+            relevant_chunks[:self.degraded_chunks]
+        )
+        return {**result, "degraded": True}
+    
+    def _cacheable(self, conversation_history: Optional[List[Dict[str, str]]]) -> bool:
+        """
+        Answers depend on history, so only first questions go through the
+        answer cache and the question index.
+        """
+        return (self.answer_cache is not None or self.question_index is not None) and not conversation_history
+    
+    def _lookup_answer(self, query_embedding: List[float], selected_text: Optional[str],
+                       scope: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        A cached or precomputed answer for the query, and the request outcome
+        to count it as. Precomputed answers are generated without any
+        selection, so questions about selected text are never served from them.
+        """
+        if self.answer_cache is not None:
+            cached = self.answer_cache.lookup(query_embedding, selected_text, scope)
+            if cached:
+                return cached, "cached"
+        if self.question_index is not None and not selected_text:
+            entry = self.question_index.match(query_embedding)
+            if entry:
+                return {
+                    "response": entry["answer"],
+                    "sources": [entry["chapter"]] if entry["chapter"] else [],
+                    "chunks_used": 1,
+                    "prompt_tokens": 0
+                }, "precomputed"
+        return None, ""
+    
+    def _store_answer(self, cache_embedding: Optional[List[float]], selected_text: Optional[str], result: Dict[str, Any],
+                      scope: Optional[Dict[str, Any]] = None):
+        """
+        Cache a successful answer; failed generations and empty retrievals are
+        not cached. Answers from a page scope are only reused on that page.
+        """
+        if self.answer_cache is None or cache_embedding is None or not result["chunks_used"] or not result["response"]:
+            return
+        if result["response"] == GENERATION_ERROR_MESSAGE:
+            return
+        self.answer_cache.store(cache_embedding, selected_text, result, scope)
+    
+    def _enhance_query(self, query: str, selected_text: str = None) -> str:
+        """
+        Add the selected text to the query for better context.
+        """
+        if selected_text:
+            return f"{query}\n\nSelected text for context: {selected_text}"
+        return query
+    
+    def _build_result(self, response: str, relevant_chunks: List[Dict[str, Any]], prompt_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Package the response with the sources extracted from the relevant chunks
+        and the prompt's token count.
+        """
+        sources = list(set([chunk["chapter"] for chunk in relevant_chunks if chunk["chapter"]]))
+        return {
+            "response": response,
+            "sources": sources,
+            "chunks_used": len(relevant_chunks),
+            "prompt_tokens": prompt_stats["prompt_tokens"] if prompt_stats else 0
+        }
+    
+    def _error_result(self) -> Dict[str, Any]:
+        return {
+            "response": "Sorry, I encountered an error while processing your request.",
+            "sources": [],
+            "chunks_used": 0,
+            "prompt_tokens": 0
+        }
 
-# Global RAG chat instance
-rag_chat = RAGChat()
\ No newline at end of file
+# Global RAG chat instance, created on first use
+rag_chat = Lazy(RAGChat, "rag_chat")
\ No newline at end of file
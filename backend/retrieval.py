@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional, NamedTuple, Iterable
+from urllib.parse import urlparse
+import numpy as np
+from .config import load_environment
+
+# Load environment variables
+load_environment()
+
+# Directory of the in-process index written by ingest_textbook.py --local-index
+LOCAL_INDEX_PATH = os.getenv(
+    "LOCAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_index")
+)
+
+# The site's baseUrl (docusaurus.config.js): deployed page routes start with it
+SITE_BASE_URL = os.getenv("SITE_BASE_URL", "/physical_AI_and_humanoid_robotics_textbook/")
+
+# Payload fields that retrieval filters may constrain
+FILTERABLE_FIELDS = ("chapter", "source", "doc_path")
+
+def doc_path_candidates(doc_path: str, route_base: str = "/docs", site_base: str = SITE_BASE_URL) -> List[str]:
+    """
+    Markdown files that may render a page, as stored in the "doc_path"
+    payload field (relative to the docs directory). Accepts a page route or
+    URL, with or without the site's base URL ("/docs/module1/",
+    "/physical_AI_and_humanoid_robotics_textbook/docs/module1") or a file
+    path ("module1.md"); returns [] for pages outside the docs.
+    """
+    path = urlparse(doc_path.strip()).path.strip("/")
+    site = site_base.strip("/")
+    if site and (path == site or path.startswith(f"{site}/")):
+        path = path[len(site):].strip("/")
+    base = route_base.strip("/")
+    if base:
+        if path != base and not path.startswith(f"{base}/"):
+            return []
+        path = path[len(base):].strip("/")
+    if not path:
+        return []
+    if path.endswith((".md", ".mdx")):
+        return [path]
+    return [f"{path}.md", f"{path}/index.md"]
+
+# Set bits per byte value, for NumPy versions without bitwise_count
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def binary_codes(vectors: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+    """
+    One sign bit per dimension, packed into uint64 words (rows padded to a
+    multiple of 64 bits). Computed in blocks so a memory-mapped matrix is
+    never read into memory at once.
+    """
+    rows, dimensions = vectors.shape
+    words = -(-dimensions // 64)
+    codes = np.zeros((rows, words * 8), dtype=np.uint8)
+    for start in range(0, rows, block_rows):
+        packed = np.packbits(np.asarray(vectors[start:start + block_rows]) > 0, axis=1)
+        codes[start:start + len(packed), :packed.shape[1]] = packed
+    return codes.view(np.uint64)
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Differing bits between every row of `codes` and `query_code`"""
+    differing = codes ^ query_code
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(differing).sum(axis=1, dtype=np.uint32)
+    return POPCOUNT[differing.view(np.uint8)].sum(axis=1, dtype=np.uint32)
+
+class SearchHit(NamedTuple):
+    """Search result with the same shape as a Qdrant ScoredPoint"""
+    id: Any
+    score: float
+    payload: Dict[str, Any]
+
+class RetrievalBackend:
+    """
+    Interface for vector retrieval used by RAGChat. Filters map a payload
+    field ("chapter", "source" or "doc_path") to a value or list of accepted
+    values.
+    """
+    # File whose modification means the indexed content changed (if any)
+    stamp_path: Optional[str] = None
+
+    def search(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        raise NotImplementedError
+
+    async def search_async(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        return self.search(query_vector, limit, filters)
+
+    def get_vectors(self, point_ids: List[Any]) -> Dict[str, Any]:
+        """Stored vectors by point ID (as str), for reranking; unknown IDs are left out"""
+        raise NotImplementedError
+
+    async def get_vectors_async(self, point_ids: List[Any]) -> Dict[str, Any]:
+        return self.get_vectors(point_ids)
+
+    async def check(self) -> Dict[str, Any]:
+        """Verify the backend can serve searches (raises if not); details go to /ready"""
+        return {}
+
+    async def aclose(self):
+        """Release any connections held by the backend"""
+
+class QdrantRetrievalBackend(RetrievalBackend):
+    """Retrieval over the network from the Qdrant collection"""
+
+    def __init__(self):
+        from .qdrant_client import qdrant_manager, INGEST_MANIFEST_PATH
+        self.manager = qdrant_manager
+        self.stamp_path = INGEST_MANIFEST_PATH
+
+    def search(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        return self.manager.search_similar_chunks(query_vector, limit, filters)
+
+    async def search_async(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        return await self.manager.search_similar_chunks_async(query_vector, limit, filters)
+
+    def get_vectors(self, point_ids: List[Any]) -> Dict[str, Any]:
+        return self.manager.retrieve_vectors(point_ids)
+
+    async def get_vectors_async(self, point_ids: List[Any]) -> Dict[str, Any]:
+        return await self.manager.retrieve_vectors_async(point_ids)
+
+    async def check(self) -> Dict[str, Any]:
+        # Also opens the first pooled connection
+        info = await self.manager.collection_info_async()
+        if not info["points"]:
+            raise RuntimeError(f"Qdrant collection {info['collection']} is empty")
+        return info
+
+    async def aclose(self):
+        if self.manager.is_initialized():
+            await self.manager.aclose()
+
+class LocalVectorIndex(RetrievalBackend):
+    """
+    In-process index: all chunk vectors in one contiguous float32 matrix with
+    L2-normalized rows, so cosine similarity is a single matrix-vector product
+    and top-k is an argpartition. The matrix can be memory-mapped from disk.
+
+    On disk the index is a directory with vectors.npy and payloads.json, written
+    by LocalVectorIndex.build (see ingest_textbook.py --local-index).
+
+    With binary quantization only one sign bit per dimension is held in
+    memory (32x smaller than float32); the float32 matrix stays memory-mapped
+    on disk. A search ranks every chunk by Hamming distance, then rescores
+    the best `limit * oversampling` candidates exactly against their float32
+    rows, so only those pages of the matrix are read.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    PAYLOADS_FILE = "payloads.json"
+
+    def __init__(self, path: str, mmap: bool = False, reload_check_seconds: float = 5.0,
+                 quantization: str = "none", oversampling: float = 4.0):
+        if quantization not in ("none", "binary"):
+            raise ValueError(f"Unknown local index quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.oversampling = oversampling
+        # The float32 matrix is only read for rescoring, so keep it on disk
+        self.mmap = mmap or quantization == "binary"
+        self.reload_check_seconds = reload_check_seconds
+        self.stamp_path = os.path.join(path, self.PAYLOADS_FILE)
+        self._lock = threading.Lock()
+        self._loaded_stamp = None
+        self._checked_at = 0.0
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.codes: Optional[np.ndarray] = None
+        self.ids: List[Any] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._field_values: Dict[str, np.ndarray] = {}
+        self._maybe_reload(force=True)
+
+    @classmethod
+    def build(cls, path: str, chunks: Iterable[Dict[str, Any]], include_content: bool = True,
+              count: Optional[int] = None):
+        """
+        Write chunk records (with "embedding") as an index directory. Without
+        `include_content` the text is left to the chunk store. Given `count`,
+        `chunks` may be a stream: rows go straight to a memory-mapped
+        vectors file and payloads to disk as they arrive, so the index is
+        never held in memory. A stream shorter than `count` raises
+        ValueError and leaves the previous index in place.
+        """
+        os.makedirs(path, exist_ok=True)
+        if count is None:
+            chunks = list(chunks)
+            count = len(chunks)
+        vectors_tmp = os.path.join(path, "vectors.tmp.npy")
+        payloads_tmp = os.path.join(path, f"{cls.PAYLOADS_FILE}.tmp")
+        vectors = None
+        ids = []
+        try:
+            with open(payloads_tmp, 'w', encoding='utf-8') as f:
+                f.write('{"payloads": [')
+                for row, chunk in enumerate(chunks):
+                    if row == count:
+                        raise ValueError(f"more than the expected {count} chunks for the local index")
+                    vector = np.asarray(chunk["embedding"], dtype=np.float32)
+                    if vectors is None:
+                        vectors = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=np.float32,
+                                                            shape=(count, len(vector)))
+                    norm = np.linalg.norm(vector)
+                    vectors[row] = vector / norm if norm else vector
+                    f.write(("," if row else "") + json.dumps({
+                        **({"content": chunk["content"]} if include_content else {}),
+                        "chapter": chunk.get("chapter", ""),
+                        "section": chunk.get("section", ""),
+                        "source": chunk.get("source", ""),
+                        "doc_path": chunk.get("doc_path", ""),
+                        "chunk_index": chunk.get("chunk_index"),
+                    }))
+                    ids.append(chunk.get("id", row))
+                f.write('], "ids": ')
+                json.dump(ids, f)
+                f.write("}")
+            if len(ids) != count:
+                raise ValueError(f"expected {count} chunks for the local index, got {len(ids)}")
+            if vectors is None:
+                np.save(vectors_tmp, np.zeros((0,), dtype=np.float32))
+            else:
+                vectors.flush()
+                del vectors
+        except BaseException:
+            for tmp_path in (vectors_tmp, payloads_tmp):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+
+        # Write vectors before payloads: the payloads file is the reload stamp
+        os.replace(vectors_tmp, os.path.join(path, cls.VECTORS_FILE))
+        os.replace(payloads_tmp, os.path.join(path, cls.PAYLOADS_FILE))
+        print(f"Wrote local index of {count} chunks to {path}")
+
+    def _maybe_reload(self, force: bool = False):
+        """Reload the index if ingestion rewrote it since the last check"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_check_seconds:
+            return
+        self._checked_at = now
+        try:
+            stamp = os.path.getmtime(self.stamp_path)
+        except OSError:
+            if force:
+                print(f"Local index not found at {self.path}")
+            return
+        if stamp == self._loaded_stamp:
+            return
+
+        try:
+            vectors = np.load(os.path.join(self.path, self.VECTORS_FILE), mmap_mode="r" if self.mmap else None)
+            with open(self.stamp_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading local index from {self.path}: {e}")
+            return
+        if not self.mmap:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) != len(data["payloads"]):
+            print(f"Local index at {self.path} is inconsistent; keeping the previous one")
+            return
+
+        self.vectors = vectors
+        self.codes = binary_codes(vectors) if self.quantization == "binary" and len(vectors) else None
+        self.ids = data["ids"]
+        self.payloads = data["payloads"]
+        self._rows = {str(point_id): row for row, point_id in enumerate(self.ids)}
+        self._field_values = {
+            field: np.asarray([payload.get(field, "") for payload in self.payloads], dtype=object)
+            for field in FILTERABLE_FIELDS
+        }
+        self._loaded_stamp = stamp
+        print(f"Loaded local index of {len(self.payloads)} chunks from {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Index size; vectors of a memory-mapped matrix are only paged in as searches touch them"""
+        with self._lock:
+            vectors, codes = self.vectors, self.codes
+            return {
+                "chunks": len(self.payloads),
+                "quantization": self.quantization,
+                "in_memory_vector_bytes": codes.nbytes if codes is not None else (0 if self.mmap else vectors.nbytes),
+                "mapped_vector_bytes": vectors.nbytes if self.mmap else 0,
+            }
+
+    async def check(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_reload()
+        stats = self.stats()
+        if not stats["chunks"]:
+            raise RuntimeError(f"Local index at {self.path} is empty or missing")
+        return {"path": self.path, **stats}
+
+    def _filter_mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        mask = None
+        for field, accepted in filters.items():
+            if field not in self._field_values:
+                raise ValueError(f"Cannot filter on payload field {field!r}")
+            values = self._field_values[field]
+            if isinstance(accepted, (list, tuple, set)):
+                field_mask = np.isin(values, list(accepted))
+            else:
+                field_mask = values == accepted
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    def _rescore_candidates(self, vectors: np.ndarray, codes: np.ndarray, query: np.ndarray, limit: int,
+                            mask: Optional[np.ndarray]) -> List[Any]:
+        """Binary-quantized search: Hamming shortlist, then exact scores for the shortlist"""
+        distances = hamming_distances(codes, binary_codes(query[None, :])[0])
+        if mask is not None:
+            distances = np.where(mask, distances, np.iinfo(np.uint32).max)
+        shortlist = min(len(distances), max(limit, int(limit * self.oversampling)))
+        candidates = np.argpartition(distances, shortlist - 1)[:shortlist]
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        # Ascending row order turns the memory-mapped reads into a forward scan
+        candidates.sort()
+        scores = np.asarray(vectors[candidates]) @ query
+        order = np.argsort(-scores)[:limit]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+    def get_vectors(self, point_ids: List[Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_reload()
+            vectors, rows = self.vectors, self._rows
+        found = {str(point_id): rows[str(point_id)] for point_id in point_ids if str(point_id) in rows}
+        return {point_id: np.asarray(vectors[row]) for point_id, row in found.items()}
+
+    def search(self, query_vector: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        with self._lock:
+            self._maybe_reload()
+            vectors, codes, ids, payloads = self.vectors, self.codes, self.ids, self.payloads
+            mask = self._filter_mask(filters) if filters else None
+        if not len(payloads) or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        if codes is not None:
+            return [
+                SearchHit(id=ids[i], score=score, payload=payloads[i])
+                for i, score in self._rescore_candidates(vectors, codes, query, limit, mask)
+            ]
+
+        scores = vectors @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(id=ids[i], score=float(scores[i]), payload=payloads[i])
+            for i in top
+            if scores[i] != -np.inf
+        ]
+
+def create_retrieval_backend() -> RetrievalBackend:
+    """Pick the retrieval backend from RETRIEVAL_BACKEND ("qdrant" or "local")"""
+    backend = os.getenv("RETRIEVAL_BACKEND", "qdrant").lower()
+    if backend == "local":
+        return LocalVectorIndex(
+            path=LOCAL_INDEX_PATH,
+            mmap=os.getenv("LOCAL_INDEX_MMAP", "false").lower() in ("1", "true", "yes"),
+            quantization=os.getenv("LOCAL_INDEX_QUANTIZATION", "none").lower(),
+            oversampling=float(os.getenv("LOCAL_INDEX_OVERSAMPLING", "4.0"))
+        )
+    if backend != "qdrant":
+        raise ValueError(f"Unknown RETRIEVAL_BACKEND: {backend}")
+    return QdrantRetrievalBackend()
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], limit: int = 5, k: int = 60) -> List[SearchHit]:
+    """
+    Fuse several ranked hit lists: each hit scores sum(1 / (k + rank)) over
+    the lists it appears in. Hits are matched by point ID.
+    """
+    scores: Dict[Any, float] = {}
+    hits: Dict[Any, Any] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            key = str(hit.id)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            hits.setdefault(key, hit)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [SearchHit(id=hits[key].id, score=score, payload=hits[key].payload) for key, score in fused]
+
+def mmr_rerank(hits: List[Any], hit_vectors: Dict[str, Any], limit: int = 5, diversity_lambda: float = 0.7) -> List[Any]:
+    """
+    Maximal marginal relevance: repeatedly take the hit maximizing
+    lambda * relevance - (1 - lambda) * (cosine to the hits already taken).
+    Relevance is the hit's retrieval score scaled to [0, 1] over the
+    candidates, so dense, fused and multi-query rankings rerank alike.
+    Hits without a vector in `hit_vectors` keep their order after the others.
+    """
+    with_vectors = [hit for hit in hits if str(hit.id) in hit_vectors]
+    without_vectors = [hit for hit in hits if str(hit.id) not in hit_vectors]
+    if len(with_vectors) <= 1:
+        return (with_vectors + without_vectors)[:limit]
+
+    candidates = np.asarray([hit_vectors[str(hit.id)] for hit in with_vectors], dtype=np.float32)
+    candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    similarity = candidates @ candidates.T
+    scores = np.asarray([hit.score for hit in with_vectors], dtype=np.float32)
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(limit, len(with_vectors)):
+        marginal = diversity_lambda * relevance - (1 - diversity_lambda) * redundancy
+        marginal[selected] = -np.inf
+        pick = int(np.argmax(marginal))
+        selected.append(pick)
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return ([with_vectors[i] for i in selected] + without_vectors)[:limit]
@@ -0,0 +1,136 @@
+import asyncio
+
+from backend.admission import AdmissionController
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        holder = await controller.admit("a")
+        first = asyncio.create_task(controller.admit("b"))
+        second = asyncio.create_task(controller.admit("c"))
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 2
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        assert first.cancelled()
+        assert controller.stats()["queued"] == 1
+
+        holder.release()
+        admitted = await second
+        assert (admitted.mode, admitted.reason) == ("full", "queued")
+        admitted.release()
+        assert controller.in_flight == 0
+
+    run(scenario())
+
+def test_slot_handed_to_a_cancelled_waiter_is_not_lost():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        holder = await controller.admit("a")
+        first = asyncio.create_task(controller.admit("b"))
+        second = asyncio.create_task(controller.admit("c"))
+        await asyncio.sleep(0)
+
+        # The slot goes to the first waiter, which is cancelled before it runs
+        holder.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        if not first.cancelled():
+            # Some Python versions' wait_for return the result over the cancellation
+            first.result().release()
+        admitted = await second
+        assert admitted.mode == "full"
+        assert controller.in_flight == 1
+
+        admitted.release()
+        assert controller.in_flight == 0
+        assert controller.stats()["queued"] == 0
+
+    run(scenario())
+
+def test_request_that_would_miss_its_deadline_is_degraded_at_once():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1.0)
+        # The recent service time says a queued request would wait about 2s
+        controller.service_seconds = 2.0
+        holder = await controller.admit("a")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        shed = await controller.admit("b")
+        assert (shed.mode, shed.reason) == ("degraded", "deadline")
+        assert loop.time() - started < 0.5
+        assert controller.degraded_in_flight == 1
+        shed.release()
+        holder.release()
+        assert (controller.in_flight, controller.degraded_in_flight) == (0, 0)
+
+    run(scenario())
+
+def test_queued_request_past_its_deadline_is_degraded():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        holder = await controller.admit("a")
+        timed_out = await controller.admit("b")
+        assert (timed_out.mode, timed_out.reason) == ("degraded", "deadline")
+        assert controller.stats()["queued"] == 0
+        timed_out.release()
+        holder.release()
+
+    run(scenario())
+
+def test_client_over_its_rate_is_degraded_not_rejected():
+    async def scenario():
+        controller = AdmissionController(user_rate=1.0, user_burst=2)
+        tickets = [await controller.admit("10.0.0.1") for _ in range(3)]
+        assert [t.mode for t in tickets] == ["full", "full", "degraded"]
+        assert tickets[-1].reason == "user_rate"
+        # Other clients keep their own bucket
+        other = await controller.admit("10.0.0.2")
+        assert other.mode == "full"
+        for ticket in tickets + [other]:
+            ticket.release()
+
+    run(scenario())
+
+def test_per_client_rate_is_off_by_default(monkeypatch):
+    from backend.admission import create_admission_controller
+
+    monkeypatch.delenv("CHAT_USER_RATE_LIMIT_PER_MINUTE", raising=False)
+    controller = create_admission_controller()
+
+    async def scenario():
+        for _ in range(40):
+            ticket = await controller.admit("127.0.0.1")
+            assert ticket.mode == "full"
+            ticket.release()
+
+    run(scenario())
+
+def test_degraded_answers_beyond_the_limit_are_rejected():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, max_degraded=1)
+        holder = await controller.admit("a")
+        degraded = await controller.admit("b")
+        rejected = await controller.admit("c")
+        assert (degraded.mode, degraded.reason) == ("degraded", "queue_full")
+        assert (rejected.mode, rejected.reason) == ("rejected", "overloaded")
+        assert rejected.retry_after >= 1.0
+        degraded.release()
+        holder.release()
+
+    run(scenario())
+
+def test_client_rate_limiter_keys_and_evicts():
+    from backend.admission import ClientRateLimiter
+
+    limiter = ClientRateLimiter(rate=1.0, burst=2, max_clients=2)
+    assert [limiter.retry_after("10.0.0.1") for _ in range(2)] == [0.0, 0.0]
+    assert limiter.retry_after("10.0.0.1") > 0
+    assert limiter.retry_after("10.0.0.2") == 0.0
+    limiter.retry_after("10.0.0.3")
+    assert limiter.stats() == {"clients": 2, "limited": 1}
+    assert ClientRateLimiter(rate=0.0).retry_after("10.0.0.1") == 0.0
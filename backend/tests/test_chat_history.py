@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from backend.chat_history import migrate_chat_history, parse_history_cursor
+from backend.models import Base
+
+# chat_history as created by the first release
+BASELINE_TABLE = (
+    "CREATE TABLE chat_history (id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR NOT NULL, "
+    "message TEXT NOT NULL, role VARCHAR NOT NULL, timestamp DATETIME)"
+)
+
+def test_baseline_table_is_migrated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.sqlite3'}")
+    with engine.begin() as connection:
+        connection.execute(text(BASELINE_TABLE))
+        connection.execute(text("CREATE INDEX ix_chat_history_id ON chat_history (id)"))
+        connection.execute(text(
+            "INSERT INTO chat_history (user_id, message, role, timestamp) VALUES "
+            "('alice', 'hi', 'user', '2024-01-01'), ('alice', 'hello', 'assistant', '2024-01-01'), "
+            "('bob', 'hey', 'user', '2024-01-02')"
+        ))
+    Base.metadata.create_all(bind=engine)
+    migrate_chat_history(engine)
+    # Idempotent
+    migrate_chat_history(engine)
+
+    columns = {column["name"]: column for column in inspect(engine).get_columns("chat_history")}
+    assert columns["user_id"]["nullable"]
+    assert {index["name"] for index in inspect(engine).get_indexes("chat_history")} >= {
+        "ix_chat_history_user_id_timestamp", "ix_chat_history_conversation_id_timestamp"
+    }
+    with engine.begin() as connection:
+        rows = connection.execute(text("SELECT user_id, conversation_id FROM chat_history ORDER BY id")).all()
+        # Anonymous messages can be written now
+        connection.execute(text(
+            "INSERT INTO chat_history (conversation_id, message, role) VALUES ('c', 'anonymous', 'user')"
+        ))
+    assert [user for user, _ in rows] == ["alice", "alice", "bob"]
+    # One random conversation per earlier user
+    assert rows[0][1] == rows[1][1] != rows[2][1]
+    assert len(rows[0][1]) == 32 and "alice" not in rows[0][1]
+
+def test_current_table_is_left_alone(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.sqlite3'}")
+    Base.metadata.create_all(bind=engine)
+
+    def schema():
+        return [(column["name"], column["nullable"]) for column in inspect(engine).get_columns("chat_history")]
+
+    before = schema()
+    migrate_chat_history(engine)
+    assert schema() == before
+
+def test_malformed_cursors_are_rejected():
+    assert parse_history_cursor("2024-01-01T00:00:00_7")[1] == 7
+    for cursor in ("", "7", "yesterday_7", "2024-01-01T00:00:00_x"):
+        with pytest.raises(ValueError):
+            parse_history_cursor(cursor)
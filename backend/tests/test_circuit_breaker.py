@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from backend.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+def open_breaker(reset_seconds: float = 0.05) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=reset_seconds)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+def test_open_breaker_fails_fast():
+    breaker = open_breaker(reset_seconds=60)
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.stats()["rejected"] == 1
+
+def test_half_open_lets_a_single_probe_through_then_closes():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.available()
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.available()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["opened"] == 2
+    # The next probe comes after another reset period
+    time.sleep(0.06)
+    assert breaker.allow()
+
+def test_retry_after_extends_the_open_period():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure(retry_after=60)
+    time.sleep(0.02)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_zero_threshold_never_opens():
+    breaker = CircuitBreaker("test", failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_cancelled_probe_is_given_back(monkeypatch):
+    import asyncio
+    from backend import openai_client
+
+    breaker = open_breaker()
+    monkeypatch.setattr(openai_client, "openai_breaker", breaker)
+    manager = object.__new__(openai_client.OpenAIManager)
+    time.sleep(0.06)
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    async def scenario():
+        # The client disconnects while the half-open probe is in flight
+        probe = asyncio.create_task(manager._acall("chat", hang))
+        await asyncio.sleep(0)
+        assert not breaker.available()
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.available()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from backend.embedding_batcher import EmbeddingBatcher
+
+def test_concurrent_requests_share_one_call():
+    calls = []
+
+    async def embed_many(texts):
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed_many, window_ms=5, max_batch=64)
+        return await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a"]))
+
+    assert asyncio.run(scenario()) == [[1.0], [2.0], [1.0]]
+    assert calls == [["a", "bb"]]
+
+def test_short_result_fails_every_caller():
+    async def embed_many(texts):
+        return [[1.0]] * (len(texts) - 1)
+
+    async def scenario():
+        batcher = EmbeddingBatcher(embed_many, window_ms=5, max_batch=64)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.embed(text) for text in ["a", "b", "c"]), return_exceptions=True), 1.0
+        )
+        return results, batcher
+
+    results, batcher = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not batcher._sending
+
+def test_cancelled_send_fails_its_callers():
+    async def scenario():
+        sending = asyncio.Event()
+
+        async def embed_many(texts):
+            sending.set()
+            await asyncio.sleep(60)
+
+        batcher = EmbeddingBatcher(embed_many, window_ms=1, max_batch=64)
+        caller = asyncio.create_task(batcher.embed("a"))
+        await sending.wait()
+        for task in list(batcher._sending):
+            task.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(caller, 1.0)
+
+    asyncio.run(scenario())
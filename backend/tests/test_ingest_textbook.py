@@ -0,0 +1,95 @@
+import os
+
+from backend import ingest_textbook
+from backend.ingest_textbook import IngestionPipeline
+
+class FakeQdrant:
+    collection_name = "test_chunks"
+
+    def __init__(self):
+        self.points = {}
+
+    def insert_chunks(self, chunks):
+        self.points.update((chunk["id"], chunk["doc_path"]) for chunk in chunks)
+        return True
+
+    def delete_points(self, point_ids):
+        for point_id in point_ids:
+            self.points.pop(str(point_id), None)
+        return True
+
+    def list_point_ids(self):
+        return list(self.points)
+
+    def doc_paths(self):
+        return sorted(set(self.points.values()))
+
+class FakeOpenAI:
+    embedding_batch_size = 4
+
+    def __init__(self):
+        self.failing = None
+
+    def batch_texts(self, texts):
+        return [list(range(i, min(i + 4, len(texts)))) for i in range(0, len(texts), 4)]
+
+    def generate_embeddings_with_retry(self, texts):
+        if self.failing and any(self.failing in text for text in texts):
+            raise RuntimeError("rate limited")
+        return [[1.0, 0.0] for _ in texts]
+
+def setup(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text("# A\n\nAlpha text about balance.\n", encoding="utf-8")
+    (docs / "b.md").write_text("# B\n\nBeta text about actuators.\n", encoding="utf-8")
+    qdrant, openai = FakeQdrant(), FakeOpenAI()
+    monkeypatch.setattr(ingest_textbook, "qdrant_manager", qdrant)
+    monkeypatch.setattr(ingest_textbook, "openai_manager", openai)
+
+    def run(full=False):
+        pipeline = IngestionPipeline(str(docs), workers=1, full=full, manifest_path=str(tmp_path / "manifest.json"))
+        try:
+            return pipeline.run(), pipeline
+        finally:
+            pipeline.close()
+
+    assert run()[0]
+    assert qdrant.doc_paths() == ["a.md", "b.md"]
+    return docs, qdrant, openai, run
+
+def test_unreadable_file_keeps_its_points(tmp_path, monkeypatch):
+    docs, qdrant, _, run = setup(tmp_path, monkeypatch)
+    (docs / "b.md").write_bytes(b"# B\n\n\xff\xfe not utf-8\n")
+
+    succeeded, pipeline = run()
+    assert not succeeded
+    assert pipeline.failed_files == {"b.md"}
+    assert qdrant.doc_paths() == ["a.md", "b.md"]
+    # Nor does a full run prune anything
+    assert not run(full=True)[0]
+    assert qdrant.doc_paths() == ["a.md", "b.md"]
+
+def test_failed_embedding_keeps_the_old_points(tmp_path, monkeypatch):
+    docs, qdrant, openai, run = setup(tmp_path, monkeypatch)
+    old_points = set(qdrant.points)
+    (docs / "b.md").write_text("# B\n\nBeta text, rewritten.\n", encoding="utf-8")
+    openai.failing = "rewritten"
+
+    succeeded, pipeline = run()
+    assert not succeeded
+    assert pipeline.failed_files == {"b.md"}
+    assert set(qdrant.points) == old_points
+
+    # The next good run replaces them
+    openai.failing = None
+    assert run()[0]
+    assert qdrant.doc_paths() == ["a.md", "b.md"]
+    assert set(qdrant.points) != old_points
+    assert len(qdrant.points) == len(old_points)
+
+def test_deleted_file_is_still_pruned(tmp_path, monkeypatch):
+    docs, qdrant, _, run = setup(tmp_path, monkeypatch)
+    os.remove(docs / "b.md")
+    assert run()[0]
+    assert qdrant.doc_paths() == ["a.md"]
@@ -0,0 +1,21 @@
+from backend.lexical_index import LexicalIndex
+
+CHUNKS = [
+    {"id": "p1", "content": "Humanoid robots keep their balance with a zero moment point controller.",
+     "chapter": "module1", "section": "Balance", "source": "docs/module1.md", "doc_path": "module1.md"},
+    {"id": "p2", "content": "ROS 2 nodes talk over topics and services.",
+     "chapter": "module2", "section": "Nodes", "source": "docs/module2.md", "doc_path": "module2.md"},
+]
+
+def test_written_index_loads_like_a_built_one(tmp_path):
+    path = str(tmp_path / "lexical.json")
+    LexicalIndex.write(path, iter(CHUNKS))
+    loaded, built = LexicalIndex.load(path), LexicalIndex.build(CHUNKS)
+    assert (loaded.ids, loaded.payloads, loaded.doc_lengths) == (built.ids, built.payloads, built.doc_lengths)
+
+    hits = loaded.search("how do robots balance", limit=1)
+    assert [hit.id for hit in hits] == ["p1"]
+    assert loaded.search("balance", filters={"doc_path": "module2.md"}) == []
+
+def test_missing_index_loads_as_none(tmp_path):
+    assert LexicalIndex.load(str(tmp_path / "missing.json")) is None
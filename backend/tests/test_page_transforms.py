@@ -0,0 +1,50 @@
+import asyncio
+
+from backend.page_transforms import PageTransformer, TransformCache
+
+def scanned(cache: TransformCache):
+    return cache._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(output)), 0) FROM transforms").fetchone()
+
+def test_cache_counters_follow_writes_and_replacements(tmp_path):
+    path = str(tmp_path / "transforms.sqlite3")
+    cache = TransformCache(path)
+    cache.put_many("translate", "intro.md", "v1:ur", {"a": "first", "b": "second"})
+    cache.put_many("translate", "intro.md", "v1:ur", {"b": "second, rewritten at length", "c": "third"})
+    stats = cache.stats()
+    assert (stats["sections"], stats["stored_bytes"]) == scanned(cache)
+    assert stats["sections"] == 3
+
+    # Counted from the table on startup
+    reopened = TransformCache(path).stats()
+    assert (reopened["sections"], reopened["stored_bytes"]) == (stats["sections"], stats["stored_bytes"])
+
+def test_transform_generates_missing_sections_once(tmp_path, monkeypatch):
+    (tmp_path / "intro.md").write_text("# Intro\n\nHello.\n\n## Setup\n\nInstall ROS 2.\n", encoding="utf-8")
+    transformer = PageTransformer(str(tmp_path), TransformCache())
+    calls = []
+
+    async def rewrite(instructions, texts):
+        calls.append(texts)
+        return [text.upper() for text in texts]
+
+    monkeypatch.setattr(transformer, "_rewrite_batch", rewrite)
+
+    async def scenario():
+        first = await transformer.translate("/docs/intro", "ur")
+        second = await transformer.translate("/docs/intro", "ur")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["generated_sections"] == len(first["sections"]) > 0
+    assert second["generated_sections"] == 0
+    assert second["etag"] == first["etag"]
+    assert len(calls) == 1
+    assert transformer.stats()["sections"] == len(first["sections"])
+
+def test_resolve_accepts_deployed_pathnames(tmp_path):
+    (tmp_path / "module1").mkdir()
+    (tmp_path / "module1" / "index.md").write_text("# Module 1\n", encoding="utf-8")
+    transformer = PageTransformer(str(tmp_path), TransformCache())
+    assert transformer.resolve("/physical_AI_and_humanoid_robotics_textbook/docs/module1/") == "module1/index.md"
+    assert transformer.resolve("/docs/module1") == "module1/index.md"
+    assert transformer.resolve("/physical_AI_and_humanoid_robotics_textbook/docs/missing") is None
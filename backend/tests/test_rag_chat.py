@@ -0,0 +1,28 @@
+from backend import rag_chat
+from backend.prompt_builder import create_prompt_builder
+from backend.rag_chat import RAGChat
+
+CHUNKS = [{"content": "Humanoids balance with a ZMP controller.", "chapter": "module1", "section": "Balance",
+           "source": "docs/module1.md", "score": 0.9}]
+
+class FakeOpenAI:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_completion(self, messages):
+        self.prompts.append(messages)
+        return "answer"
+
+def test_generate_response_accepts_messages_and_the_earlier_arguments(monkeypatch):
+    openai = FakeOpenAI()
+    monkeypatch.setattr(rag_chat, "openai_manager", openai)
+    chat = object.__new__(RAGChat)
+    chat.prompt_builder = create_prompt_builder("gpt-3.5-turbo")
+
+    messages, _ = chat.build_prompt("How do humanoids balance?", CHUNKS)
+    assert chat.generate_response(messages) == "answer"
+    # generate_response(query, context_chunks, conversation_history), as before prompts were built separately
+    history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    assert chat.generate_response("How do humanoids balance?", CHUNKS, history) == "answer"
+    assert openai.prompts[0] == messages
+    assert "ZMP controller" in str(openai.prompts[1]) and "Hello" in str(openai.prompts[1])
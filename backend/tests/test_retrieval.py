@@ -0,0 +1,20 @@
+from backend.retrieval import doc_path_candidates
+
+def test_route_relative_to_the_site_base():
+    assert doc_path_candidates("/docs/module1/") == ["module1.md", "module1/index.md"]
+
+def test_deployed_pathname_with_the_site_base():
+    # window.location.pathname on the deployed site (baseUrl in docusaurus.config.js)
+    path = "/physical_AI_and_humanoid_robotics_textbook/docs/module1-ros2/chapter1"
+    assert doc_path_candidates(path) == ["module1-ros2/chapter1.md", "module1-ros2/chapter1/index.md"]
+    assert doc_path_candidates(f"https://Yamna92.github.io{path}") == doc_path_candidates(path)
+
+def test_pages_outside_the_docs_are_unscoped():
+    assert doc_path_candidates("/physical_AI_and_humanoid_robotics_textbook/") == []
+    assert doc_path_candidates("/physical_AI_and_humanoid_robotics_textbook/blog/post") == []
+    assert doc_path_candidates("/other_site/docs/module1") == []
+
+def test_file_paths_and_custom_bases():
+    assert doc_path_candidates("module1.md", route_base="") == ["module1.md"]
+    assert doc_path_candidates("/book/guide/intro", route_base="/guide", site_base="/book/") == \
+        ["intro.md", "intro/index.md"]
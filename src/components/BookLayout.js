@@ -1,12 +1,75 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import Chatbot from './Chatbot';
+import PersonalizationButton from './PersonalizationButton';
+import TranslationButton from './TranslationButton';
+import TransformedPage from './TransformedPage';
+import useDocPath from '../hooks/useDocPath';
+import { fetchTranslatedPage } from '../services/translationService';
+import { fetchPersonalizedPage } from '../services/personalizationService';
 import './BookLayout.css';
+import './Personalization.css';
 
 const BookLayout = ({ children, selectedText }) => {
+  const docPath = useDocPath();
+  // Only book pages can be translated or personalized by the backend
+  const isDocPage = docPath.startsWith('/docs/');
+  // { page, language } while a translated or personalized version is shown
+  const [transformed, setTransformed] = useState(null);
+  const [isLoading, setIsLoading] = useState(false);
+  const [error, setError] = useState(null);
+
+  // Back to the original page after navigating
+  useEffect(() => {
+    setTransformed(null);
+    setError(null);
+  }, [docPath]);
+
+  const showTransformed = async (load, language) => {
+    setIsLoading(true);
+    setError(null);
+    try {
+      setTransformed({ page: await load(), language });
+    } catch (err) {
+      console.error('Error loading page version:', err);
+      setError('This page could not be loaded right now. Please try again later.');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  const handleTranslate = (language) => {
+    if (language === 'en') {
+      setTransformed(null);
+      return;
+    }
+    showTransformed(() => fetchTranslatedPage(docPath, language), language);
+  };
+
+  const handlePersonalize = (userBackground) => {
+    showTransformed(() => fetchPersonalizedPage(docPath, userBackground), 'en');
+  };
+
   return (
     <div className="book-layout">
       <div className="book-content">
-        {children}
+        {isDocPage && (
+          <div className="page-actions">
+            <PersonalizationButton onPersonalize={handlePersonalize} />
+            <TranslationButton onTranslate={handleTranslate} />
+            {transformed && (
+              <button className="reset-personalization-button" onClick={() => setTransformed(null)}>
+                Show Original
+              </button>
+            )}
+          </div>
+        )}
+        {isLoading && <div className="page-status">Loading…</div>}
+        {error && <div className="page-status page-error">{error}</div>}
+        {transformed ? (
+          <TransformedPage page={transformed.page} language={transformed.language} />
+        ) : (
+          children
+        )}
       </div>
       <div className="chatbot-sidebar">
         <Chatbot selectedText={selectedText} />
@@ -15,4 +78,4 @@ const BookLayout = ({ children, selectedText }) => {
   );
 };
 
-export default BookLayout;
\ No newline at end of file
+export default BookLayout;
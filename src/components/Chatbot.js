@@ -1,11 +1,15 @@
 import React, { useState, useRef, useEffect } from 'react';
+import useDocPath from '../hooks/useDocPath';
 import './Chatbot.css';
 
 const Chatbot = ({ selectedText }) => {
+  const docPath = useDocPath();
   const [messages, setMessages] = useState([]);
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef(null);
+  // The server keeps the conversation history; we only send its ID
+  const conversationIdRef = useRef(null);
 
   // Scroll to bottom of messages
   const scrollToBottom = () => {
@@ -29,12 +33,15 @@ const Chatbot = ({ selectedText }) => {
     try {
       // Prepare the request payload
       const payload = {
-        messages: [...messages, userMessage],
-        selected_text: selectedText || null
+        message: userMessage.content,
+        conversation_id: conversationIdRef.current,
+        selected_text: selectedText || null,
+        // The page being read; the backend searches its chunks first
+        doc_path: docPath
       };
 
-      // Send request to backend
-      const response = await fetch('http://localhost:8000/chat', {
+      // Send request to the streaming endpoint (newline-delimited JSON events)
+      const response = await fetch('http://localhost:8000/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -42,15 +49,46 @@ const Chatbot = ({ selectedText }) => {
         body: JSON.stringify(payload),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
+      conversationIdRef.current = response.headers.get('X-Conversation-Id') || conversationIdRef.current;
 
-      const data = await response.json();
-      
-      // Add bot response to chat
-      const botMessage = { role: 'assistant', content: data.message.content };
-      setMessages(prev => [...prev, botMessage]);
+      // Add an empty bot message and fill it in as deltas arrive
+      setMessages(prev => [...prev, { role: 'assistant', content: '', sources: [] }]);
+      const updateBotMessage = (update) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, ...update(last) }];
+        });
+      };
+
+      const handleEvent = (event) => {
+        if (event.type === 'sources') {
+          updateBotMessage(() => ({ sources: event.sources }));
+        } else if (event.type === 'delta') {
+          updateBotMessage(last => ({ content: last.content + event.content }));
+        } else if (event.type === 'error') {
+          updateBotMessage(() => ({ content: event.message }));
+        }
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+      }
+      if (buffer.trim()) {
+        handleEvent(JSON.parse(buffer));
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMessage = { role: 'assistant', content: 'Sorry, I encountered an error. Please try again.' };
@@ -90,7 +128,7 @@ const Chatbot = ({ selectedText }) => {
             </div>
           ))
         )}
-        {isLoading && (
+        {isLoading && messages[messages.length - 1]?.role !== 'assistant' && (
           <div className="message assistant">
             <div className="message-content">
               <div className="typing-indicator">
@@ -0,0 +1,18 @@
+import React from 'react';
+
+// A book page as returned by the backend's /translate or /personalize:
+// its markdown sections, shown as text in place of the rendered page
+const TransformedPage = ({ page, language }) => {
+  const rtl = language === 'ur';
+  return (
+    <div className="transformed-page" dir={rtl ? 'rtl' : undefined} lang={language}>
+      {page.sections.map((section, index) => (
+        <section key={index} className="transformed-section">
+          {section.content}
+        </section>
+      ))}
+    </div>
+  );
+};
+
+export default TransformedPage;
@@ -0,0 +1,18 @@
+import { useLocation } from '@docusaurus/router';
+import useDocusaurusContext from '@docusaurus/useDocusaurusContext';
+
+/**
+ * Route of the current page relative to the site's baseUrl
+ * (e.g. '/docs/module1'), as the backend expects for doc_path
+ */
+export const useDocPath = () => {
+  const { pathname } = useLocation();
+  const { siteConfig } = useDocusaurusContext();
+  const baseUrl = siteConfig.baseUrl || '/';
+  if (baseUrl !== '/' && pathname.startsWith(baseUrl)) {
+    return `/${pathname.slice(baseUrl.length)}`;
+  }
+  return pathname;
+};
+
+export default useDocPath;
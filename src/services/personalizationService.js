@@ -116,8 +116,29 @@ export const adjustContentDifficulty = (content, userBackground) => {
   return content;
 };
 
+/**
+ * Fetch a whole book page adapted by the backend to the user's background
+ * @param {string} docPath - Route of the page relative to the site's baseUrl (see useDocPath)
+ * @param {Object} userBackground - User's software and hardware background
+ * @returns {Promise<Object>} { doc_path, sections: [{ heading, content }] }
+ *
+ * Pages are generated once per background and cached by the backend.
+ */
+export const fetchPersonalizedPage = async (docPath, userBackground) => {
+  const { softwareBackground, hardwareBackground } = userBackground;
+  const params = new URLSearchParams({ doc_path: docPath });
+  if (softwareBackground) params.set('software_background', softwareBackground);
+  if (hardwareBackground) params.set('hardware_background', hardwareBackground);
+  const response = await fetch(`http://localhost:8000/personalize?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+};
+
 export default {
   personalizeContent,
+  fetchPersonalizedPage,
   getPersonalizedLearningPath,
   adjustContentDifficulty
 };
\ No newline at end of file
@@ -115,8 +115,27 @@ export const translateContent = (content, targetLanguage) => {
   }
 };
 
+/**
+ * Fetch a whole book page translated by the backend
+ * @param {string} docPath - Route of the page relative to the site's baseUrl (see useDocPath)
+ * @param {string} targetLanguage - Target language ('en' or 'ur')
+ * @returns {Promise<Object>} { doc_path, language, sections: [{ heading, content }] }
+ *
+ * The backend translates each page once and caches it; the browser
+ * revalidates with the page's ETag, so repeat views are 304s.
+ */
+export const fetchTranslatedPage = async (docPath, targetLanguage) => {
+  const params = new URLSearchParams({ doc_path: docPath, language: targetLanguage });
+  const response = await fetch(`http://localhost:8000/translate?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+};
+
 export default {
   translateToUrdu,
   translateToEnglish,
-  translateContent
+  translateContent,
+  fetchTranslatedPage
 };
\ No newline at end of file